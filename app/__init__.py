@@ -1,7 +1,19 @@
 from flask import Flask
 from flask_cors import CORS 
-import os
 from . import database 
+from . import auth
+from . import password_services
+from . import ocr_queue
+from . import storage_services
+from . import reporting_services
+from . import fx_services
+from . import search_services
+from . import sync_services
+from . import event_services
+from . import compression_services
+from . import asset_services
+from . import metrics_services
+from . import profiling_services
 
 def create_app():
     app = Flask(__name__)
@@ -9,20 +21,39 @@ def create_app():
     
     app.config.from_object('config.Config') 
 
-    project_root = os.path.dirname(app.root_path) 
-    upload_dir_path = os.path.join(project_root, app.config['UPLOAD_FOLDER'])
-    
-    if not os.path.exists(upload_dir_path):
-        os.makedirs(upload_dir_path)
+    # Nothing in here talks to MongoDB or the filesystem: the Mongo client is
+    # created on first use, upload directories when the first receipt is stored,
+    # frontend assets on the first page request, and indexes / demo users by
+    # `flask init-db` and `flask seed`. A (pre-forked) worker can therefore come
+    # up without waiting on the database.
+    # See benchmarks/startup.py.
 
     database.init_app(app) 
+    auth.init_app(app)
+    password_services.init_app(app)
+    ocr_queue.init_app(app)
+    storage_services.init_app(app)
+    reporting_services.init_app(app)
+    fx_services.init_app(app)
+    search_services.init_app(app)
+    sync_services.init_app(app)
+    event_services.init_app(app)
+    compression_services.init_app(app)
+    asset_services.init_app(app)
+    metrics_services.init_app(app)
+    profiling_services.init_app(app)
 
     with app.app_context():
         # Import and register Blueprints
         from . import routes 
         app.register_blueprint(routes.bp) 
 
-        from . import models 
-        models.create_dummy_users() # Added/Uncommented to call the function
+        # Opt-in convenience for local development only.
+        if app.config.get('ENSURE_INDEXES_ON_STARTUP'):
+            from .indexes import ensure_indexes
+            ensure_indexes(database.get_db())
+        if app.config.get('SEED_ON_STARTUP'):
+            from . import models
+            models.create_dummy_users()
 
     return app
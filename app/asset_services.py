@@ -0,0 +1,142 @@
+# app/asset_services.py
+# Frontend files (frontend_web/) served from memory.
+# On first use every HTML and JS file is read once and precompressed (gzip,
+# plus brotli if installed). Each script also gets a content-hashed URL,
+# js/<name>.<hash>.js, and the HTML pages are rewritten to load scripts by
+# those URLs. A hashed URL names fixed bytes, so it is served with
+# 'Cache-Control: immutable' and browsers never ask for it again; a deploy that
+# changes a script changes its URL. The pages themselves keep their URLs and
+# are revalidated with their ETag on every load (a 304 costs no body).
+# Serving an asset is a dict lookup: no path joins, stat() or file reads per request.
+import hashlib
+import os
+import re
+import threading
+
+from flask import current_app, request, Response, abort
+
+from .compression_services import available_encodings, compress, negotiate_encoding
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MIMETYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+}
+# src="js/<name>.js" in the pages
+_SCRIPT_SRC_RE = re.compile(r'(src=["\'])(js/[\w.-]+\.js)(["\'])')
+
+
+class Asset:
+    """One servable file: its bytes, precompressed variants and caching policy."""
+
+    def __init__(self, body, mimetype, immutable=False, encodings=(), level=6):
+        self.body = body
+        self.mimetype = mimetype
+        self.immutable = immutable
+        self.etag = hashlib.sha256(body).hexdigest()[:20]
+        self.encoded = {}
+        for encoding in encodings:
+            data = compress(body, encoding, level)
+            if len(data) < len(body): # Tiny files can grow when compressed
+                self.encoded[encoding] = data
+
+
+class AssetBundle:
+    """All frontend assets, keyed by URL path relative to the site root."""
+
+    def __init__(self, root, encodings=None, level=6):
+        self.root = root
+        self.encodings = available_encodings() if encodings is None else list(encodings)
+        self.level = level
+        self.assets = {}
+        self.hashed_urls = {} # 'js/login.js' -> 'js/login.<hash>.js'
+        self._build()
+
+    def _read(self, relative_path):
+        with open(os.path.join(self.root, relative_path), 'rb') as f:
+            return f.read()
+
+    def _add(self, url, body, immutable=False):
+        mimetype = MIMETYPES.get(os.path.splitext(url)[1], 'application/octet-stream')
+        self.assets[url] = Asset(body, mimetype, immutable=immutable, encodings=self.encodings, level=self.level)
+
+    def _build(self):
+        js_dir = os.path.join(self.root, 'js')
+        for name in sorted(os.listdir(js_dir)) if os.path.isdir(js_dir) else []:
+            if not name.endswith('.js'):
+                continue
+            url = f"js/{name}"
+            body = self._read(url)
+            digest = hashlib.sha256(body).hexdigest()[:10]
+            hashed_url = f"js/{name[:-3]}.{digest}.js"
+            self.hashed_urls[url] = hashed_url
+            self._add(hashed_url, body, immutable=True)
+            # The plain URL keeps working for bookmarks and old pages, but must be revalidated
+            self._add(url, body)
+
+        for name in sorted(os.listdir(self.root)):
+            if not name.endswith('.html'):
+                continue
+            html = self._read(name).decode('utf-8')
+            html = _SCRIPT_SRC_RE.sub(
+                lambda m: m.group(1) + self.hashed_urls.get(m.group(2), m.group(2)) + m.group(3), html)
+            self._add(name, html.encode('utf-8'))
+
+    def get(self, url):
+        return self.assets.get(url)
+
+
+def get_asset_bundle():
+    """The app's bundle, built on first use (not in create_app(), to keep cold starts cheap)."""
+    state = current_app.extensions['assets']
+    bundle = state['bundle']
+    if bundle is None:
+        with state['lock']:
+            if state['bundle'] is None:
+                state['bundle'] = AssetBundle(state['root'], level=state['level'])
+            bundle = state['bundle']
+    return bundle
+
+
+def reload_assets():
+    """Drops the built bundle; the next request rebuilds it from disk."""
+    current_app.extensions['assets']['bundle'] = None
+
+
+def serve_asset(url):
+    """Response for the asset at `url`, honouring Accept-Encoding and If-None-Match."""
+    if current_app.extensions['assets']['auto_reload']:
+        reload_assets() # Development: pick up edits on every request
+    asset = get_asset_bundle().get(url)
+    if asset is None:
+        abort(404)
+
+    encoding = negotiate_encoding(request.accept_encodings, list(asset.encoded))
+    body = asset.encoded[encoding] if encoding else asset.body
+    etag = f"{asset.etag}-{encoding}" if encoding else asset.etag
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    if asset.immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def init_app(app):
+    app.extensions['assets'] = {
+        'root': os.path.join(os.path.dirname(app.root_path), 'frontend_web'),
+        'level': app.config.get('STATIC_COMPRESSION_LEVEL', 9),
+        'auto_reload': app.config.get('STATIC_ASSETS_AUTO_RELOAD', False),
+        'bundle': None,
+        'lock': threading.Lock(),
+    }
@@ -0,0 +1,150 @@
+# app/auth.py
+# Shared authentication for the API routes.
+# Resolves "Authorization: Bearer <token>" -> session -> user through two
+# in-process caches so a protected request normally costs no Mongo round trips.
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, g, has_app_context, jsonify, request
+
+from .database import get_db
+from .utils import TTLCache
+
+# Error message used when a user lacks the role a route requires.
+FORBIDDEN_MESSAGES = {
+    'admin': "Forbidden: Admin access required",
+    'employee': "Unauthorized or not an employee",
+}
+
+
+class AuthError(Exception):
+    def __init__(self, message, status_code=401):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class AuthCache:
+    """
+    Holds the token -> session and username -> user caches for one app.
+    Sessions are cached no longer than their own expires_at. Entries are also
+    bounded by AUTH_CACHE_TTL_SECONDS so that changes made by other worker
+    processes (which cannot invalidate this process' cache) are picked up.
+    """
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.sessions = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.users = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    def stats(self):
+        return {'sessions': self.sessions.stats(), 'users': self.users.stats()}
+
+
+def _get_cache():
+    return current_app.extensions['auth_cache']
+
+
+def get_token_from_request(allow_query_token=False):
+    token = request.headers.get('Authorization')
+    if not token and allow_query_token:
+        # EventSource cannot send headers, so streams pass ?token= instead.
+        # Only enabled per route: URLs end up in access logs.
+        token = request.args.get('token')
+    if not token:
+        raise AuthError("Missing token")
+    token = token.replace("Bearer ", "")
+    if not token:
+        raise AuthError("Invalid token format")
+    return token
+
+
+def _load_session(token):
+    cache = _get_cache()
+    session = cache.sessions.get(token)
+    if session is None:
+        session_doc = get_db().sessions.find_one({'_id': token})
+        if not session_doc:
+            raise AuthError("Invalid or expired token")
+        session = {
+            'username': session_doc.get('username'),
+            'expires_at': session_doc.get('expires_at'),
+        }
+        ttl = None
+        if session['expires_at']:
+            ttl = (session['expires_at'] - datetime.utcnow()).total_seconds()
+        cache.sessions.set(token, session, ttl_seconds=ttl)
+
+    # The TTL index on sessions.expires_at deletes expired sessions, but the TTL
+    # monitor only runs periodically, so expiry is still checked here.
+    if session['expires_at'] and session['expires_at'] < datetime.utcnow():
+        invalidate_session(token)
+        raise AuthError("Session expired. Please login again.")
+    if not session['username']:
+        raise AuthError("Session is invalid (no username)")
+    return session
+
+
+def _load_user(username):
+    from .models import User # Local import: models imports this module for invalidation
+
+    cache = _get_cache()
+    user = cache.users.get(username)
+    if user is None:
+        user = User.get_by_username(username)
+        if not user:
+            raise AuthError("User associated with session not found", 404)
+        cache.users.set(username, user)
+    return user
+
+
+def authenticate_request(allow_query_token=False):
+    """Returns the User for the request's bearer token, or raises AuthError."""
+    token = get_token_from_request(allow_query_token)
+    session = _load_session(token)
+    user = _load_user(session['username'])
+    g.auth_token = token
+    g.current_user = user
+    return user
+
+
+def login_required(role=None, allow_query_token=False):
+    """
+    Route decorator: authenticates the request and, if `role` is given, requires
+    the user to have that role. The user is available as g.current_user.
+    With allow_query_token the token may also come from ?token=.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            try:
+                user = authenticate_request(allow_query_token)
+            except AuthError as e:
+                return jsonify({"error": e.message}), e.status_code
+            if role and user.role != role:
+                return jsonify({"error": FORBIDDEN_MESSAGES.get(role, "Forbidden")}), 403
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def invalidate_session(token):
+    """Drops a cached session, e.g. on logout."""
+    if has_app_context() and 'auth_cache' in current_app.extensions:
+        _get_cache().sessions.pop(token)
+
+
+def invalidate_user(username):
+    """Drops a cached user, e.g. after its role or password changed."""
+    if has_app_context() and 'auth_cache' in current_app.extensions:
+        _get_cache().users.pop(username)
+
+
+def get_auth_cache_stats():
+    return _get_cache().stats()
+
+
+def init_app(app):
+    app.extensions['auth_cache'] = AuthCache(
+        max_entries=app.config.get('AUTH_CACHE_MAX_ENTRIES', 10000),
+        ttl_seconds=app.config.get('AUTH_CACHE_TTL_SECONDS', 60),
+    )
@@ -0,0 +1,112 @@
+# app/compression_services.py
+# Content-negotiated compression of API responses.
+# JSON responses are gzip- or brotli-encoded when the client accepts it
+# (brotli only with the optional 'brotli' package installed). Buffered
+# responses are compressed from COMPRESSION_MIN_SIZE bytes up; smaller bodies
+# gain nothing but CPU time. Streamed listings (see routes.stream_expense_page)
+# are always compressed, chunk by chunk as they are produced, so they keep
+# their flat memory profile.
+# Static frontend files are not compressed here: app/asset_services.py
+# compresses them once, ahead of time.
+import gzip
+import zlib
+
+try:
+    import brotli # Optional dependency, enables Content-Encoding: br
+except ImportError:
+    brotli = None
+
+from flask import current_app, request
+
+COMPRESSIBLE_MIMETYPES = {'application/json'}
+
+
+def available_encodings():
+    """Encodings this process can produce, most preferred first."""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def negotiate_encoding(accept_encodings, offered=None):
+    """The best of `offered` (default: available_encodings()) the client accepts, or None."""
+    return accept_encodings.best_match(offered if offered is not None else available_encodings())
+
+
+def compress(data, encoding, level=6):
+    if encoding == 'br':
+        # Brotli quality runs 0-11; scale the shared gzip-style level (1-9) onto it.
+        return brotli.compress(data, quality=min(11, round(level * 11 / 9)))
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    raise ValueError(f"Unsupported encoding '{encoding}'")
+
+
+def compress_stream(chunks, encoding, level=6):
+    """
+    Compresses an iterable of str/bytes chunks on the fly. Each chunk is
+    flushed as it is produced, so the client keeps receiving the listing
+    incrementally instead of only once the compressor's window fills up.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=min(11, round(level * 11 / 9)))
+        sync = compressor.flush
+        finish = compressor.finish
+        process = compressor.process
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # gzip container
+        sync = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+        process = compressor.compress
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if chunk:
+            yield process(chunk) + sync()
+    yield finish()
+
+
+def etag_variants(etag):
+    """
+    A compressed body is a different representation from the identity one, so
+    it gets its own strong ETag ('<etag>-gzip', '<etag>-br'). Conditional
+    requests may send back any of them.
+    """
+    return [etag] + [f"{etag}-{encoding}" for encoding in ('gzip', 'br')]
+
+
+def compress_response(response):
+    """after_request hook: compresses JSON responses the client accepts compressed."""
+    config = current_app.extensions['compression']
+    if not config['enabled'] or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    if response.status_code < 200 or response.status_code in (204, 304) or response.direct_passthrough:
+        return response
+    if 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, config['level'])
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['min_size']:
+            return response
+        response.set_data(compress(data, encoding, config['level']))
+    response.headers['Content-Encoding'] = encoding
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
+def init_app(app):
+    app.extensions['compression'] = {
+        'enabled': app.config.get('COMPRESSION_ENABLED', True),
+        'min_size': app.config.get('COMPRESSION_MIN_SIZE', 1024),
+        'level': app.config.get('COMPRESSION_LEVEL', 6),
+    }
+    app.after_request(compress_response)
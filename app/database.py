@@ -1,30 +1,148 @@
-from pymongo import MongoClient
-from flask import current_app, g # g is for application context global
+import os
+import threading
+import click
+from pymongo import MongoClient, monitoring
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .metrics_services import command_timing_listener
+
+# One MongoClient per worker process.
+# MongoClient owns a thread-safe connection pool, so every request in a process
+# can share it. Creating one per app context (the old approach) paid for a new
+# pool, server selection and handshake on every request.
+#
+# MongoClient is NOT fork-safe: a client created in a pre-fork master must not be
+# used by the forked workers. We therefore create the client lazily on first use
+# and remember the pid that created it. A worker that inherits a client from its
+# parent simply drops the reference and builds its own.
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Keeps running counts of the connection pool state so the pool can be sized.
+    'checked_out' is the number of connections currently lent to application threads,
+    'waiting' is the number of threads blocked waiting for a free connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.open_connections = 0
+            self.checked_out = 0
+            self.waiting = 0
+            self.max_waiting = 0
+            self.check_out_failures = 0
+            self.pools_cleared = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'open_connections': self.open_connections,
+                'checked_out': self.checked_out,
+                'waiting': self.waiting,
+                'max_waiting': self.max_waiting,
+                'check_out_failures': self.check_out_failures,
+                'pools_cleared': self.pools_cleared,
+            }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections = max(0, self.open_connections - 1)
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting = max(0, self.waiting - 1)
+            self.check_out_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting = max(0, self.waiting - 1)
+            self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+
+pool_stats_listener = PoolStatsListener()
+
+
+def _client_options(config):
+    """Builds MongoClient keyword arguments from the app config."""
+    options = {
+        'serverSelectionTimeoutMS': config.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000),
+        'maxPoolSize': config.get('MONGO_MAX_POOL_SIZE', 100),
+        'minPoolSize': config.get('MONGO_MIN_POOL_SIZE', 0),
+        'event_listeners': [pool_stats_listener],
+    }
+    if config.get('METRICS_ENABLED', True):
+        # Per-command latency for /metrics (see app/metrics_services.py)
+        options['event_listeners'].append(command_timing_listener)
+    # None means "no limit" for these two, so only pass them when configured.
+    if config.get('MONGO_MAX_IDLE_TIME_MS') is not None:
+        options['maxIdleTimeMS'] = config['MONGO_MAX_IDLE_TIME_MS']
+    if config.get('MONGO_WAIT_QUEUE_TIMEOUT_MS') is not None:
+        options['waitQueueTimeoutMS'] = config['MONGO_WAIT_QUEUE_TIMEOUT_MS']
+    return options
 
-# It's generally better to initialize the client once.
-# However, if using Flask's app context, you might initialize it
-# when the app is created or on first request.
-# For simplicity here, we'll define a function that can be called.
-# A more advanced setup might involve app factory pattern more deeply.
 
 def get_mongo_client():
     """
-    Returns an instance of MongoClient.
-    Uses Flask's application context 'g' to store and reuse the client
-    within the same context if already connected.
-    """
-    if 'mongo_client' not in g:
-        try:
-            mongo_uri = current_app.config['MONGODB_URI']
-            # Add serverSelectionTimeoutMS to handle connection issues faster
-            g.mongo_client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
-            # You can test the connection here if needed, e.g., by calling client.admin.command('ping')
-            # g.mongo_client.admin.command('ping') # Optional: Test connection
-            current_app.logger.info("MongoDB client initialized.")
-        except Exception as e:
-            current_app.logger.error(f"Failed to connect to MongoDB: {e}")
-            raise # Re-raise the exception if connection fails
-    return g.mongo_client
+    Returns the MongoClient shared by every request in this process.
+    The client is created on first use, after any fork, with the pool settings
+    from config.Config.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            # A client inherited from a parent process is dropped, not closed:
+            # closing it would tear down sockets the parent still owns.
+            try:
+                mongo_uri = current_app.config['MONGODB_URI']
+                _client = MongoClient(mongo_uri, **_client_options(current_app.config))
+                _client_pid = pid
+                current_app.logger.info(f"MongoDB client initialized for process {pid}.")
+            except Exception as e:
+                current_app.logger.error(f"Failed to connect to MongoDB: {e}")
+                raise # Re-raise the exception if connection fails
+    return _client
 
 def get_db():
     """
@@ -38,20 +156,64 @@ def get_db():
         current_app.logger.error(f"Failed to get database '{current_app.config.get('DATABASE_NAME')}': {e}")
         raise
 
-# Optional: Add a function to close the client when the app context tears down
-def close_mongo_client(e=None):
-    mongo_client = g.pop('mongo_client', None)
-    if mongo_client is not None:
-        mongo_client.close()
-        current_app.logger.info("MongoDB client closed.")
+def get_pool_stats():
+    """Returns the current connection pool counters for this process."""
+    stats = pool_stats_listener.snapshot()
+    stats['pid'] = os.getpid()
+    stats['client_initialized'] = _client is not None and _client_pid == os.getpid()
+    return stats
+
+def reinit_mongo_client():
+    """
+    Forgets the process-wide client without closing it.
+    Pre-fork servers should call this in the worker after fork (e.g. gunicorn's
+    post_fork hook) so the next get_db() builds a fresh pool in the worker.
+    os.register_at_fork below does the same automatically where available.
+    """
+    global _client, _client_pid
+    _client = None
+    _client_pid = None
+    pool_stats_listener.reset()
+
+def close_mongo_client():
+    """Closes the process-wide client, e.g. on shutdown or between tests."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+    pool_stats_listener.reset()
+
+def _after_fork_in_child():
+    global _client_lock
+    # The parent may have been holding the lock at fork time.
+    _client_lock = threading.Lock()
+    pool_stats_listener._lock = threading.Lock()
+    reinit_mongo_client()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create or update the MongoDB indexes declared in app/indexes.py."""
+    from .indexes import ensure_indexes
+    for collection_name, index_name, action in ensure_indexes(get_db()):
+        click.echo(f"{collection_name}.{index_name}: {action}")
+
+@click.command('seed')
+@with_appcontext
+def seed_command():
+    """Create the demo users (emp1 / admin1) if they do not exist yet."""
+    from .models import create_dummy_users
+    create_dummy_users()
+    click.echo("Seeded demo users.")
 
 # Function to be called from app factory in __init__.py
 def init_app(app):
-    app.teardown_appcontext(close_mongo_client)
-    # You could also initialize a global client here if not using 'g'
-    # For example:
-    # global_mongo_client = MongoClient(app.config['MONGODB_URI'])
-    # global_db = global_mongo_client[app.config['DATABASE_NAME']]
-    # Then other modules import global_db from this file.
-    # Using 'g' is generally cleaner for request contexts.
-    pass # 'g' based approach doesn't need explicit init here other than teardown registration
+    # Nothing to tear down per request any more: the client lives for the life
+    # of the worker process and is created lazily by get_mongo_client().
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(seed_command)
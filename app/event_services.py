@@ -0,0 +1,250 @@
+# app/event_services.py
+# Live expense events for the admin dashboard (Server-Sent Events).
+# Expense writes publish small events to an in-process EventBus, and every
+# open GET /api/admin/expenses/events stream reads from its own bounded queue,
+# so watching dashboards cost nothing until something changes and then receive
+# one small message instead of refetching the whole list.
+# EVENTS_SOURCE selects who publishes:
+#   'local'         - the models publish after each write (default). Each worker
+#                     process only sees its own writes, so this suits a single
+#                     process or sticky routing.
+#   'change_stream' - a background thread tails a MongoDB change stream on
+#                     'expenses' (needs a replica set), so every worker sees
+#                     every write; the models' own publishes are then skipped.
+# A client that falls too far behind is disconnected and, reconnecting with
+# Last-Event-ID, is replayed the events it missed from a short history (or
+# told to reload if they are no longer there).
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+from flask import current_app, has_app_context
+
+EXPENSE_CREATED = 'expense.created' # data: {'expense': <expense document>}
+EXPENSE_UPDATED = 'expense.updated' # data: {'expense': <expense document>}
+EXPENSE_STATUS = 'expense.status'   # data: {'ids': [...], 'status': ...}
+EXPENSE_DELETED = 'expense.deleted' # data: {'ids': [...]}
+EXPENSES_IMPORTED = 'expenses.imported' # data: {'count': n}; too many rows to send one by one
+RESET = 'reset' # Missed events are gone from the history: reload the list
+
+# Expense fields carried by created/updated events: what the admin list shows
+EVENT_EXPENSE_FIELDS = ('user_id', 'amount', 'currency', 'date', 'vendor', 'description', 'status')
+# Stamped by every write (see sync_services); says nothing about what changed
+BOOKKEEPING_FIELDS = {'updated_at'}
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def get(self, timeout):
+        """The next event, or None after `timeout` seconds without one."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """
+    Thread-safe publish/subscribe with a bounded history for replay.
+    Event ids are '<bus id>-<sequence>'; the bus id changes with every process,
+    so an id from before a restart is recognised as unknown.
+    """
+
+    def __init__(self, history_size=1000, queue_size=100):
+        self.bus_id = uuid.uuid4().hex[:8]
+        self.queue_size = queue_size
+        self._history = deque(maxlen=history_size)
+        self._sequence = itertools.count(1)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.published = 0
+        self.disconnected = 0
+
+    def publish(self, event_type, data):
+        with self._lock:
+            event = (f"{self.bus_id}-{next(self._sequence)}", event_type, data)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # Never block a write on a slow client: cut it off instead
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+        return event[0]
+
+    def subscribe(self, last_event_id=None):
+        """
+        Returns (subscription, backlog). With `last_event_id`, backlog holds
+        the events published since then, or a single RESET event if some of
+        them are no longer in the history.
+        """
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+            backlog = self._events_after(last_event_id) if last_event_id else []
+        return subscription, backlog
+
+    def _events_after(self, last_event_id):
+        bus_id, _, sequence = last_event_id.rpartition('-')
+        if bus_id == self.bus_id and sequence.isdigit():
+            sequence = int(sequence)
+            oldest = int(self._history[0][0].rpartition('-')[2]) if self._history else sequence + 1
+            if oldest <= sequence + 1:
+                return [event for event in self._history if int(event[0].rpartition('-')[2]) > sequence]
+        return [(None, RESET, {})]
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.discard(subscription)
+                if subscription.overflowed:
+                    self.disconnected += 1
+
+    def stats(self):
+        with self._lock:
+            return {'subscribers': len(self._subscribers), 'published': self.published,
+                    'history': len(self._history), 'disconnected_slow_clients': self.disconnected}
+
+
+def format_sse(event_id, event_type, data):
+    """One Server-Sent Events message."""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def get_event_bus():
+    return current_app.extensions['events']['bus']
+
+
+# --- Publishing from the write paths (EVENTS_SOURCE = 'local') ---
+
+def _local_bus():
+    if not has_app_context():
+        return None
+    state = current_app.extensions.get('events')
+    if state is None or state['source'] != 'local':
+        return None
+    return state['bus']
+
+
+def expense_event_document(expense_id, doc):
+    return dict({field: doc.get(field) for field in EVENT_EXPENSE_FIELDS}, _id=expense_id)
+
+
+def publish_expense_created(expense_id, doc):
+    bus = _local_bus()
+    if bus is not None:
+        bus.publish(EXPENSE_CREATED, {'expense': expense_event_document(expense_id, doc)})
+
+
+def publish_expense_updated(expense_id, doc):
+    bus = _local_bus()
+    if bus is not None:
+        bus.publish(EXPENSE_UPDATED, {'expense': expense_event_document(expense_id, doc)})
+
+
+def publish_status_changed(expense_ids, status):
+    bus = _local_bus()
+    if bus is not None and expense_ids:
+        bus.publish(EXPENSE_STATUS, {'ids': [str(expense_id) for expense_id in expense_ids], 'status': status})
+
+
+def publish_expenses_deleted(expense_ids):
+    bus = _local_bus()
+    if bus is not None and expense_ids:
+        bus.publish(EXPENSE_DELETED, {'ids': [str(expense_id) for expense_id in expense_ids]})
+
+
+def publish_expenses_imported(count):
+    bus = _local_bus()
+    if bus is not None and count:
+        bus.publish(EXPENSES_IMPORTED, {'count': count})
+
+
+# --- MongoDB change stream source (EVENTS_SOURCE = 'change_stream') ---
+
+def event_from_change(change):
+    """Translates one change stream document into (event_type, data), or None to skip it."""
+    operation = change.get('operationType')
+    expense_id = change.get('documentKey', {}).get('_id')
+    if operation == 'delete':
+        return EXPENSE_DELETED, {'ids': [str(expense_id)]}
+    if operation == 'insert':
+        return EXPENSE_CREATED, {'expense': expense_event_document(expense_id, change['fullDocument'])}
+    if operation in ('update', 'replace'):
+        updated = change.get('updateDescription', {}).get('updatedFields', {})
+        if operation == 'update' and set(updated) - BOOKKEEPING_FIELDS == {'status'}:
+            return EXPENSE_STATUS, {'ids': [str(expense_id)], 'status': updated['status']}
+        if operation == 'replace' or set(updated) & set(EVENT_EXPENSE_FIELDS):
+            if change.get('fullDocument'):
+                return EXPENSE_UPDATED, {'expense': expense_event_document(expense_id, change['fullDocument'])}
+    return None
+
+
+class ChangeStreamPublisher:
+    """
+    Daemon thread that publishes the expenses change stream to a bus. It
+    resumes from the last seen token after errors and starts on the first
+    stream subscription, not in create_app(), so startup stays free of Mongo.
+    """
+
+    def __init__(self, app, bus, retry_seconds=5):
+        self.app = app
+        self.bus = bus
+        self.retry_seconds = retry_seconds
+        self.resume_token = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='expense-change-stream', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        from .database import get_db
+        pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}]
+        while True:
+            try:
+                with self.app.app_context():
+                    with get_db().expenses.watch(pipeline, full_document='updateLookup',
+                                                 resume_after=self.resume_token) as stream:
+                        for change in stream:
+                            self.resume_token = stream.resume_token
+                            event = event_from_change(change)
+                            if event is not None:
+                                self.bus.publish(*event)
+            except Exception as e:
+                logger.warning(f"Expense change stream failed ({e}); retrying in {self.retry_seconds}s")
+                time.sleep(self.retry_seconds)
+
+
+def init_app(app):
+    source = app.config.get('EVENTS_SOURCE', 'local')
+    if source not in ('local', 'change_stream'):
+        raise ValueError(f"Unknown EVENTS_SOURCE '{source}'. Use 'local' or 'change_stream'.")
+    bus = EventBus(history_size=app.config.get('EVENTS_HISTORY_SIZE', 1000),
+                   queue_size=app.config.get('EVENTS_SUBSCRIBER_QUEUE_SIZE', 100))
+    app.extensions['events'] = {
+        'source': source,
+        'bus': bus,
+        'change_stream': ChangeStreamPublisher(app, bus) if source == 'change_stream' else None,
+    }
@@ -0,0 +1,175 @@
+# app/fx_services.py
+# Currency conversion for totals across currencies.
+# Rates are dated and expressed as "units of FX_BASE_CURRENCY per one unit of
+# <currency>". They come from the CSV file named by FX_RATES_FILE
+# (columns: date,currency,rate) or, if no file is configured, from the
+# 'fx_rates' collection ({currency, date, rate}); `flask load-fx-rates <csv>`
+# fills the collection. The whole table is held in memory as NumPy arrays and
+# reloaded after FX_CACHE_TTL_SECONDS.
+#
+# Conversion is vectorized: amounts, currencies and dates are passed as arrays,
+# each currency's rates are looked up with one np.searchsorted call, and the
+# result is aggregated with NumPy, so totals over large result sets do not run
+# a Python loop per expense.
+# NumPy is imported where it is used, so app start-up does not pay for it.
+import csv
+import threading
+import time
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .database import get_db
+
+FX_COLLECTION = 'fx_rates'
+
+
+class FxRateTable:
+    """
+    Dated FX rates for a set of currencies. The rate for a date is the most
+    recent rate on or before that date; dates before a currency's first rate
+    (and unknown currencies) have no rate and convert to NaN.
+    """
+
+    def __init__(self, base_currency='USD', rates=()):
+        import numpy as np
+        self.base_currency = base_currency
+        grouped = {}
+        for currency, rate_date, rate in rates:
+            grouped.setdefault(currency.upper(), []).append((np.datetime64(rate_date, 'D'), float(rate)))
+        # currency -> (sorted dates as datetime64[D], rates as float64)
+        self._series = {}
+        for currency, points in grouped.items():
+            points.sort(key=lambda point: point[0])
+            self._series[currency] = (np.array([d for d, _ in points], dtype='datetime64[D]'),
+                                      np.array([r for _, r in points], dtype=np.float64))
+
+    @property
+    def currencies(self):
+        return sorted(set(self._series) | {self.base_currency})
+
+    def rates_to_base(self, currency, dates):
+        """Rates (base units per unit of `currency`) for each date in `dates` (datetime64[D] array)."""
+        import numpy as np
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        currency = (currency or '').upper()
+        if currency == self.base_currency:
+            return np.ones(dates.shape, dtype=np.float64)
+        series = self._series.get(currency)
+        if series is None:
+            return np.full(dates.shape, np.nan)
+        rate_dates, rates = series
+        positions = np.searchsorted(rate_dates, dates, side='right') - 1
+        result = rates[np.clip(positions, 0, None)]
+        return np.where(positions >= 0, result, np.nan)
+
+    def convert(self, amounts, currencies, dates, to_currency):
+        """
+        Converts each amount from its currency to `to_currency` using the rates
+        in effect on its date. Returns a float64 array with NaN where no rate is known.
+        """
+        import numpy as np
+        amounts = np.asarray(amounts, dtype=np.float64)
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        codes, inverse = np.unique(np.char.upper(np.asarray(currencies, dtype=str)), return_inverse=True)
+        to_base = np.empty(amounts.shape, dtype=np.float64)
+        # One vectorized lookup per distinct currency (a handful), not per amount
+        for index, currency in enumerate(codes):
+            mask = inverse == index
+            to_base[mask] = self.rates_to_base(str(currency), dates[mask])
+        target_rates = self.rates_to_base(to_currency, dates)
+        return amounts * to_base / target_rates
+
+    def total(self, amounts, currencies, dates, to_currency):
+        """Returns (total in to_currency, number of amounts that could not be converted)."""
+        import numpy as np
+        converted = self.convert(amounts, currencies, dates, to_currency)
+        missing = int(np.isnan(converted).sum())
+        return float(np.nansum(converted)), missing
+
+
+def read_rates_file(path):
+    """Reads (currency, date, rate) tuples from a CSV with columns date,currency,rate."""
+    with open(path, newline='') as f:
+        return [(row['currency'].strip(), datetime.strptime(row['date'].strip(), '%Y-%m-%d'), float(row['rate']))
+                for row in csv.DictReader(f)]
+
+
+def _load_rate_table(config):
+    path = config.get('FX_RATES_FILE')
+    if path:
+        rates = read_rates_file(path)
+    else:
+        rates = [(doc['currency'], doc['date'], doc['rate'])
+                 for doc in get_db()[FX_COLLECTION].find({}, {'_id': 0, 'currency': 1, 'date': 1, 'rate': 1})]
+    return FxRateTable(config.get('FX_BASE_CURRENCY', 'USD'), rates)
+
+
+_fx_lock = threading.Lock()
+
+
+def get_fx_table():
+    """Returns the cached FxRateTable, (re)loading it when missing or older than FX_CACHE_TTL_SECONDS."""
+    cached = current_app.extensions.get('fx_rates')
+    ttl = current_app.config.get('FX_CACHE_TTL_SECONDS', 3600)
+    if cached is not None and time.monotonic() - cached[1] < ttl:
+        return cached[0]
+    with _fx_lock:
+        # Another request may have reloaded it while this one waited for the lock
+        cached = current_app.extensions.get('fx_rates')
+        if cached is not None and time.monotonic() - cached[1] < ttl:
+            return cached[0]
+        table = _load_rate_table(current_app.config)
+        current_app.extensions['fx_rates'] = (table, time.monotonic())
+    return table
+
+
+def invalidate_fx_rates():
+    current_app.extensions.pop('fx_rates', None)
+
+
+def validate_currency(value):
+    """Upper-cased currency code. Raises ValueError if no rates are known for it."""
+    currency = (value or '').strip().upper()
+    if currency not in get_fx_table().currencies:
+        raise ValueError(f"No FX rates available for currency '{value}'")
+    return currency
+
+
+def totals_from_cursor(docs, to_currency):
+    """
+    Totals the 'amount' of expense documents (with currency and date) in `to_currency`.
+    The cursor is drained into flat arrays once; conversion and summing are vectorized.
+    Returns {'total', 'count', 'unconverted_count'}.
+    """
+    import numpy as np
+    amounts, currencies, dates = [], [], []
+    for doc in docs:
+        amounts.append(doc.get('amount') or 0.0)
+        currencies.append(doc.get('currency') or '')
+        dates.append(doc['date'].date())
+    if not amounts:
+        return {'total': 0.0, 'count': 0, 'unconverted_count': 0}
+    total, missing = get_fx_table().total(amounts, currencies, np.array(dates, dtype='datetime64[D]'), to_currency)
+    return {'total': round(total, 2), 'count': len(amounts), 'unconverted_count': missing}
+
+
+@click.command('load-fx-rates')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def load_fx_rates_command(path):
+    """Load dated FX rates from a CSV file (date,currency,rate) into the fx_rates collection."""
+    collection = get_db()[FX_COLLECTION]
+    count = 0
+    for currency, rate_date, rate in read_rates_file(path):
+        collection.update_one({'currency': currency.upper(), 'date': rate_date},
+                              {'$set': {'rate': rate}}, upsert=True)
+        count += 1
+    invalidate_fx_rates()
+    click.echo(f"Loaded {count} FX rate(s).")
+
+
+def init_app(app):
+    app.cli.add_command(load_fx_rates_command)
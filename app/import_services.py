@@ -0,0 +1,241 @@
+# app/import_services.py
+# Bulk expense import (POST /expenses/import).
+# Rows arrive as NDJSON or CSV and are validated one at a time while the upload
+# is read, so memory use does not grow with the file. Valid rows are written
+# with unordered insert_many batches; a bad row is reported and skipped instead
+# of aborting the import.
+import csv
+import json
+import zipfile
+
+from pymongo.errors import BulkWriteError
+
+from .database import get_db
+from .models import Expense, User
+from .reporting_services import record_inserted
+from .version_services import bump_versions
+from .search_services import record_vendor_uses
+from .event_services import publish_expenses_imported
+from .storage_services import ingest_receipt, delete_file_from_cloud
+
+IMPORT_FORMATS = ('ndjson', 'csv')
+REQUIRED_FIELDS = ('amount', 'date', 'vendor')
+TEXT_FIELDS = ('vendor', 'description', 'currency') # NDJSON rows may carry any JSON type here
+
+
+class ImportFormatError(ValueError):
+    """The import as a whole cannot be processed (unknown format, bad receipts archive)."""
+
+
+def detect_format(filename=None, mimetype=None, requested=None):
+    """Picks 'ndjson' or 'csv' from an explicit ?format=, the file extension or the content type."""
+    if requested:
+        requested = requested.lower()
+        if requested not in IMPORT_FORMATS:
+            raise ImportFormatError(f"Unsupported import format '{requested}'. Use 'ndjson' or 'csv'.")
+        return requested
+    name = (filename or '').lower()
+    mimetype = (mimetype or '').lower()
+    if name.endswith('.csv') or mimetype in ('text/csv', 'application/csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')) or mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    raise ImportFormatError("Could not tell the import format. Upload a .csv or .ndjson file or pass ?format=.")
+
+
+def _iter_text_lines(stream):
+    """Decodes a binary stream line by line (UTF-8, optional BOM)."""
+    first = True
+    for raw in stream:
+        line = raw.decode('utf-8-sig' if first else 'utf-8')
+        first = False
+        yield line
+
+
+def iter_rows(stream, fmt):
+    """
+    Yields (row_number, row) for each record in the upload; row_number is 1-based
+    and counts data rows only. Rows that cannot be parsed are yielded as
+    (row_number, ValueError) so the caller can report them and carry on.
+    """
+    lines = _iter_text_lines(stream)
+    if fmt == 'csv':
+        for row_number, row in enumerate(csv.DictReader(lines), start=1):
+            yield row_number, row
+        return
+
+    row_number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield row_number, ValueError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield row_number, ValueError("Each line must be a JSON object")
+            continue
+        yield row_number, row
+
+
+class ExpenseImporter:
+    """
+    Validates rows and writes them in batches.
+    `importer` is the logged in user. Employees may only import their own
+    expenses; admins must name the owner of each row in a 'user_id' column.
+    `receipts` is an optional zipfile.ZipFile; a row's 'receipt' column names
+    the file inside it to attach.
+    """
+
+    def __init__(self, importer, receipts=None, batch_size=1000, max_errors=1000):
+        self.importer = importer
+        self.receipts = receipts
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.received = 0
+        self.inserted = 0
+        self.error_count = 0
+        self.errors = []
+        self._batch = [] # (row_number, document)
+        self._known_users = {}
+        self._collection = get_db().expenses
+
+    def _add_error(self, row_number, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row_number, 'error': message})
+
+    def _owner_for(self, row):
+        requested = str(row.get('user_id') or '').strip()
+        if self.importer.role != 'admin':
+            if requested and requested != self.importer.username:
+                raise ValueError("Employees can only import their own expenses")
+            return self.importer.username
+        if not requested:
+            raise ValueError("Missing user_id")
+        # Admin imports usually cover a handful of users; look each one up once.
+        if requested not in self._known_users:
+            self._known_users[requested] = User.get_by_username(requested) is not None
+        if not self._known_users[requested]:
+            raise ValueError(f"Unknown user '{requested}'")
+        return requested
+
+    def _attach_receipt(self, expense, receipt_name):
+        if self.receipts is None:
+            raise ValueError("Row names a receipt but no receipts archive was uploaded")
+        try:
+            member = self.receipts.getinfo(receipt_name)
+        except KeyError:
+            raise ValueError(f"Receipt '{receipt_name}' not found in archive")
+        with self.receipts.open(member) as receipt_stream:
+            stored = ingest_receipt(receipt_stream, receipt_name, expense.user_id)
+        expense.receipt_cloud_path = stored['cloud_path']
+        expense.receipt_key = stored['key']
+        expense.receipt_sha256 = stored['sha256']
+        expense.receipt_size = stored['size']
+
+    def build_expense(self, row):
+        """Validates one row with the same rules as POST /expenses. Raises ValueError."""
+        missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+        if missing:
+            raise ValueError(f"Missing required field(s): {', '.join(missing)}")
+        for field in TEXT_FIELDS:
+            if row.get(field) is not None and not isinstance(row[field], str):
+                raise ValueError(f"Field '{field}' must be a string")
+        try:
+            amount = Expense.parse_amount(row['amount'])
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid amount '{row['amount']}'")
+        return Expense(
+            user_id=self._owner_for(row),
+            amount=amount,
+            currency=row.get('currency') or 'USD',
+            date_str=str(row['date']),
+            vendor=row['vendor'],
+            description=row.get('description') or '',
+            receipt_cloud_path=None,
+        )
+
+    def add(self, row_number, row):
+        self.received += 1
+        if isinstance(row, Exception):
+            self._add_error(row_number, str(row))
+            return
+        expense = None
+        try:
+            expense = self.build_expense(row)
+            if row.get('receipt'):
+                self._attach_receipt(expense, row['receipt'])
+            document = expense.to_document()
+        except ValueError as e:
+            if expense is not None and expense.receipt_cloud_path:
+                delete_file_from_cloud(expense.receipt_cloud_path) # The row will not be stored
+            self._add_error(row_number, str(e))
+            return
+        self._batch.append((row_number, document))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        failed_indexes = set()
+        try:
+            result = self._collection.insert_many([doc for _, doc in batch], ordered=False)
+            self.inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Unordered: every document except the failed ones was written.
+            details = e.details
+            self.inserted += details.get('nInserted', 0)
+            for write_error in details.get('writeErrors', []):
+                failed_indexes.add(write_error['index'])
+                row_number, doc = batch[write_error['index']]
+                self._add_error(row_number, write_error.get('errmsg', 'Write failed'))
+                # The row was not stored, so release the receipt reference it took.
+                if doc.get('receipt_cloud_path'):
+                    delete_file_from_cloud(doc['receipt_cloud_path'])
+        inserted = [doc for index, (_, doc) in enumerate(batch) if index not in failed_indexes]
+        record_inserted(inserted)
+        record_vendor_uses((doc['user_id'], doc['vendor']) for doc in inserted)
+        if inserted:
+            bump_versions([doc['user_id'] for doc in inserted])
+
+    def run(self, rows):
+        try:
+            for row_number, row in rows:
+                self.add(row_number, row)
+        except UnicodeDecodeError:
+            # Nothing after this point can be read. Rows before it are kept and
+            # the summary says where the import stopped.
+            self.received += 1
+            self._add_error(self.received, "Not UTF-8 encoded; this row and the rest of the file were not imported")
+        self.flush()
+        # One event for the whole import; dashboards reload instead of receiving every row
+        publish_expenses_imported(self.inserted)
+        return self.summary()
+
+    def summary(self):
+        return {
+            'received': self.received,
+            'inserted': self.inserted,
+            'failed': self.error_count,
+            'errors': self.errors,
+            'errors_truncated': self.error_count > len(self.errors),
+        }
+
+
+def open_receipts_archive(file_storage):
+    """Opens an uploaded zip of receipts. Raises ImportFormatError if it is not a zip file."""
+    try:
+        return zipfile.ZipFile(file_storage.stream)
+    except zipfile.BadZipFile:
+        raise ImportFormatError("The receipts upload is not a valid zip archive")
+
+
+def import_expenses(importer, stream, fmt, receipts=None, batch_size=1000, max_errors=1000):
+    """Imports every row of `stream` (NDJSON or CSV). Returns the import summary."""
+    job = ExpenseImporter(importer, receipts=receipts, batch_size=batch_size, max_errors=max_errors)
+    return job.run(iter_rows(stream, fmt))
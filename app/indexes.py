@@ -0,0 +1,176 @@
+# app/indexes.py
+# Declares the MongoDB indexes the app's queries rely on and creates them idempotently.
+# Run with `flask init-db` (or at startup with ENSURE_INDEXES_ON_STARTUP).
+import logging
+import time
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+from flask import current_app
+
+# Deleted expenses are reported to syncing clients for this long (app/sync_services.py)
+TOMBSTONE_RETENTION_SECONDS = 30 * 24 * 3600
+
+# Keyed by collection name. Every expense listing sorts by (date desc, _id desc),
+# so each listing index ends with those two keys and can serve the sort directly.
+INDEXES = {
+    'expenses': [
+        # Admin listing: Expense.find_page_documents() with no filter
+        IndexModel([('date', DESCENDING), ('_id', DESCENDING)], name='date_-1__id_-1'),
+        # Employee listing: Expense.find_page_documents({'user_id': ...})
+        IndexModel([('user_id', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)], name='user_id_1_date_-1__id_-1'),
+        # Admin queue filtered by status
+        IndexModel([('status', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)], name='status_1_date_-1__id_-1'),
+        # Employee listing filtered by status ("my pending expenses")
+        IndexModel([('user_id', ASCENDING), ('status', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)],
+                   name='user_id_1_status_1_date_-1__id_-1'),
+        # Listings filtered by vendor or currency
+        IndexModel([('vendor', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)], name='vendor_1_date_-1__id_-1'),
+        IndexModel([('currency', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)], name='currency_1_date_-1__id_-1'),
+        # Search: multikey over word prefixes (see app/search_services.py)
+        IndexModel([('search_tokens', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)],
+                   name='search_tokens_1_date_-1__id_-1'),
+        # Employee search: bounded to the user's own expenses before the token
+        IndexModel([('user_id', ASCENDING), ('search_tokens', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)],
+                   name='user_id_1_search_tokens_1_date_-1__id_-1'),
+        # Delta sync: one user's expenses in change order (GET /expenses/changes)
+        IndexModel([('user_id', ASCENDING), ('updated_at', ASCENDING), ('_id', ASCENDING)],
+                   name='user_id_1_updated_at_1__id_1'),
+    ],
+    'expense_tombstones': [
+        IndexModel([('user_id', ASCENDING), ('updated_at', ASCENDING), ('_id', ASCENDING)],
+                   name='user_id_1_updated_at_1__id_1'),
+        # TTL: tombstones older than any accepted sync token are deleted by MongoDB
+        IndexModel([('updated_at', ASCENDING)], name='updated_at_ttl', expireAfterSeconds=TOMBSTONE_RETENTION_SECONDS),
+    ],
+    'vendor_suggestions': [
+        IndexModel([('user_id', ASCENDING), ('key', ASCENDING)], name='user_id_1_key_1', unique=True),
+        # Autocomplete: one prefix, most used first, straight from the index
+        IndexModel([('user_id', ASCENDING), ('prefixes', ASCENDING), ('count', DESCENDING), ('key', ASCENDING)],
+                   name='user_id_1_prefixes_1_count_-1_key_1'),
+    ],
+    'expense_rollups': [
+        # One document per bucket (see app/reporting_services.py); reports match on a month range.
+        IndexModel([('month', ASCENDING), ('user_id', ASCENDING), ('currency', ASCENDING), ('status', ASCENDING)],
+                   name='month_1_user_id_1_currency_1_status_1', unique=True),
+    ],
+    'sessions': [
+        # TTL index: MongoDB's TTL monitor deletes a session once expires_at has passed,
+        # so expired sessions no longer need a delete in the request path.
+        IndexModel([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0),
+    ],
+}
+
+# Which expenses index serves a filtered listing (see listing_index_for), most
+# selective first. An index qualifies when the query pins every one of its
+# equality fields; its (date, _id) suffix then serves the sort and any date
+# range, and the remaining filters (other equality fields, amount range) are
+# checked on the documents it yields. Every filter combination thus walks an
+# index in order: no collection scan and no in-memory sort.
+LISTING_INDEX_PREFERENCE = [
+    (('user_id', 'search_tokens'), 'user_id_1_search_tokens_1_date_-1__id_-1'),
+    (('user_id', 'status'), 'user_id_1_status_1_date_-1__id_-1'),
+    # Collection-wide search (admins); a search pinned to one user uses the index above
+    (('search_tokens',), 'search_tokens_1_date_-1__id_-1'),
+    (('vendor',), 'vendor_1_date_-1__id_-1'),
+    (('user_id',), 'user_id_1_date_-1__id_-1'),
+    (('status',), 'status_1_date_-1__id_-1'),
+    (('currency',), 'currency_1_date_-1__id_-1'),
+    ((), 'date_-1__id_-1'),
+]
+
+
+def _pinned_fields(query):
+    # Fields matched by equality, $in (an $in on an index prefix still gives sorted
+    # runs the server merges) or $all (the index is bounded on one of its values)
+    return {field for field, value in query.items()
+            if not field.startswith('$') and (not isinstance(value, dict) or set(value) in ({'$in'}, {'$all'}))}
+
+
+def listing_index_for(query):
+    """Name of the expenses index to hint for a listing query sorted by (date desc, _id desc)."""
+    pinned = _pinned_fields(query)
+    for fields, name in LISTING_INDEX_PREFERENCE:
+        if pinned.issuperset(fields):
+            return name
+
+
+# A missing index is looked for again after this long (it may have been built meanwhile)
+INDEX_RECHECK_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+
+def available_hint(collection, index_name):
+    """
+    Returns `index_name` if that index exists on `collection`, else None.
+    A hint naming a missing index fails the whole query, and indexes are only
+    built by `flask init-db`, so queries on a database that has not been
+    initialised yet run unhinted (and slower) instead of failing.
+    Known indexes are remembered per app; missing ones are checked again
+    every INDEX_RECHECK_SECONDS.
+    """
+    known = current_app.extensions.setdefault('index_hints', {}) # (collection, index) -> True or time of last miss
+    key = (collection.full_name, index_name)
+    entry = known.get(key)
+    if entry is True:
+        return index_name
+    now = time.monotonic()
+    if entry is not None and now - entry < INDEX_RECHECK_SECONDS:
+        return None
+    try:
+        present = index_name in collection.index_information()
+    except PyMongoError:
+        present = False
+    if present:
+        known[key] = True
+        return index_name
+    known[key] = now
+    logger.warning(f"Index {index_name} is missing on {collection.full_name}; querying without it. Run `flask init-db`.")
+    return None
+
+
+# Options that make two indexes with the same keys different.
+_COMPARED_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression')
+
+
+def _same_index(existing, wanted):
+    if list(existing['key']) != list(wanted['key'].items()):
+        return False
+    return all(existing.get(opt) == wanted.get(opt) for opt in _COMPARED_OPTIONS)
+
+
+def ensure_indexes(db, indexes=None):
+    """
+    Creates any missing declared index and replaces declared indexes whose
+    definition changed. Safe to run repeatedly.
+    Returns a list of (collection, index name, action) tuples, action being
+    'created', 'replaced' or 'unchanged'.
+    """
+    indexes = INDEXES if indexes is None else indexes
+    summary = []
+    for collection_name, models in indexes.items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        for model in models:
+            wanted = model.document
+            name = wanted['name']
+            wanted_keys = list(wanted['key'].items())
+            # An index on the same keys under another name, or this name with other
+            # keys/options, would make create_indexes fail, so drop it first.
+            stale = [
+                existing_name for existing_name, info in existing.items()
+                if existing_name != '_id_'
+                and (existing_name == name or list(info['key']) == wanted_keys)
+                and not (existing_name == name and _same_index(info, wanted))
+            ]
+            if name in existing and not stale:
+                summary.append((collection_name, name, 'unchanged'))
+                continue
+            for stale_name in stale:
+                collection.drop_index(stale_name)
+            collection.create_indexes([model])
+            summary.append((collection_name, name, 'replaced' if stale else 'created'))
+            if stale:
+                current_app.logger.warning(f"Replaced index(es) {stale} on '{collection_name}' with '{name}'.")
+    return summary
@@ -0,0 +1,232 @@
+# app/metrics_services.py
+# Prometheus-style metrics (GET /metrics, text exposition format 0.0.4).
+# Collected all the time, so recording is kept cheap: a metric is a dict of
+# label values -> fixed bucket counts behind one lock, an observation is a
+# bisect and a few additions, and nothing is formatted until a scrape.
+# What is measured:
+#   http_request_duration_seconds / http_requests_total - every request, by
+#       method and route template (not the raw path, so ids do not explode the
+#       label space). Streamed responses are timed to their headers.
+#   mongodb_command_duration_seconds - every command the driver runs, through
+#       a pymongo CommandListener registered on the client (app/database.py).
+#   receipt_storage_duration_seconds - receipt ingest and release.
+#   ocr_duration_seconds - each OCR run, queued or scanned.
+# plus the OCR queue gauge at scrape time, and the connection pool gauges when
+# the scrape is authenticated with METRICS_TOKEN.
+# Metrics live in the worker process that recorded them; with several workers
+# scrape each one (or run one process per target).
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from flask import current_app, g, request
+from pymongo import monitoring
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+UNMATCHED_ROUTE = '<unmatched>' # 404s share one series instead of one per probed path
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        with self._lock:
+            return self._values.get(labelvalues, 0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values)
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram; buckets are upper bounds in seconds."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value) # First bucket with bound >= value
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labelvalues):
+        """Context manager / decorator observing the wrapped block's duration."""
+        return _Timer(self, labelvalues)
+
+    def count(self, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            return series[2] if series else 0
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self._started, *self.labelvalues)
+
+    def __call__(self, fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.histogram.time(*self.labelvalues):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Request latency by route.',
+                            ('method', 'route'))
+REQUESTS_TOTAL = Counter('http_requests_total', 'Requests by route and status code.',
+                         ('method', 'route', 'status'))
+MONGO_COMMAND_SECONDS = Histogram('mongodb_command_duration_seconds', 'MongoDB command latency.',
+                                  ('command', 'outcome'), buckets=MONGO_BUCKETS)
+STORAGE_SECONDS = Histogram('receipt_storage_duration_seconds', 'Receipt storage operation latency.',
+                            ('operation',))
+OCR_SECONDS = Histogram('ocr_duration_seconds', 'Receipt OCR run time.', ('source', 'outcome'))
+
+METRICS = (REQUEST_SECONDS, REQUESTS_TOTAL, MONGO_COMMAND_SECONDS, STORAGE_SECONDS, OCR_SECONDS)
+
+
+def reset_metrics():
+    for metric in METRICS:
+        metric.reset()
+
+
+class CommandTimingListener(monitoring.CommandListener):
+    """Times every MongoDB command; the driver already measures duration_micros."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name, 'succeeded')
+
+    def failed(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name, 'failed')
+
+
+command_timing_listener = CommandTimingListener()
+
+
+# --- Request timing ---
+
+def _start_request_timer():
+    g._metrics_started = time.perf_counter()
+
+
+def _record_request(response):
+    started = g.pop('_metrics_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else UNMATCHED_ROUTE
+        REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route)
+        REQUESTS_TOTAL.inc(request.method, route, str(response.status_code))
+    return response
+
+
+# --- Exposition ---
+
+def _gauge(name, documentation, value):
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+
+
+def _gauge_lines(include_pool):
+    lines = []
+    if include_pool:
+        from .database import get_pool_stats
+        pool = get_pool_stats()
+        lines += _gauge('mongodb_pool_connections_open', 'Open MongoDB connections.', pool['open_connections'])
+        lines += _gauge('mongodb_pool_connections_checked_out', 'MongoDB connections lent to threads.', pool['checked_out'])
+        lines += _gauge('mongodb_pool_waiting_threads', 'Threads waiting for a MongoDB connection.', pool['waiting'])
+    ocr_queue = current_app.extensions.get('ocr_queue')
+    if ocr_queue is not None:
+        lines += _gauge('ocr_queue_depth', 'OCR jobs queued or running.', ocr_queue.stats()['queue_depth'])
+    return lines
+
+
+def render_metrics(include_pool=True):
+    """
+    The exposition text. The connection pool gauges are only included for
+    authenticated scrapes (include_pool), like the pool counters of /health/db.
+    """
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += _gauge_lines(include_pool)
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app):
+    app.extensions['metrics'] = {'enabled': app.config.get('METRICS_ENABLED', True)}
+    if app.extensions['metrics']['enabled']:
+        app.before_request(_start_request_timer)
+        app.after_request(_record_request)
@@ -1,8 +1,16 @@
-import uuid # Still used for default Expense ID if not loading from DB initially
-from werkzeug.security import generate_password_hash, check_password_hash
+import base64
+from .password_services import hash_password, verify_password, password_needs_rehash, HashingBusyError
 from .database import get_db # For MongoDB access
-from datetime import datetime, date # Ensure datetime is imported
+from datetime import datetime, date, timedelta # Ensure datetime is imported
 from bson.objectid import ObjectId # For MongoDB ObjectIDs
+from pymongo import ReturnDocument
+from flask import current_app
+from . import reporting_services # Spend rollups kept in step with every expense write
+from .version_services import bump_versions # Listing ETags (see app/version_services.py)
+from .indexes import listing_index_for, available_hint
+from .search_services import search_tokens, record_vendor_uses # Search index kept current on every write
+from . import event_services # Live dashboard events (see app/event_services.py)
+from .sync_services import record_tombstone
 
 # User, Employee, Admin classes and create_dummy_users function
 # These are preserved as they are already MongoDB-enabled.
@@ -15,7 +23,7 @@ class User:
         else:
             if not password: # Ensure password is not None or empty before hashing
                 raise ValueError("Password cannot be empty.")
-            self.password_hash = generate_password_hash(password)
+            self.password_hash = hash_password(password) # Runs on the bounded hashing pool
         self.role = role
 
     def save(self):
@@ -26,11 +34,28 @@ class User:
             'role': self.role
         }
         users_collection.update_one({'_id': self.username}, {'$set': user_doc}, upsert=True)
+        # Role or password may have changed; make sure no stale copy is served from the auth cache.
+        from .auth import invalidate_user
+        invalidate_user(self.username)
 
     def check_password(self, password):
+        """
+        Verifies the password. After a successful check, a hash made with an
+        older method or work factor (see PASSWORD_HASH_METHOD/ITERATIONS) is
+        replaced and saved, so stored hashes are upgraded as users log in.
+        """
         if not password or not self.password_hash:
             return False
-        return check_password_hash(self.password_hash, password)
+        if not verify_password(self.password_hash, password):
+            return False
+        if password_needs_rehash(self.password_hash):
+            try:
+                new_hash = hash_password(password)
+            except HashingBusyError:
+                return True # The password is correct; upgrade the hash on a later login
+            self.password_hash = new_hash
+            self.save()
+        return True
 
     @classmethod
     def get_by_username(cls, username):
@@ -65,40 +90,61 @@ def create_dummy_users():
 
 # Expense class (to replace existing one in app/models.py)
 class Expense:
+    STATUSES = ("pending", "approved", "rejected")
+
     def __init__(self, user_id, amount, currency, date_str, vendor, description, 
-                 receipt_cloud_path, status="pending", created_at=None, _id=None):
+                 receipt_cloud_path, status="pending", created_at=None, _id=None,
+                 ocr_status=None, ocr_data=None, receipt_sha256=None, receipt_size=None, receipt_key=None):
         # If _id is provided, it's from DB (ObjectId)
         # Otherwise, when creating new, _id will be set by MongoDB on insert
         self._id = ObjectId(_id) if _id else None 
         
         self.user_id = user_id # Should reference User's _id (which is username)
-        self.amount = float(amount)
+        self.amount = self.parse_amount(amount)
         self.currency = currency
-        
+        self.date = self.parse_date(date_str)
+
+        self.vendor = vendor
+        self.description = description
+        self.receipt_cloud_path = receipt_cloud_path
+        self.receipt_key = receipt_key # Content-addressed storage key (see storage_services)
+        self.receipt_sha256 = receipt_sha256 # Content hash and size computed while the upload was stored
+        self.receipt_size = receipt_size
+        self.status = status
+        self.created_at = created_at if created_at else datetime.utcnow()
+        # Receipt OCR runs in the background (app/ocr_queue.py) and fills these in later.
+        self.ocr_status = ocr_status
+        self.ocr_data = ocr_data
+
+    @staticmethod
+    def parse_amount(value):
+        """Amount as a float. Raises TypeError or ValueError if it is not a number."""
+        return float(value)
+
+    @staticmethod
+    def parse_date(value):
+        """
+        Accepts a datetime, a date, or a YYYY-MM-DD / ISO datetime string.
+        Raises ValueError for anything else.
+        """
         try:
             # Attempt to parse date_str, assuming YYYY-MM-DD or datetime object
-            if isinstance(date_str, datetime):
-                self.date = date_str
-            elif isinstance(date_str, date):
-                self.date = datetime.combine(date_str, datetime.min.time())
+            if isinstance(value, datetime):
+                return value
+            elif isinstance(value, date):
+                return datetime.combine(value, datetime.min.time())
             else: # Assuming string
-                self.date = datetime.fromisoformat(date_str.replace('Z', '+00:00')) # Handle ISO format, ensure UTC if Z present
+                return datetime.fromisoformat(value.replace('Z', '+00:00')) # Handle ISO format, ensure UTC if Z present
         except ValueError:
             # Fallback for simple YYYY-MM-DD if fromisoformat fails directly due to no T part
             try:
-                self.date = datetime.strptime(date_str, '%Y-%m-%d')
+                return datetime.strptime(value, '%Y-%m-%d')
             except ValueError:
                 raise ValueError("Invalid date format for Expense. Use YYYY-MM-DD or ISO datetime string.")
 
-        self.vendor = vendor
-        self.description = description
-        self.receipt_cloud_path = receipt_cloud_path
-        self.status = status
-        self.created_at = created_at if created_at else datetime.utcnow()
-
-    def save(self):
-        expenses_collection = get_db().expenses
-        expense_doc = {
+    def to_document(self):
+        """The MongoDB document for this expense, without _id."""
+        return {
             'user_id': self.user_id,
             'amount': self.amount,
             'currency': self.currency,
@@ -106,14 +152,38 @@ class Expense:
             'vendor': self.vendor,
             'description': self.description,
             'receipt_cloud_path': self.receipt_cloud_path,
+            'receipt_key': self.receipt_key,
+            'receipt_sha256': self.receipt_sha256,
+            'receipt_size': self.receipt_size,
             'status': self.status,
-            'created_at': self.created_at
+            'created_at': self.created_at,
+            'updated_at': datetime.utcnow(), # Stamped on every write; drives delta sync (see sync_services)
+            'ocr_status': self.ocr_status,
+            'ocr_data': self.ocr_data,
+            'search_tokens': search_tokens(self.vendor, self.description)
         }
+
+    def save(self):
+        expenses_collection = get_db().expenses
+        expense_doc = self.to_document()
         if self._id: # If expense has an _id, it's an update
-            expenses_collection.update_one({'_id': self._id}, {'$set': expense_doc})
+            previous = expenses_collection.find_one_and_update(
+                {'_id': self._id}, {'$set': expense_doc},
+                projection=dict(reporting_services.ROLLUP_PROJECTION, vendor=1), return_document=ReturnDocument.BEFORE
+            )
+            if previous:
+                reporting_services.record_updated(previous, expense_doc)
+                if (previous.get('user_id'), previous.get('vendor')) != (self.user_id, self.vendor):
+                    record_vendor_uses([(self.user_id, self.vendor)])
+                bump_versions([previous.get('user_id'), self.user_id])
+                event_services.publish_expense_updated(self._id, expense_doc)
         else: # New expense, insert it
             result = expenses_collection.insert_one(expense_doc)
             self._id = result.inserted_id # Set the _id from MongoDB
+            reporting_services.record_inserted([expense_doc])
+            record_vendor_uses([(self.user_id, self.vendor)])
+            bump_versions([self.user_id])
+            event_services.publish_expense_created(self._id, expense_doc)
 
     @classmethod
     def from_document(cls, doc):
@@ -129,8 +199,13 @@ class Expense:
             vendor=doc.get('vendor'),
             description=doc.get('description'),
             receipt_cloud_path=doc.get('receipt_cloud_path'),
+            receipt_key=doc.get('receipt_key'),
+            receipt_sha256=doc.get('receipt_sha256'),
+            receipt_size=doc.get('receipt_size'),
             status=doc.get('status'),
-            created_at=doc.get('created_at')
+            created_at=doc.get('created_at'),
+            ocr_status=doc.get('ocr_status'),
+            ocr_data=doc.get('ocr_data')
         )
 
     @classmethod
@@ -143,20 +218,99 @@ class Expense:
         expense_doc = expenses_collection.find_one({'_id': obj_id})
         return cls.from_document(expense_doc)
 
-    @classmethod
-    def get_by_user_id(cls, user_id):
-        expenses_collection = get_db().expenses
-        # Sort by date descending, most recent first
-        expense_docs = expenses_collection.find({'user_id': user_id}).sort('date', -1) 
-        return [cls.from_document(doc) for doc in expense_docs]
+    # Fields each listing endpoint actually reads. Passing these as the Mongo
+    # projection keeps unused fields off the wire and out of memory.
+    EMPLOYEE_LIST_PROJECTION = {
+        'user_id': 1, 'amount': 1, 'currency': 1, 'date': 1, 'vendor': 1,
+        'description': 1, 'receipt_cloud_path': 1, 'status': 1, 'created_at': 1,
+        'ocr_status': 1,
+    }
+    ADMIN_LIST_PROJECTION = {
+        'user_id': 1, 'amount': 1, 'currency': 1, 'date': 1, 'vendor': 1,
+        'description': 1, 'status': 1,
+    }
+
+    # --- Keyset pagination ---
+    # Listings are ordered by (date desc, _id desc). A page is fetched with an
+    # index-friendly range query that starts right after the last row of the
+    # previous page, so each page costs the same no matter how deep it is.
+    # The continuation token is opaque to clients.
+
+    @staticmethod
+    def encode_cursor(doc):
+        raw = f"{doc['date'].isoformat()}|{doc['_id']}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(token):
+        """Returns (date, ObjectId) from a continuation token. Raises ValueError if malformed."""
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            date_part, id_part = base64.urlsafe_b64decode(padded.encode()).decode().split('|', 1)
+            return datetime.fromisoformat(date_part), ObjectId(id_part)
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    # --- Listing filters ---
+    # `filters` are the validated listing query parameters (see
+    # routes.parse_listing_filters): status (a list), user_id, vendor, currency,
+    # from / to (datetimes, `to` inclusive), min_amount / max_amount and q
+    # (search terms from search_services.search_terms).
+
+    @staticmethod
+    def listing_query(filters):
+        """Mongo query for listing filters, shaped to hit the indexes in LISTING_INDEX_PREFERENCE."""
+        query = {}
+        for field in ('user_id', 'vendor', 'currency'):
+            if filters.get(field):
+                query[field] = filters[field]
+        terms = filters.get('q')
+        if terms:
+            query['search_tokens'] = terms[0] if len(terms) == 1 else {'$all': list(terms)}
+        statuses = filters.get('status')
+        if statuses:
+            query['status'] = statuses[0] if len(statuses) == 1 else {'$in': list(statuses)}
+        date_range = {}
+        if filters.get('from'):
+            date_range['$gte'] = filters['from']
+        if filters.get('to'):
+            date_range['$lt'] = filters['to'] + timedelta(days=1)
+        if date_range:
+            query['date'] = date_range
+        amount_range = {}
+        if filters.get('min_amount') is not None:
+            amount_range['$gte'] = filters['min_amount']
+        if filters.get('max_amount') is not None:
+            amount_range['$lte'] = filters['max_amount']
+        if amount_range:
+            query['amount'] = amount_range
+        return query
 
     @classmethod
-    def get_all(cls):
-        """Fetches all expenses from the database, sorted by date descending."""
+    def find_page_documents(cls, query=None, limit=50, cursor=None, batch_size=None, projection=None):
+        """
+        Returns a lazy Mongo cursor over the raw documents of one page, newest first.
+        It yields up to limit + 1 documents: the extra one only signals that
+        another page exists and is not part of this page.
+        The query is pinned to the index listing_index_for() picks for it, so
+        the planner cannot fall back to a collection scan or an in-memory sort
+        (unless that index has not been created yet, see available_hint()).
+        """
+        query = dict(query or {})
+        index_name = listing_index_for(query)
+        if cursor:
+            last_date, last_id = cls.decode_cursor(cursor)
+            query['$or'] = [
+                {'date': {'$lt': last_date}},
+                {'date': last_date, '_id': {'$lt': last_id}},
+            ]
         expenses_collection = get_db().expenses
-        # Sort by date descending, most recent first
-        all_expense_docs = expenses_collection.find({}).sort('date', -1)
-        return [cls.from_document(doc) for doc in all_expense_docs]
+        docs = expenses_collection.find(query, projection).sort([('date', -1), ('_id', -1)]).limit(limit + 1)
+        if available_hint(expenses_collection, index_name):
+            docs = docs.hint(index_name)
+        if batch_size:
+            docs = docs.batch_size(batch_size)
+        return docs
 
     @classmethod
     def update_status(cls, expense_id_str, new_status):
@@ -175,14 +329,117 @@ class Expense:
             return False
 
         expenses_collection = get_db().expenses
-        result = expenses_collection.update_one(
+        # Read the previous state in the same round trip so the rollups can be moved.
+        previous = expenses_collection.find_one_and_update(
             {'_id': obj_id},
-            {'$set': {'status': new_status}}
+            {'$set': {'status': new_status, 'updated_at': datetime.utcnow()}},
+            projection=reporting_services.ROLLUP_PROJECTION, return_document=ReturnDocument.BEFORE
+        )
+        if previous is None:
+            return False
+        reporting_services.record_updated(previous, dict(previous, status=new_status))
+        bump_versions([previous.get('user_id')])
+        event_services.publish_status_changed([obj_id], new_status)
+        return True
+
+    @classmethod
+    def update_status_many(cls, expense_id_strs, new_status):
+        """
+        Sets the status of many expenses with one update_many per previous status.
+        Returns a dict with the IDs that 'matched' an expense, those that were
+        'not_found', and those that are not valid ObjectIds ('invalid').
+        Raises ValueError for an unknown status.
+        Each update only matches expenses still in the status they were read
+        with, so an expense whose status another request changed in between is
+        left alone and the rollup deltas cover exactly what was written. If a
+        concurrent change cannot be told apart from ours (it set the same
+        status), a warning is logged; `flask rebuild-rollups` reconciles.
+        """
+        if new_status not in ["approved", "rejected", "pending"]:
+            raise ValueError(f"Invalid status '{new_status}'")
+
+        requested = {}
+        invalid = []
+        for expense_id_str in dict.fromkeys(expense_id_strs): # de-duplicate, keep order
+            try:
+                requested[ObjectId(expense_id_str)] = expense_id_str
+            except Exception: # Handles invalid ObjectId format
+                invalid.append(expense_id_str)
+
+        expenses_collection = get_db().expenses
+        previous = list(expenses_collection.find({'_id': {'$in': list(requested)}}, reporting_services.ROLLUP_PROJECTION))
+        existing = {doc['_id'] for doc in previous}
+        if existing:
+            by_status = {}
+            for doc in previous:
+                by_status.setdefault(doc.get('status'), []).append(doc)
+            now = datetime.utcnow()
+            changed = []
+            for old_status, docs in by_status.items():
+                if old_status == new_status:
+                    continue # Nothing to write
+                ids = [doc['_id'] for doc in docs]
+                result = expenses_collection.update_many(
+                    {'_id': {'$in': ids}, 'status': old_status},
+                    {'$set': {'status': new_status, 'updated_at': now}}
+                )
+                if result.matched_count < len(docs):
+                    # Some changed status meanwhile: only those now in new_status can be ours
+                    now_new = {doc['_id'] for doc in expenses_collection.find(
+                        {'_id': {'$in': ids}, 'status': new_status}, {'_id': 1})}
+                    docs = [doc for doc in docs if doc['_id'] in now_new]
+                    if len(docs) != result.matched_count:
+                        current_app.logger.warning(
+                            "Concurrent status changes during a bulk update; run `flask rebuild-rollups` to reconcile")
+                changed.extend(docs)
+            reporting_services.apply_changes(removed=changed, added=[dict(doc, status=new_status) for doc in changed])
+            bump_versions([doc.get('user_id') for doc in previous])
+            unchanged = by_status.get(new_status, [])
+            event_services.publish_status_changed([doc['_id'] for doc in unchanged + changed], new_status)
+        return {
+            'matched': [id_str for obj_id, id_str in requested.items() if obj_id in existing],
+            'not_found': [id_str for obj_id, id_str in requested.items() if obj_id not in existing],
+            'invalid': invalid,
+        }
+
+    @classmethod
+    def delete(cls, expense_id_str):
+        """
+        Deletes an expense and leaves a tombstone so syncing clients learn about it.
+        Returns the deleted document, or None if there was no such expense.
+        """
+        try:
+            obj_id = ObjectId(expense_id_str)
+        except Exception: # Invalid ObjectId format
+            return None
+        deleted = get_db().expenses.find_one_and_delete({'_id': obj_id})
+        if deleted is None:
+            return None
+        record_tombstone(obj_id, deleted.get('user_id'), datetime.utcnow())
+        reporting_services.apply_changes(removed=[deleted])
+        if deleted.get('receipt_cloud_path'):
+            from .storage_services import delete_file_from_cloud
+            delete_file_from_cloud(deleted['receipt_cloud_path']) # Releases this expense's reference
+        bump_versions([deleted.get('user_id')])
+        event_services.publish_expenses_deleted([obj_id])
+        return deleted
+
+    @classmethod
+    def set_ocr_result(cls, expense_id, ocr_status, ocr_data):
+        """Stores the outcome of a background OCR job on the expense."""
+        expenses_collection = get_db().expenses
+        previous = expenses_collection.find_one_and_update(
+            {'_id': ObjectId(expense_id)},
+            {'$set': {'ocr_status': ocr_status, 'ocr_data': ocr_data, 'updated_at': datetime.utcnow()}},
+            projection={'user_id': 1}
         )
-        return result.matched_count > 0
+        if previous is None:
+            return False
+        bump_versions([previous.get('user_id')]) # ocr_status is part of the employee listing
+        return True
 
     def get_receipt_url(self):
         from .storage_services import get_file_url_from_cloud 
         return get_file_url_from_cloud(self.receipt_cloud_path)
 
-# Call to create_dummy_users() is in app/__init__.py and should not be here.
+# create_dummy_users() runs from `flask seed` (app/database.py), not at import or app start.
@@ -0,0 +1,213 @@
+# app/ocr_queue.py
+# Runs receipt OCR off the request thread.
+# submit_expense stores the expense with ocr_status "pending" and queues a job;
+# a worker pool (threads or processes, see OCR_EXECUTOR) runs the OCR and the
+# result is written back to the expense document.
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import current_app
+
+from .ocr_services import extract_text_from_receipt
+from .metrics_services import OCR_SECONDS
+from .utils import TTLCache
+
+OCR_PENDING = "pending"
+OCR_COMPLETED = "completed"
+OCR_FAILED = "failed"
+
+
+def _run_ocr_job(receipt_path):
+    """
+    Executed in the worker (thread or process). Kept at module level so it can
+    be pickled for a ProcessPoolExecutor. Returns (ocr_results, started_at, run_seconds).
+    """
+    started_at = time.time()
+    results = extract_text_from_receipt(receipt_path)
+    return results, started_at, time.time() - started_at
+
+
+class OcrJobQueue:
+    """
+    Background OCR worker pool with simple instrumentation.
+    mode is 'thread', 'process' or 'sync' (run inline, for development and tests).
+    The executor is created on first use so that a pre-fork master never owns
+    worker threads or processes.
+    """
+
+    def __init__(self, app, mode='thread', max_workers=2, recent_jobs=100):
+        if mode not in ('thread', 'process', 'sync'):
+            raise ValueError(f"Unknown OCR_EXECUTOR '{mode}'. Use 'thread', 'process' or 'sync'.")
+        self.app = app
+        self.mode = mode
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock() # Only one executor is ever created per process
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.max_depth = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+        self.max_run_seconds = 0.0
+        self.recent_jobs = deque(maxlen=recent_jobs) # per-job timings, newest last
+
+    def _get_executor(self):
+        executor = self._executor
+        if executor is not None and self._executor_pid == os.getpid():
+            return executor
+        with self._executor_lock:
+            # Checked again: a concurrent submit may have created it meanwhile
+            if self._executor is None or self._executor_pid != os.getpid():
+                executor_cls = ProcessPoolExecutor if self.mode == 'process' else ThreadPoolExecutor
+                self._executor = executor_cls(max_workers=self.max_workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def submit(self, expense_id, receipt_path, cleanup_path=None, content_hash=None):
+        """
+        Queues OCR for the receipt at `receipt_path` and writes the result to the
+        expense `expense_id`. `cleanup_path`, if given, is removed once the job is done.
+        With `content_hash`, a successful result is also added to the OCR cache.
+        """
+        submitted_at = time.time()
+        with self._lock:
+            self.submitted += 1
+            self.in_flight += 1
+            self.max_depth = max(self.max_depth, self.in_flight)
+
+        if self.mode == 'sync':
+            try:
+                outcome = _run_ocr_job(receipt_path)
+            except Exception as e:
+                outcome = e
+            self._finish(expense_id, submitted_at, outcome, cleanup_path, content_hash)
+            return
+
+        try:
+            future = self._get_executor().submit(_run_ocr_job, receipt_path)
+        except Exception as e: # Pool shut down or broken: the job fails like a failed OCR run
+            self._finish(expense_id, submitted_at, e, cleanup_path, content_hash)
+            return
+        future.add_done_callback(
+            lambda f: self._finish(expense_id, submitted_at, f.exception() or f.result(), cleanup_path, content_hash))
+
+    def _finish(self, expense_id, submitted_at, outcome, cleanup_path, content_hash=None):
+        from .models import Expense
+
+        if isinstance(outcome, Exception):
+            ocr_status, ocr_data = OCR_FAILED, {"error": str(outcome)}
+            wait_seconds, run_seconds = time.time() - submitted_at, 0.0
+        else:
+            ocr_data, started_at, run_seconds = outcome
+            ocr_status = OCR_FAILED if 'error' in ocr_data else OCR_COMPLETED
+            wait_seconds = max(0.0, started_at - submitted_at)
+
+        if content_hash and ocr_status == OCR_COMPLETED:
+            self.app.extensions['ocr_cache'].set(content_hash, ocr_data)
+
+        with self.app.app_context():
+            try:
+                Expense.set_ocr_result(expense_id, ocr_status, ocr_data)
+            except Exception as e:
+                ocr_status = OCR_FAILED
+                current_app.logger.error(f"Could not store OCR result for expense {expense_id}: {e}")
+            current_app.logger.info(
+                f"OCR job for expense {expense_id} {ocr_status}: waited {wait_seconds:.3f}s, ran {run_seconds:.3f}s")
+
+        if cleanup_path and os.path.exists(cleanup_path):
+            try: os.remove(cleanup_path)
+            except OSError: pass
+
+        # Timed from the worker's own measurement, which also works for process workers
+        OCR_SECONDS.observe(run_seconds, 'queue', ocr_status)
+        with self._lock:
+            self.in_flight -= 1
+            if ocr_status == OCR_COMPLETED:
+                self.completed += 1
+            else:
+                self.failed += 1
+            self.total_wait_seconds += wait_seconds
+            self.total_run_seconds += run_seconds
+            self.max_run_seconds = max(self.max_run_seconds, run_seconds)
+            self.recent_jobs.append({
+                'expense_id': str(expense_id),
+                'status': ocr_status,
+                'wait_seconds': round(wait_seconds, 6),
+                'run_seconds': round(run_seconds, 6),
+            })
+            self._idle.notify_all()
+
+    def wait(self, timeout=None):
+        """Blocks until no job is in flight. Returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self.in_flight == 0, timeout=timeout)
+
+    def shutdown(self, wait=True):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._executor_pid == os.getpid():
+            executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                'mode': self.mode,
+                'max_workers': self.max_workers,
+                'queue_depth': self.in_flight,
+                'max_queue_depth': self.max_depth,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'avg_wait_seconds': self.total_wait_seconds / finished if finished else 0.0,
+                'avg_run_seconds': self.total_run_seconds / finished if finished else 0.0,
+                'max_run_seconds': self.max_run_seconds,
+                'recent_jobs': list(self.recent_jobs),
+            }
+
+
+def get_ocr_queue():
+    return current_app.extensions['ocr_queue']
+
+
+def get_ocr_cache():
+    """
+    OCR results keyed by receipt SHA-256, so a receipt scanned before submission
+    (POST /receipts/scan) is not OCR'd again when the expense is submitted.
+    Bounded in entries (LRU eviction) and age; per process.
+    """
+    return current_app.extensions['ocr_cache']
+
+
+def scan_receipt(receipt_path, content_hash):
+    """Runs OCR once per distinct receipt. Returns (ocr_data, from_cache)."""
+    cache = get_ocr_cache()
+    cached = cache.get(content_hash)
+    if cached is not None:
+        return cached, True
+    started = time.perf_counter()
+    ocr_data = extract_text_from_receipt(receipt_path)
+    OCR_SECONDS.observe(time.perf_counter() - started, 'scan', OCR_FAILED if 'error' in ocr_data else OCR_COMPLETED)
+    if 'error' not in ocr_data:
+        cache.set(content_hash, ocr_data)
+    return ocr_data, False
+
+
+def init_app(app):
+    app.extensions['ocr_cache'] = TTLCache(
+        max_entries=app.config.get('OCR_CACHE_MAX_ENTRIES', 1000),
+        ttl_seconds=app.config.get('OCR_CACHE_TTL_SECONDS', 3600),
+    )
+    app.extensions['ocr_queue'] = OcrJobQueue(
+        app,
+        mode=app.config.get('OCR_EXECUTOR', 'thread'),
+        max_workers=app.config.get('OCR_MAX_WORKERS', 2),
+    )
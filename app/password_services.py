@@ -0,0 +1,116 @@
+# app/password_services.py
+# Password hashing off the request thread.
+# PBKDF2 is deliberately slow. Run directly in request threads, a burst of
+# logins would use every core and starve all other endpoints. Instead, hashes
+# are computed on a small dedicated pool (PASSWORD_HASH_WORKERS); hashlib
+# releases the GIL while it works, so the pool really runs in parallel but
+# never uses more cores than configured. At most PASSWORD_HASH_MAX_PENDING
+# further requests may wait for a worker. Beyond that, login/signup fail fast
+# with 503 instead of queueing without bound.
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = 'pbkdf2:sha256'
+DEFAULT_ITERATIONS = 260000
+
+
+class HashingBusyError(Exception):
+    """Raised when the hashing pool and its wait queue are full."""
+
+
+def hash_method_string(method=DEFAULT_METHOD, iterations=DEFAULT_ITERATIONS):
+    """The werkzeug method string, e.g. 'pbkdf2:sha256:260000'."""
+    if method.startswith('pbkdf2') and iterations:
+        return f"{method}:{int(iterations)}"
+    return method
+
+
+class PasswordHasher:
+    """
+    Bounded pool for generate/check password hash calls.
+    The executor is created on first use and again after a fork, like the OCR pool.
+    """
+
+    def __init__(self, method=DEFAULT_METHOD, iterations=DEFAULT_ITERATIONS,
+                 max_workers=2, max_pending=32, queue_timeout=2.0):
+        self.method = hash_method_string(method, iterations)
+        self.max_workers = max_workers
+        self.queue_timeout = queue_timeout
+        # Slots for running plus waiting jobs
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='password-hash')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusyError("Too many concurrent password operations")
+        try:
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with another method or work factor than configured."""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None and self._executor_pid == os.getpid():
+                self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+def get_password_hasher():
+    return current_app.extensions['password_hasher']
+
+
+# Module-level helpers used by the User model. Outside an app context
+# (e.g. scripts) they hash inline with the default method.
+
+def hash_password(password):
+    if has_app_context():
+        return get_password_hasher().hash(password)
+    return generate_password_hash(password, hash_method_string())
+
+
+def verify_password(password_hash, password):
+    if has_app_context():
+        return get_password_hasher().verify(password_hash, password)
+    return check_password_hash(password_hash, password)
+
+
+def password_needs_rehash(password_hash):
+    if has_app_context():
+        return get_password_hasher().needs_rehash(password_hash)
+    return password_hash.split('$', 1)[0] != hash_method_string()
+
+
+def init_app(app):
+    app.extensions['password_hasher'] = PasswordHasher(
+        method=app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        iterations=app.config.get('PASSWORD_HASH_ITERATIONS', DEFAULT_ITERATIONS),
+        max_workers=app.config.get('PASSWORD_HASH_WORKERS', 2),
+        max_pending=app.config.get('PASSWORD_HASH_MAX_PENDING', 32),
+        queue_timeout=app.config.get('PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS', 2.0),
+    )
@@ -0,0 +1,179 @@
+# app/profiling_services.py
+# Opt-in cProfile capture of single requests, for "this one call is slow in
+# production" investigations. Off unless PROFILING_ENABLED is set; then a
+# request is profiled when
+#   - it carries "X-Profile: 1" and the bearer token of an admin, or
+#   - it is picked by PROFILING_SAMPLE_RATE (0.0 - 1.0, default 0).
+# The profiler runs until the response is closed, so streamed listings are
+# profiled through their last row, and the profile is written after the
+# response has gone out. Each capture is a .prof file (pstats format, open
+# with snakeviz or python -m pstats) plus a .json sidecar naming the route,
+# user, status and duration, kept in a ring of the newest PROFILING_MAX_FILES
+# under PROFILING_DIR. A profiled response carries X-Profile-Id.
+# Only one request per process is profiled at a time: cProfile hooks every
+# call, and a second request arriving meanwhile simply runs unprofiled.
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import current_app, g, request
+
+from .auth import AuthError, authenticate_request
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+_PROFILE_ID_RE = re.compile(r'^\d{8}T\d{12}-[0-9a-f]{8}$')
+
+_profiling_lock = threading.Lock() # Held by the request being profiled
+
+
+def get_profile_dir():
+    # PROFILING_DIR is relative to the project root (or absolute)
+    project_root = os.path.dirname(current_app.root_path)
+    return os.path.join(project_root, current_app.config.get('PROFILING_DIR', 'profiles'))
+
+
+def is_valid_profile_id(profile_id):
+    return bool(_PROFILE_ID_RE.match(profile_id or ''))
+
+
+def _trigger():
+    """Why this request should be profiled ('header' or 'sample'), or None."""
+    if request.headers.get(PROFILE_HEADER) == '1':
+        try:
+            if authenticate_request().role == 'admin':
+                return 'header'
+        except AuthError:
+            pass # Not an admin: the request runs normally and login_required answers it
+    rate = current_app.config.get('PROFILING_SAMPLE_RATE', 0.0)
+    if rate > 0 and random.random() < rate:
+        return 'sample'
+    return None
+
+
+def _start_profiling():
+    trigger = _trigger()
+    if trigger is None or not _profiling_lock.acquire(blocking=False):
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError: # Another profiler is active in this process (Python 3.12+)
+        _profiling_lock.release()
+        return
+    g._profile = {
+        'profiler': profiler,
+        'id': f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}",
+        'trigger': trigger,
+        'started': time.perf_counter(),
+    }
+
+
+def _attach_profile(response):
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return response
+    user = g.get('current_user')
+    meta = {
+        'id': profile['id'],
+        'created_at': datetime.utcnow().isoformat(),
+        'method': request.method,
+        'path': request.path,
+        'route': request.url_rule.rule if request.url_rule is not None else None,
+        'user': user.username if user is not None else None,
+        'status': response.status_code,
+        'trigger': profile['trigger'],
+    }
+    directory = get_profile_dir()
+    max_files = current_app.config.get('PROFILING_MAX_FILES', 50)
+    response.headers[PROFILE_ID_HEADER] = profile['id']
+    # Runs once the body has been sent (or the stream abandoned)
+    response.call_on_close(lambda: _finish(profile, meta, directory, max_files))
+    return response
+
+
+def _finish(profile, meta, directory, max_files):
+    try:
+        profile['profiler'].disable()
+        meta['duration_seconds'] = round(time.perf_counter() - profile['started'], 6)
+        write_profile(directory, profile['profiler'], meta, max_files)
+    finally:
+        _profiling_lock.release()
+
+
+def _abandon_profile(exc):
+    # The request failed before a response was made: stop without writing
+    profile = g.pop('_profile', None)
+    if profile is not None:
+        profile['profiler'].disable()
+        _profiling_lock.release()
+
+
+# --- The on-disk ring ---
+
+def write_profile(directory, profiler, meta, max_files):
+    os.makedirs(directory, exist_ok=True)
+    profiler.dump_stats(os.path.join(directory, f"{meta['id']}.prof"))
+    with open(os.path.join(directory, f"{meta['id']}.json"), 'w') as f:
+        json.dump(meta, f)
+    # Ids start with their UTC timestamp, so name order is age order
+    profile_ids = _profile_ids(directory)
+    for stale_id in profile_ids[:max(0, len(profile_ids) - max_files)]:
+        for extension in ('.prof', '.json'):
+            try:
+                os.remove(os.path.join(directory, stale_id + extension))
+            except OSError:
+                pass
+
+
+def _profile_ids(directory):
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-5] for name in names if name.endswith('.json') and is_valid_profile_id(name[:-5]))
+
+
+def list_profiles():
+    """Metadata of the stored profiles, newest first."""
+    directory = get_profile_dir()
+    profiles = []
+    for profile_id in reversed(_profile_ids(directory)):
+        try:
+            with open(os.path.join(directory, f"{profile_id}.json")) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue # Removed by the ring while listing
+    return profiles
+
+
+def profile_path(profile_id):
+    """Path of a stored .prof file, or None if there is no such profile."""
+    if not is_valid_profile_id(profile_id):
+        return None
+    path = os.path.join(get_profile_dir(), f"{profile_id}.prof")
+    return path if os.path.exists(path) else None
+
+
+def profile_summary(path, sort='cumulative', limit=40):
+    """The top `limit` functions of a profile as pstats text."""
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def init_app(app):
+    app.extensions['profiling'] = {'enabled': app.config.get('PROFILING_ENABLED', False)}
+    if app.extensions['profiling']['enabled']:
+        app.before_request(_start_profiling)
+        app.after_request(_attach_profile)
+        app.teardown_request(_abandon_profile)
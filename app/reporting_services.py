@@ -0,0 +1,203 @@
+# app/reporting_services.py
+# Spend rollups for reporting.
+# 'expense_rollups' holds one document per (user_id, month, currency, status)
+# with the number of expenses and their summed amount. Every write that changes
+# one of those fields (Expense.save, Expense.update_status, bulk status updates,
+# bulk imports) moves the expense between buckets with $inc, so reports read a
+# few rollup documents instead of scanning 'expenses'.
+# Increments can drift (e.g. a write that fails half way, or float rounding);
+# `flask rebuild-rollups` recomputes the collection from 'expenses'.
+import re
+from collections import defaultdict
+from datetime import timezone
+
+import click
+from flask.cli import with_appcontext
+
+from .database import get_db
+
+ROLLUP_COLLECTION = 'expense_rollups'
+# Expense fields a rollup bucket depends on; use as the projection when
+# reading an expense's previous state.
+ROLLUP_PROJECTION = {'user_id': 1, 'date': 1, 'currency': 1, 'status': 1, 'amount': 1}
+ROLLUP_DIMENSIONS = ('user_id', 'month', 'currency', 'status')
+_MONTH_RE = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+
+def _month_of(date_value):
+    # Mongo stores dates in UTC; bucket by the UTC month so rebuilds agree.
+    if date_value.tzinfo is not None:
+        date_value = date_value.astimezone(timezone.utc)
+    return date_value.strftime('%Y-%m')
+
+
+def _bucket(doc):
+    return (doc.get('user_id'), _month_of(doc['date']), doc.get('currency'), doc.get('status'))
+
+
+def apply_changes(removed=(), added=()):
+    """
+    Moves expense documents out of / into their rollup buckets.
+    `removed` are previous states of expenses (or deleted expenses), `added`
+    the new states. Deltas are combined per bucket first, so a batch touches
+    each bucket once and a change that does not move an expense writes nothing.
+    """
+    deltas = defaultdict(lambda: [0, 0.0])
+    for doc in removed:
+        delta = deltas[_bucket(doc)]
+        delta[0] -= 1
+        delta[1] -= doc.get('amount') or 0.0
+    for doc in added:
+        delta = deltas[_bucket(doc)]
+        delta[0] += 1
+        delta[1] += doc.get('amount') or 0.0
+
+    rollups = get_db()[ROLLUP_COLLECTION]
+    for (user_id, month, currency, status), (count, total) in deltas.items():
+        if count == 0 and total == 0:
+            continue
+        rollups.update_one(
+            {'user_id': user_id, 'month': month, 'currency': currency, 'status': status},
+            {'$inc': {'count': count, 'total': total}},
+            upsert=True
+        )
+
+
+def record_inserted(docs):
+    apply_changes(added=docs)
+
+
+def record_updated(old_doc, new_doc):
+    """Records a change from `old_doc` to `new_doc` (both need the ROLLUP_PROJECTION fields)."""
+    apply_changes(removed=[old_doc], added=[new_doc])
+
+
+def rebuild_rollups():
+    """
+    Recomputes all rollups from the expenses collection. The result is built in
+    a scratch collection and swapped in, so reports never see a half-built table.
+    Increments made by writes while the rebuild runs may be lost; run it when
+    the app is quiet. Returns the number of rollup documents.
+    """
+    db = get_db()
+    scratch = f"{ROLLUP_COLLECTION}_rebuild"
+    db.expenses.aggregate([
+        {'$group': {
+            '_id': {
+                'user_id': '$user_id',
+                'month': {'$dateToString': {'format': '%Y-%m', 'date': '$date'}},
+                'currency': '$currency',
+                'status': '$status',
+            },
+            'count': {'$sum': 1},
+            'total': {'$sum': '$amount'},
+        }},
+        {'$project': {'_id': 0, 'user_id': '$_id.user_id', 'month': '$_id.month',
+                      'currency': '$_id.currency', 'status': '$_id.status',
+                      'count': 1, 'total': 1}},
+        {'$out': scratch},
+    ])
+    if scratch not in db.list_collection_names():
+        # No expenses: $out wrote nothing to swap in
+        db[ROLLUP_COLLECTION].delete_many({})
+        return 0
+    db[scratch].rename(ROLLUP_COLLECTION, dropTarget=True)
+    # rename drops the target's indexes along with it
+    from .indexes import ensure_indexes, INDEXES
+    ensure_indexes(db, {ROLLUP_COLLECTION: INDEXES[ROLLUP_COLLECTION]})
+    return db[ROLLUP_COLLECTION].count_documents({})
+
+
+def validate_month(value):
+    if not value or not _MONTH_RE.match(value):
+        raise ValueError(f"Invalid month '{value}'. Use YYYY-MM.")
+    return value
+
+
+def get_report(start_month, end_month, group_by=('month', 'currency'), filters=None, reporting_currency=None):
+    """
+    Totals from the rollups for months start_month..end_month (inclusive, YYYY-MM),
+    grouped by any of ROLLUP_DIMENSIONS and optionally filtered on them.
+    Returns a list of {<dimension>: ..., 'count': n, 'total': x} sorted by the
+    grouping keys. Amounts in different currencies are never added together
+    unless the caller groups without 'currency' or passes `reporting_currency`;
+    with `reporting_currency` every total is converted (see _convert_report)
+    and each row also reports 'unconverted_count'.
+    """
+    group_by = list(group_by)
+    if reporting_currency:
+        return _convert_report(start_month, end_month, group_by, filters, reporting_currency)
+    unknown = [dim for dim in group_by + list(filters or {}) if dim not in ROLLUP_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown report dimension(s): {', '.join(unknown)}")
+
+    match = {'month': {'$gte': validate_month(start_month), '$lte': validate_month(end_month)}}
+    match.update({dim: value for dim, value in (filters or {}).items() if value is not None})
+    pipeline = [
+        {'$match': match},
+        {'$group': {
+            '_id': {dim: f'${dim}' for dim in group_by},
+            'count': {'$sum': '$count'},
+            'total': {'$sum': '$total'},
+        }},
+    ]
+    rows = []
+    for doc in get_db()[ROLLUP_COLLECTION].aggregate(pipeline):
+        if doc['count'] == 0:
+            continue # Bucket emptied by status changes
+        row = {dim: doc['_id'].get(dim) for dim in group_by}
+        row['count'] = doc['count']
+        row['total'] = round(doc['total'], 2)
+        rows.append(row)
+    rows.sort(key=lambda row: tuple(str(row[dim]) for dim in group_by))
+    return rows
+
+
+def _convert_report(start_month, end_month, group_by, filters, reporting_currency):
+    """
+    Reads the rollups per (group, month, currency), converts each bucket's total
+    with the FX rate in effect at the end of its month, then re-aggregates by
+    `group_by` with NumPy. Buckets in a currency without a rate are left out of
+    'total' and counted in 'unconverted_count'.
+    """
+    import numpy as np
+    from .fx_services import get_fx_table
+
+    detail_dims = group_by + [dim for dim in ('month', 'currency') if dim not in group_by]
+    buckets = get_report(start_month, end_month, group_by=detail_dims, filters=filters)
+    if not buckets:
+        return []
+
+    month_ends = (np.array([row['month'] for row in buckets], dtype='datetime64[M]') + 1).astype('datetime64[D]') - 1
+    converted = get_fx_table().convert([row['total'] for row in buckets], [row['currency'] for row in buckets],
+                                       month_ends, reporting_currency)
+    counts = np.array([row['count'] for row in buckets], dtype=np.int64)
+    missing = np.isnan(converted)
+
+    keys = [tuple(row[dim] for dim in group_by) for row in buckets]
+    groups = list(dict.fromkeys(keys))
+    group_index = {key: index for index, key in enumerate(groups)}
+    inverse = np.array([group_index[key] for key in keys])
+    totals = np.bincount(inverse, weights=np.where(missing, 0.0, converted), minlength=len(groups))
+    group_counts = np.bincount(inverse, weights=counts, minlength=len(groups))
+    unconverted = np.bincount(inverse, weights=np.where(missing, counts, 0), minlength=len(groups))
+
+    rows = []
+    for index, key in enumerate(groups):
+        row = dict(zip(group_by, key))
+        row['count'] = int(group_counts[index])
+        row['total'] = round(float(totals[index]), 2)
+        row['unconverted_count'] = int(unconverted[index])
+        rows.append(row)
+    return rows
+
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """Recompute the spend rollups used by /api/admin/reports from all expenses."""
+    click.echo(f"Rebuilt {rebuild_rollups()} rollup document(s).")
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_rollups_command)
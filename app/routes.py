@@ -1,14 +1,34 @@
-print("DEBUG: LOADING app/routes.py - DEBUG VERSION FOR SIGNUP ROUTING CHECK") 
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
+from flask import Blueprint, request, jsonify, current_app, send_file, abort, g, Response, stream_with_context
 from .models import User, Employee, Expense # EXPENSES_DB removed
-from .database import get_db 
+from .auth import login_required, invalidate_session, get_auth_cache_stats, authenticate_request, AuthError
+from .password_services import HashingBusyError
+from .database import get_db, get_pool_stats
 from werkzeug.utils import secure_filename
+import hmac
 import os
 import uuid
+import itertools
+import mimetypes
+import tempfile
+import time
 from datetime import datetime, timedelta 
 
-from .ocr_services import extract_text_from_receipt
-from .storage_services import upload_file_to_cloud, delete_file_from_cloud, SIMULATED_CLOUD_FOLDER
+from .ocr_queue import get_ocr_queue, get_ocr_cache, scan_receipt, OCR_PENDING, OCR_COMPLETED, OCR_FAILED
+from .storage_services import (ingest_receipt, copy_and_hash, delete_file_from_cloud, get_file_url_from_cloud,
+                               get_local_path_for_cloud, get_storage_backend, CONTENT_KEY_RE,
+                               SIMULATED_CLOUD_FOLDER)
+from .import_services import import_expenses, detect_format, open_receipts_archive, ImportFormatError
+from .reporting_services import get_report, ROLLUP_DIMENSIONS
+from .version_services import get_version, listing_etag
+from .search_services import search_terms, suggest_vendors
+from .event_services import format_sse, EXPENSE_CREATED, EXPENSE_UPDATED
+from .sync_services import get_changes, SyncTokenExpired
+from .compression_services import etag_variants
+from .asset_services import serve_asset
+from .metrics_services import render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .profiling_services import list_profiles, profile_path, profile_summary
+from .fx_services import totals_from_cursor, validate_currency
+from .utils import stream_json_page
 
 # Define a Blueprint
 bp = Blueprint('main', __name__)
@@ -16,6 +36,12 @@ bp = Blueprint('main', __name__)
 # Debug print statement removed.
 # Debug routes /show-routes-debug and GET /signup removed.
 
+def busy_response():
+    # Password hashing pool is saturated; ask the client to retry shortly.
+    response = jsonify({"error": "Server is busy, please retry shortly"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @bp.route('/signup', methods=['POST']) 
 def combined_signup_route(): 
     data = request.get_json(silent=True) # Use silent=True to prevent raising BadRequest on parse error
@@ -38,6 +64,8 @@ def combined_signup_route():
     try:
         new_user = Employee(username=username, password=password)
         new_user.save()
+    except HashingBusyError:
+        return busy_response()
     except Exception as e:
         current_app.logger.error(f"Error during user creation: {e}") 
         return jsonify({"error": "An unexpected error occurred during account creation."}), 500
@@ -47,15 +75,109 @@ def combined_signup_route():
 
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf'} # This should be present
+RECEIPT_CACHE_MAX_AGE = 365 * 24 * 3600 # One year, for immutable content-addressed receipts
 
 def allowed_file(filename): # This should be present
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def parse_page_args():
+    """
+    Reads ?limit= and ?cursor= for paginated listings.
+    The limit is capped at EXPENSES_MAX_PAGE_SIZE. Raises ValueError on bad input.
+    """
+    max_page_size = current_app.config['EXPENSES_MAX_PAGE_SIZE']
+    limit = request.args.get('limit', current_app.config['EXPENSES_DEFAULT_PAGE_SIZE'])
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    cursor = request.args.get('cursor') or None
+    if cursor:
+        Expense.decode_cursor(cursor) # Validate early so a bad token is a 400, not a 500
+    return min(limit, max_page_size), cursor
+
+def parse_listing_filters(allow_user_filter=False):
+    """
+    Reads the listing filters: status (comma-separated), from / to (YYYY-MM-DD,
+    inclusive), min_amount / max_amount, vendor (exact name), currency, q
+    (words or word prefixes to find in vendor / description) and, for
+    admins, user_id. Returns a dict for Expense.listing_query(); raises
+    ValueError on bad input.
+    """
+    args = request.args
+    filters = {}
+    if args.get('status'):
+        statuses = sorted({s.strip().lower() for s in args['status'].split(',') if s.strip()})
+        invalid = [s for s in statuses if s not in Expense.STATUSES]
+        if invalid:
+            raise ValueError(f"Invalid status '{invalid[0]}'. Use {', '.join(Expense.STATUSES)}.")
+        filters['status'] = statuses
+    for key in ('from', 'to'):
+        if args.get(key):
+            try:
+                filters[key] = datetime.strptime(args[key], '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f"{key} must be a date (YYYY-MM-DD)")
+    for key in ('min_amount', 'max_amount'):
+        if args.get(key):
+            try:
+                filters[key] = float(args[key])
+            except ValueError:
+                raise ValueError(f"{key} must be a number")
+    if args.get('vendor', '').strip():
+        filters['vendor'] = args['vendor'].strip()
+    if args.get('currency', '').strip():
+        filters['currency'] = args['currency'].strip().upper()
+    if args.get('q', '').strip():
+        filters['q'] = search_terms(args['q'])
+    if allow_user_filter and args.get('user_id', '').strip():
+        filters['user_id'] = args['user_id'].strip()
+    if 'from' in filters and 'to' in filters and filters['from'] > filters['to']:
+        raise ValueError("from must not be after to")
+    if 'min_amount' in filters and 'max_amount' in filters and filters['min_amount'] > filters['max_amount']:
+        raise ValueError("min_amount must not exceed max_amount")
+    return filters
+
+def filters_etag_part(filters):
+    # Canonical form of the filters, so the same listing always gets the same ETag
+    return '&'.join(f"{key}={filters[key]}" for key in sorted(filters))
+
 @bp.route('/health') 
 def health_check():
     return jsonify(status="UP", message="Expense platform is running!")
 
+@bp.route('/health/db')
+def db_pool_stats():
+    # Anyone may ask whether the database answers. The connection pool counters
+    # for this worker process (used to size MONGO_MAX_POOL_SIZE) reveal load,
+    # so they are only shown to admins.
+    try:
+        is_admin = authenticate_request().role == 'admin'
+    except AuthError:
+        is_admin = False
+    if is_admin:
+        return jsonify(get_pool_stats())
+    try:
+        get_db().command('ping')
+    except Exception as e:
+        current_app.logger.warning(f"Database health check failed: {e}")
+        return jsonify(status="DOWN"), 503
+    return jsonify(status="UP")
+
+@bp.route('/metrics')
+def metrics():
+    # Scraped by Prometheus; counters are per worker process (see app/metrics_services.py)
+    if not current_app.extensions['metrics']['enabled']:
+        abort(404)
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({"error": "Unauthorized"}), 401
+    # Without a token anyone can scrape, so leave out the connection pool gauges
+    return Response(render_metrics(include_pool=bool(token)), content_type=METRICS_CONTENT_TYPE)
+
 @bp.route('/login', methods=['POST']) 
 def login():
     data = request.get_json()
@@ -66,7 +188,11 @@ def login():
         return jsonify({"error": "Username and password required"}), 400
 
     user = User.get_by_username(username)
-    if user and user.check_password(password):
+    try:
+        password_ok = user is not None and user.check_password(password)
+    except HashingBusyError:
+        return busy_response()
+    if password_ok:
         sessions_collection = get_db().sessions 
         session_token = str(uuid.uuid4())
         expires_at = datetime.utcnow() + timedelta(days=1) 
@@ -93,62 +219,24 @@ def logout():
         if token: 
             sessions_collection = get_db().sessions
             sessions_collection.delete_one({'_id': token})
+            invalidate_session(token)
     return jsonify({"message": "Logout successful"}), 200
 
 @bp.route('/me', methods=['GET']) 
+@login_required()
 def me():
-    token = request.headers.get('Authorization')
-    if not token:
-        return jsonify({"error": "Missing token"}), 401
-    
-    token = token.replace("Bearer ", "")
-    if not token: 
-        return jsonify({"error": "Invalid token format"}), 401
-
-    sessions_collection = get_db().sessions
-    session_doc = sessions_collection.find_one({'_id': token})
-
-    if session_doc:
-        if session_doc.get('expires_at') and session_doc['expires_at'] < datetime.utcnow():
-            sessions_collection.delete_one({'_id': token}) 
-            return jsonify({"error": "Session expired. Please login again."}), 401
-
-        username_from_session = session_doc.get('username')
-        if username_from_session:
-            user = User.get_by_username(username_from_session) 
-            if user:
-                return jsonify({
-                    "username": user.username,
-                    "role": user.role,
-                    "id": user.username 
-                }), 200
-            return jsonify({"error": "User associated with session not found"}), 404 
-        
-    return jsonify({"error": "Invalid or expired token"}), 401 
+    user = g.current_user
+    return jsonify({
+        "username": user.username,
+        "role": user.role,
+        "id": user.username 
+    }), 200
 
 # In app/routes.py, part of the 'bp' Blueprint
 @bp.route('/expenses', methods=['POST'])
+@login_required(role="employee")
 def submit_expense():
-    # Token and user authentication (remains largely the same, relies on MongoDB sessions now)
-    token = request.headers.get('Authorization')
-    if not token: return jsonify({"error": "Missing token"}), 401
-    token = token.replace("Bearer ", "")
-    if not token: return jsonify({"error": "Invalid token format"}), 401
-
-    sessions_collection = get_db().sessions # Assumes get_db() is imported
-    session_doc = sessions_collection.find_one({'_id': token})
-
-    if not session_doc: return jsonify({"error": "Invalid or expired token"}), 401
-    if session_doc.get('expires_at') and session_doc['expires_at'] < datetime.utcnow(): # Assumes datetime imported
-        sessions_collection.delete_one({'_id': token})
-        return jsonify({"error": "Session expired. Please login again."}), 401
-    
-    username_from_session = session_doc.get('username')
-    if not username_from_session: return jsonify({"error": "Session is invalid (no username)"}), 401
-    
-    user = User.get_by_username(username_from_session) # Fetches from MongoDB
-    if not user or user.role != "employee": 
-        return jsonify({"error": "Unauthorized or not an employee"}), 403
+    user = g.current_user
 
     # File handling for receipt (remains largely the same)
     if 'receipt' not in request.files: return jsonify({"error": "No receipt file part"}), 400
@@ -172,24 +260,14 @@ def submit_expense():
         return jsonify({"error": "Missing required expense data: amount, date, vendor"}), 400
 
     filename = secure_filename(file.filename)
-    
-    # Path setup for temp OCR file (remains largely the same)
-    project_root = os.path.dirname(current_app.root_path)
-    base_upload_folder = current_app.config['UPLOAD_FOLDER']
-    temp_ocr_dir = os.path.join(project_root, base_upload_folder, 'temp_for_ocr')
-    if not os.path.exists(temp_ocr_dir):
-        os.makedirs(temp_ocr_dir, exist_ok=True)
-    temp_receipt_path_for_ocr = os.path.join(temp_ocr_dir, filename)
-
     cloud_receipt_path = None
-    ocr_results = {}
 
     try:
-        file.save(temp_receipt_path_for_ocr)
-        ocr_results = extract_text_from_receipt(temp_receipt_path_for_ocr)
-        current_app.logger.info(f"OCR Results for {filename}: {ocr_results}")
-        file.seek(0) 
-        cloud_receipt_path = upload_file_to_cloud(file, filename, user.username) # Pass user.username as user_id
+        # Single pass: the upload is streamed straight to storage, hashed on the way,
+        # and OCR later reads the stored object rather than a temp copy.
+        stored_receipt = ingest_receipt(file, filename, user.username) # Pass user.username as user_id
+        cloud_receipt_path = stored_receipt['cloud_path']
+        cached_ocr = get_ocr_cache().get(stored_receipt['sha256'])
         
         # Create Expense object (model now handles date_str to datetime conversion)
         new_expense = Expense(
@@ -199,7 +277,13 @@ def submit_expense():
             date_str=date_str, # Pass the string from form
             vendor=vendor,
             description=description,
-            receipt_cloud_path=cloud_receipt_path
+            receipt_cloud_path=cloud_receipt_path,
+            receipt_key=stored_receipt['key'],
+            receipt_sha256=stored_receipt['sha256'],
+            receipt_size=stored_receipt['size'],
+            # A receipt already scanned via POST /receipts/scan is not OCR'd again.
+            ocr_status=OCR_COMPLETED if cached_ocr is not None else OCR_PENDING,
+            ocr_data=cached_ocr
             # status defaults to "pending", created_at defaults to now in model
         )
         new_expense.save() # This now saves to MongoDB and sets new_expense._id
@@ -211,12 +295,29 @@ def submit_expense():
         current_app.logger.error(f"Error during expense submission: {str(e)}")
         if cloud_receipt_path: delete_file_from_cloud(cloud_receipt_path)
         return jsonify({"error": f"Could not process expense: {str(e)}"}), 500
-    finally:
-        if os.path.exists(temp_receipt_path_for_ocr): os.remove(temp_receipt_path_for_ocr)
-        if os.path.exists(temp_ocr_dir) and not os.listdir(temp_ocr_dir):
-            try: os.rmdir(temp_ocr_dir)
-            except OSError: current_app.logger.warning(f"Could not remove temp_ocr_dir: {temp_ocr_dir}")
-    
+
+    # From here on the expense is stored and keeps its receipt reference: a
+    # failure to queue OCR is recorded on the expense, not reported as a failed submission.
+    if cached_ocr is None:
+        cleanup_path = None
+        try:
+            # OCR runs in the background; clients poll GET /expenses/<id>/ocr for the result.
+            # Remote backends have no local path, so OCR gets a temporary copy that the job removes.
+            ocr_path = get_local_path_for_cloud(cloud_receipt_path)
+            if ocr_path is None:
+                ocr_path = cleanup_path = get_storage_backend().download_to_temp(stored_receipt['key'])
+            get_ocr_queue().submit(new_expense._id, ocr_path, cleanup_path=cleanup_path,
+                                   content_hash=stored_receipt['sha256'])
+        except Exception as e:
+            current_app.logger.error(f"Could not queue OCR for expense {new_expense._id}: {e}")
+            if cleanup_path and os.path.exists(cleanup_path):
+                os.remove(cleanup_path)
+            new_expense.ocr_status, new_expense.ocr_data = OCR_FAILED, {"error": "OCR could not be started"}
+            try:
+                Expense.set_ocr_result(new_expense._id, new_expense.ocr_status, new_expense.ocr_data)
+            except Exception as record_error:
+                current_app.logger.error(f"Could not record OCR failure for expense {new_expense._id}: {record_error}")
+
     # Return MongoDB ObjectId as string for the ID
     return jsonify({
         "message": "Expense submitted successfully",
@@ -230,131 +331,272 @@ def submit_expense():
             "description": new_expense.description,
             "receipt_url": new_expense.get_receipt_url(),
             "status": new_expense.status,
-            "created_at": new_expense.created_at.isoformat()
+            "created_at": new_expense.created_at.isoformat(),
+            "ocr_status": new_expense.ocr_status
         },
-        "ocr_data": ocr_results
+        "ocr_data": new_expense.ocr_data or {} # Otherwise filled in asynchronously, see GET /expenses/<id>/ocr
     }), 201
 
+@bp.route('/expenses/import', methods=['POST'])
+@login_required()
+def import_expenses_route():
+    """
+    Bulk import of expenses from NDJSON or CSV.
+    Either a multipart upload with the rows in 'file' (plus an optional zip of
+    receipts in 'receipts', referenced by a row's 'receipt' column), or the raw
+    rows as the request body with Content-Type text/csv or application/x-ndjson.
+    Rows are validated like POST /expenses; invalid rows are reported in
+    'errors' by row number and do not stop the import. Bytes that are not
+    UTF-8 do: that row is reported and the rows before it are kept.
+    """
+    user = g.current_user
+    try:
+        if 'file' in request.files:
+            upload = request.files['file']
+            fmt = detect_format(upload.filename, upload.mimetype, request.args.get('format'))
+            stream = upload.stream
+        else:
+            fmt = detect_format(mimetype=request.mimetype, requested=request.args.get('format'))
+            stream = request.stream
+        receipts = open_receipts_archive(request.files['receipts']) if 'receipts' in request.files else None
+    except ImportFormatError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        summary = import_expenses(
+            user, stream, fmt, receipts=receipts,
+            batch_size=current_app.config.get('BULK_IMPORT_BATCH_SIZE', 1000),
+            max_errors=current_app.config.get('BULK_IMPORT_MAX_ERRORS', 1000),
+        )
+    finally:
+        if receipts is not None:
+            receipts.close()
+
+    current_app.logger.info(
+        f"User {user.username} imported {summary['inserted']} of {summary['received']} expense rows")
+    return jsonify(summary), 200
+
+@bp.route('/receipts/scan', methods=['POST'])
+@login_required()
+def scan_receipt_route():
+    """
+    Runs OCR on a receipt before the expense is submitted so forms can pre-fill
+    vendor, amount and date. The result is cached by content hash and reused
+    when the same receipt is submitted with POST /expenses.
+    """
+    if 'receipt' not in request.files: return jsonify({"error": "No receipt file part"}), 400
+    file = request.files['receipt']
+    if file.filename == '': return jsonify({"error": "No selected file"}), 400
+    if not allowed_file(file.filename): return jsonify({"error": "File type not allowed"}), 400
+
+    # OCR needs a file on disk; this copy only lives for the duration of the scan.
+    fd, scan_path = tempfile.mkstemp(suffix=os.path.splitext(secure_filename(file.filename))[1])
+    os.close(fd)
+    try:
+        content_hash, _ = copy_and_hash(file, scan_path)
+        ocr_data, from_cache = scan_receipt(scan_path, content_hash)
+    except Exception as e:
+        current_app.logger.error(f"Error scanning receipt: {e}")
+        return jsonify({"error": "Could not scan receipt"}), 500
+    finally:
+        os.remove(scan_path)
+
+    return jsonify({"sha256": content_hash, "cached": from_cache, "ocr_data": ocr_data}), 200
+
+@bp.route('/expenses/<expense_id>/ocr', methods=['GET'])
+@login_required()
+def get_expense_ocr_status(expense_id):
+    user = g.current_user
+    expense = Expense.get_by_id(expense_id)
+    # Employees may only poll their own expenses; admins may poll any.
+    if not expense or (user.role != 'admin' and expense.user_id != user.username):
+        return jsonify({"error": "Expense not found"}), 404
+    return jsonify({
+        "id": str(expense._id),
+        "ocr_status": expense.ocr_status,
+        "ocr_data": expense.ocr_data or {}
+    }), 200
+
+@bp.route('/expenses/<expense_id>', methods=['DELETE'])
+@login_required()
+def delete_expense(expense_id):
+    user = g.current_user
+    expense = Expense.get_by_id(expense_id)
+    # Employees may delete their own pending expenses; admins may delete any.
+    if not expense or (user.role != 'admin' and expense.user_id != user.username):
+        return jsonify({"error": "Expense not found"}), 404
+    if user.role != 'admin' and expense.status != 'pending':
+        return jsonify({"error": "Only pending expenses can be deleted"}), 409
+    if Expense.delete(expense_id) is None:
+        return jsonify({"error": "Expense not found"}), 404
+    return jsonify({"message": "Expense deleted successfully"}), 200
+
+# Listing serializers work on the raw (projected) Mongo documents directly.
+# Stored documents already hold BSON-native types, so there is no need to
+# rebuild and re-validate an Expense per row just to read a few fields.
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+def employee_expense_json(doc):
+    return {
+        "id": str(doc['_id']), # Convert ObjectId to string
+        "user_id": doc.get('user_id'),
+        "amount": doc.get('amount'),
+        "currency": doc.get('currency'),
+        "date": _isoformat(doc.get('date')),
+        "vendor": doc.get('vendor'),
+        "description": doc.get('description'),
+        "receipt_url": get_file_url_from_cloud(doc.get('receipt_cloud_path')),
+        "status": doc.get('status'),
+        "created_at": _isoformat(doc.get('created_at')),
+        "ocr_status": doc.get('ocr_status')
+    }
+
+def admin_expense_json(doc):
+    return {
+        "id": str(doc['_id']),
+        "employee_id": doc.get('user_id'), # user_id in model maps to employee_id
+        "amount": doc.get('amount'),
+        "currency": doc.get('currency'), # Added currency for context
+        "date": _isoformat(doc.get('date')),
+        "vendor": doc.get('vendor'),
+        "status": doc.get('status'),
+        "description": doc.get('description')
+    }
+
+def not_modified_or_none(etag):
+    """A 304 response if the client already has the representation tagged `etag`."""
+    # Compressed responses carry '<etag>-<encoding>' (see compression_services)
+    for candidate in etag_variants(etag):
+        if request.if_none_match.contains(candidate):
+            response = Response(status=304)
+            response.set_etag(candidate)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+    return None
+
+def with_etag(response, etag):
+    # Clients must revalidate every time; with an unchanged version that costs one tiny lookup.
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def stream_expense_page(docs, serialize, limit):
+    """
+    Streams one page of expenses straight from the Mongo cursor as a chunked
+    JSON response, so peak memory does not grow with the page size.
+    The first document is fetched here, before the response starts, so that
+    database errors can still be reported with a proper status code.
+    """
+    docs = iter(docs)
+    first = next(docs, None)
+    if first is not None:
+        docs = itertools.chain([first], docs)
+    body = stream_json_page(docs, serialize, limit, Expense.encode_cursor,
+                            batch_size=current_app.config['EXPENSES_STREAM_BATCH_SIZE'])
+    return Response(stream_with_context(body), mimetype='application/json')
+
 # In app/routes.py, part of the 'bp' Blueprint
 @bp.route('/expenses', methods=['GET'])
+@login_required()
 def get_expenses():
-    # Token and user authentication (similar to POST /expenses, uses MongoDB sessions)
-    token = request.headers.get('Authorization')
-    if not token: return jsonify({"error": "Missing token"}), 401
-    token = token.replace("Bearer ", "")
-    if not token: return jsonify({"error": "Invalid token format"}), 401
-
-    sessions_collection = get_db().sessions
-    session_doc = sessions_collection.find_one({'_id': token})
-
-    if not session_doc: return jsonify({"error": "Invalid or expired token"}), 401
-    if session_doc.get('expires_at') and session_doc['expires_at'] < datetime.utcnow():
-        sessions_collection.delete_one({'_id': token})
-        return jsonify({"error": "Session expired. Please login again."}), 401
-
-    username_from_session = session_doc.get('username')
-    if not username_from_session: return jsonify({"error": "Session is invalid (no username)"}), 401
-        
-    user = User.get_by_username(username_from_session) # Fetches from MongoDB
-    if not user: return jsonify({"error": "User not found for session"}), 404
-    
-    # Fetch expenses for this user from MongoDB via model method
-    user_expenses = Expense.get_by_user_id(user.username) # Pass username as user_id
+    user = g.current_user
+    try:
+        limit, cursor = parse_page_args()
+        filters = parse_listing_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    return jsonify([
-        {
-            "id": str(exp._id), # Convert ObjectId to string
-            "user_id": exp.user_id,
-            "amount": exp.amount,
-            "currency": exp.currency,
-            "date": exp.date.isoformat(), # Model stores date as datetime
-            "vendor": exp.vendor,
-            "description": exp.description,
-            "receipt_url": exp.get_receipt_url(),
-            "status": exp.status,
-            "created_at": exp.created_at.isoformat()
-        } for exp in user_expenses
-    ]), 200
+    # The ETag only depends on this user's change version, so an unchanged
+    # listing is answered without touching the expenses collection.
+    etag = listing_etag(f"user:{user.username}", get_version(user.username), limit, cursor,
+                        filters_etag_part(filters))
+    not_modified = not_modified_or_none(etag)
+    if not_modified is not None:
+        return not_modified
+
+    # Stream one page of this user's (filtered) expenses from MongoDB
+    filters['user_id'] = user.username
+    docs = Expense.find_page_documents(Expense.listing_query(filters), limit=limit, cursor=cursor,
+                                       batch_size=current_app.config['EXPENSES_STREAM_BATCH_SIZE'],
+                                       projection=Expense.EMPLOYEE_LIST_PROJECTION)
+    return with_etag(stream_expense_page(docs, employee_expense_json, limit), etag), 200
+
+@bp.route('/expenses/changes', methods=['GET'])
+@login_required()
+def get_expense_changes():
+    """
+    Delta sync for offline clients: the caller's expenses changed or deleted
+    since the ?since= token of the previous call (omit it for a full sync).
+    Query: since, limit (default SYNC_DEFAULT_PAGE_SIZE, max SYNC_MAX_PAGE_SIZE).
+    Keep next_since for the next call; while has_more is true, call again at once.
+    A 410 means the token is too old and the client must start over without since.
+    """
+    config = current_app.config
+    try:
+        limit = min(max(int(request.args.get('limit', config['SYNC_DEFAULT_PAGE_SIZE'])), 1),
+                    config['SYNC_MAX_PAGE_SIZE'])
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    try:
+        changed, deleted, next_since, has_more = get_changes(
+            g.current_user.username, since=request.args.get('since') or None, limit=limit,
+            overlap_seconds=config['SYNC_OVERLAP_SECONDS'],
+            projection=dict(Expense.EMPLOYEE_LIST_PROJECTION, updated_at=1))
+    except SyncTokenExpired as e:
+        return jsonify({"error": str(e)}), 410
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "changes": [dict(employee_expense_json(doc), updated_at=_isoformat(doc.get('updated_at'))) for doc in changed],
+        "deleted": deleted,
+        "next_since": next_since,
+        "has_more": has_more,
+    }), 200
+
+@bp.route('/vendors/suggest', methods=['GET'])
+@login_required()
+def vendor_suggestions():
+    """
+    Autocomplete for the vendor field: the caller's most used vendor names with
+    a word starting with ?prefix=. Query: prefix, limit (default 10, max 25).
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 25)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    prefix = request.args.get('prefix', '')
+    return jsonify({"prefix": prefix, "vendors": suggest_vendors(g.current_user.username, prefix, limit)}), 200
 
 @bp.route('/api/admin/expenses', methods=['GET'])
+@login_required(role="admin")
 def get_all_expenses_admin():
-    # 1. Authenticate and Authorize Admin
-    token = request.headers.get('Authorization')
-    if not token:
-        return jsonify({"error": "Missing token"}), 401
-
-    token = token.replace("Bearer ", "")
-    if not token: # Check if token is empty after stripping "Bearer "
-        return jsonify({"error": "Invalid token format"}), 401
-
-    sessions_collection = get_db().sessions
-    session_doc = sessions_collection.find_one({'_id': token})
-
-    if not session_doc:
-        return jsonify({"error": "Invalid or expired token"}), 401
-
-    # Check for session expiry
-    if session_doc.get('expires_at') and session_doc['expires_at'] < datetime.utcnow():
-        sessions_collection.delete_one({'_id': token}) # Clean up expired session
-        return jsonify({"error": "Session expired. Please login again."}), 401
-
-    username_from_session = session_doc.get('username')
-    if not username_from_session:
-        return jsonify({"error": "Session is invalid (no username)"}), 401 # Should not happen if session is valid
-
-    user = User.get_by_username(username_from_session)
-    if not user:
-        # This case implies data inconsistency if session exists but user doesn't
-        return jsonify({"error": "User associated with session not found"}), 404 
-
-    if user.role != 'admin':
-        return jsonify({"error": "Forbidden: Admin access required"}), 403
+    try:
+        limit, cursor = parse_page_args()
+        filters = parse_listing_filters(allow_user_filter=True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # 2. Fetch all expenses
+    # Stream one page of all (matching) expenses
     try:
-        all_expenses_models = Expense.get_all() # Uses the new model method
-        
-        # 3. Format response according to requirements
-        expenses_list_response = []
-        for exp_model in all_expenses_models:
-            expenses_list_response.append({
-                "id": str(exp_model._id),
-                "employee_id": exp_model.user_id, # user_id in model maps to employee_id
-                "amount": exp_model.amount,
-                "currency": exp_model.currency, # Added currency for context
-                "date": exp_model.date.isoformat(),
-                "vendor": exp_model.vendor,
-                "status": exp_model.status,
-                "description": exp_model.description
-            })
-        return jsonify(expenses_list_response), 200
+        etag = listing_etag("admin", get_version(), limit, cursor, filters_etag_part(filters))
+        not_modified = not_modified_or_none(etag)
+        if not_modified is not None:
+            return not_modified
+
+        docs = Expense.find_page_documents(Expense.listing_query(filters), limit=limit, cursor=cursor,
+                                           batch_size=current_app.config['EXPENSES_STREAM_BATCH_SIZE'],
+                                           projection=Expense.ADMIN_LIST_PROJECTION)
+        return with_etag(stream_expense_page(docs, admin_expense_json, limit), etag), 200
 
     except Exception as e:
         current_app.logger.error(f"Error fetching all expenses for admin: {e}")
         return jsonify({"error": "An internal error occurred while retrieving expenses."}), 500
 
 @bp.route('/api/admin/expenses/<expense_id>/approve', methods=['POST'])
+@login_required(role="admin")
 def approve_expense_admin(expense_id):
-    # Authentication and Authorization (similar to get_all_expenses_admin)
-    token = request.headers.get('Authorization')
-    if not token: return jsonify({"error": "Missing token"}), 401
-    token = token.replace("Bearer ", "")
-    if not token: return jsonify({"error": "Invalid token format"}), 401
-
-    sessions_collection = get_db().sessions
-    session_doc = sessions_collection.find_one({'_id': token})
-    if not session_doc: return jsonify({"error": "Invalid or expired token"}), 401
-    if session_doc.get('expires_at') and session_doc['expires_at'] < datetime.utcnow():
-        sessions_collection.delete_one({'_id': token})
-        return jsonify({"error": "Session expired. Please login again."}), 401
-    
-    username_from_session = session_doc.get('username')
-    if not username_from_session: return jsonify({"error": "Session is invalid"}), 401
-        
-    user = User.get_by_username(username_from_session)
-    if not user: return jsonify({"error": "User not found"}), 404
-    if user.role != 'admin': return jsonify({"error": "Forbidden: Admin access required"}), 403
-
     # Update expense status
     try:
         if Expense.update_status(expense_id, "approved"):
@@ -367,27 +609,8 @@ def approve_expense_admin(expense_id):
         return jsonify({"error": "An internal error occurred"}), 500
 
 @bp.route('/api/admin/expenses/<expense_id>/reject', methods=['POST'])
+@login_required(role="admin")
 def reject_expense_admin(expense_id):
-    # Authentication and Authorization (similar to get_all_expenses_admin)
-    token = request.headers.get('Authorization')
-    if not token: return jsonify({"error": "Missing token"}), 401
-    token = token.replace("Bearer ", "")
-    if not token: return jsonify({"error": "Invalid token format"}), 401
-
-    sessions_collection = get_db().sessions
-    session_doc = sessions_collection.find_one({'_id': token})
-    if not session_doc: return jsonify({"error": "Invalid or expired token"}), 401
-    if session_doc.get('expires_at') and session_doc['expires_at'] < datetime.utcnow():
-        sessions_collection.delete_one({'_id': token})
-        return jsonify({"error": "Session expired. Please login again."}), 401
-
-    username_from_session = session_doc.get('username')
-    if not username_from_session: return jsonify({"error": "Session is invalid"}), 401
-
-    user = User.get_by_username(username_from_session)
-    if not user: return jsonify({"error": "User not found"}), 404
-    if user.role != 'admin': return jsonify({"error": "Forbidden: Admin access required"}), 403
-
     # Update expense status
     try:
         if Expense.update_status(expense_id, "rejected"):
@@ -399,47 +622,242 @@ def reject_expense_admin(expense_id):
         current_app.logger.error(f"Error rejecting expense {expense_id}: {e}")
         return jsonify({"error": "An internal error occurred"}), 500
 
+def expense_event_message(event):
+    """Formats a bus event as an SSE message; expense documents become admin list rows."""
+    event_id, event_type, data = event
+    if event_type in (EXPENSE_CREATED, EXPENSE_UPDATED):
+        data = {'expense': admin_expense_json(data['expense'])}
+    return format_sse(event_id, event_type, data)
+
+@bp.route('/api/admin/expenses/events', methods=['GET'])
+@login_required(role="admin", allow_query_token=True)
+def admin_expense_events():
+    """
+    Server-Sent Events stream of expense changes (see app/event_services.py):
+    expense.created / expense.updated (with the admin list row),
+    expense.status (ids and new status), expenses.imported and reset.
+    EventSource cannot set headers, so the token may be passed as ?token=.
+    Reconnecting browsers send Last-Event-ID and get the events they missed.
+    """
+    state = current_app.extensions['events']
+    if state['change_stream'] is not None:
+        state['change_stream'].ensure_started()
+    bus = state['bus']
+    heartbeat = current_app.config.get('EVENTS_HEARTBEAT_SECONDS', 15)
+    max_seconds = current_app.config.get('EVENTS_MAX_STREAM_SECONDS', 300)
+    subscription, backlog = bus.subscribe(request.headers.get('Last-Event-ID'))
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n" # Browser reconnect delay (ms)
+            for event in backlog:
+                yield expense_event_message(event)
+            deadline = time.monotonic() + max_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or (subscription.overflowed and subscription.queue.empty()):
+                    break # The browser reconnects and resumes from its Last-Event-ID
+                event = subscription.get(timeout=min(heartbeat, remaining))
+                yield expense_event_message(event) if event else ": keepalive\n\n"
+        finally:
+            bus.unsubscribe(subscription)
+
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Tell nginx not to buffer the stream
+    return response
+
+@bp.route('/api/admin/events/stats', methods=['GET'])
+@login_required(role="admin")
+def event_stream_stats():
+    return jsonify(current_app.extensions['events']['bus'].stats()), 200
+
+@bp.route('/api/admin/expenses/status', methods=['POST'])
+@login_required(role="admin")
+def bulk_update_expense_status():
+    """
+    Sets the status of many expenses in one request.
+    Body: {"ids": [...], "status": "approved" | "rejected" | "pending"}.
+    Responds with the IDs that matched, were not found, or were malformed.
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data, dict):
+        return jsonify({"error": "Invalid JSON payload or malformed JSON"}), 400
+
+    expense_ids = data.get('ids')
+    new_status = data.get('status')
+    if not isinstance(expense_ids, list) or not expense_ids or not all(isinstance(i, str) for i in expense_ids):
+        return jsonify({"error": "'ids' must be a non-empty list of expense IDs"}), 400
+    max_ids = current_app.config.get('BULK_STATUS_MAX_IDS', 1000)
+    if len(expense_ids) > max_ids:
+        return jsonify({"error": f"At most {max_ids} expenses can be updated at once"}), 400
+
+    try:
+        result = Expense.update_status_many(expense_ids, new_status)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error updating status of {len(expense_ids)} expenses: {e}")
+        return jsonify({"error": "An internal error occurred"}), 500
+
+    result['status'] = new_status
+    return jsonify(result), 200
+
+@bp.route('/api/admin/reports', methods=['GET'])
+@login_required(role="admin")
+def admin_spend_report():
+    """
+    Spend totals for a range of months, answered from the expense_rollups
+    collection rather than by scanning expenses.
+    Query: from, to (YYYY-MM, default: the current month), group_by
+    (comma-separated from user_id, month, currency, status; default month,currency)
+    and optional user_id / currency / status filters.
+    With reporting_currency=XXX all totals are converted to that currency
+    (and the default grouping drops currency).
+    """
+    current_month = datetime.utcnow().strftime('%Y-%m')
+    start_month = request.args.get('from', current_month)
+    end_month = request.args.get('to', start_month if 'from' in request.args else current_month)
+    reporting_currency = request.args.get('reporting_currency')
+    default_group_by = 'month' if reporting_currency else 'month,currency'
+    group_by = [dim for dim in request.args.get('group_by', default_group_by).split(',') if dim]
+    filters = {dim: request.args.get(dim) for dim in ('user_id', 'currency', 'status') if request.args.get(dim)}
+    try:
+        if reporting_currency:
+            reporting_currency = validate_currency(reporting_currency)
+        rows = get_report(start_month, end_month, group_by=group_by, filters=filters,
+                          reporting_currency=reporting_currency)
+    except ValueError as e:
+        return jsonify({"error": str(e), "dimensions": list(ROLLUP_DIMENSIONS)}), 400
+    return jsonify({"from": start_month, "to": end_month, "group_by": group_by, "filters": filters,
+                    "reporting_currency": reporting_currency, "rows": rows}), 200
+
+@bp.route('/api/admin/expenses/totals', methods=['GET'])
+@login_required(role="admin")
+def admin_expense_totals():
+    """
+    Total of all matching expenses converted to one currency with the FX rate
+    of each expense's date. Query: currency (default REPORTING_CURRENCY),
+    optional status, user_id and from / to dates (YYYY-MM-DD, inclusive).
+    """
+    query = {key: request.args.get(key) for key in ('status', 'user_id') if request.args.get(key)}
+    try:
+        to_currency = validate_currency(request.args.get('currency') or current_app.config.get('REPORTING_CURRENCY', 'USD'))
+        date_range = {}
+        if request.args.get('from'):
+            date_range['$gte'] = datetime.strptime(request.args['from'], '%Y-%m-%d')
+        if request.args.get('to'):
+            date_range['$lt'] = datetime.strptime(request.args['to'], '%Y-%m-%d') + timedelta(days=1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if date_range:
+        query['date'] = date_range
+
+    # Only the three fields the conversion needs come over the wire
+    docs = get_db().expenses.find(query, {'_id': 0, 'amount': 1, 'currency': 1, 'date': 1})
+    result = totals_from_cursor(docs, to_currency)
+    result['currency'] = to_currency
+    return jsonify(result), 200
+
+@bp.route('/api/admin/ocr/stats', methods=['GET'])
+@login_required(role="admin")
+def ocr_queue_stats():
+    # Queue depth and per-job wait/run timings for the background OCR workers.
+    return jsonify(get_ocr_queue().stats()), 200
+
+@bp.route('/api/admin/auth/cache-stats', methods=['GET'])
+@login_required(role="admin")
+def auth_cache_stats():
+    return jsonify(get_auth_cache_stats()), 200
+
 # Note: The old POST-only signup function was part of the combined_signup_route,
 # which is now correctly defined as POST-only.
 # The temporary GET handler for /signup was also part of combined_signup_route and is now removed.
 # The /show-routes-debug function was also removed.
 
+@bp.route('/api/admin/profiles', methods=['GET'])
+@login_required(role="admin")
+def admin_list_profiles():
+    # Captured request profiles, newest first (see app/profiling_services.py)
+    return jsonify({"enabled": current_app.extensions['profiling']['enabled'], "profiles": list_profiles()}), 200
+
+@bp.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+@login_required(role="admin")
+def admin_get_profile(profile_id):
+    """
+    Downloads one profile as a pstats .prof file, or with ?format=text the
+    top functions by cumulative time (?sort= any pstats sort key, e.g. tottime).
+    """
+    path = profile_path(profile_id)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    if request.args.get('format') == 'text':
+        try:
+            summary = profile_summary(path, sort=request.args.get('sort', 'cumulative'))
+        except KeyError:
+            return jsonify({"error": "Unknown sort key"}), 400
+        return Response(summary, mimetype='text/plain')
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f"{profile_id}.prof")
+
+@bp.route('/receipts/<key>')
+@login_required()
+def serve_receipt(key):
+    # Receipt URLs come from get_file_url_from_cloud(). Only the owner of an
+    # expense holding this receipt, or an admin, may fetch it; identical
+    # uploads share one key, so ownership is checked per expense.
+    key = secure_filename(key)
+    user = g.current_user
+    owner_filter = {'$or': [{'receipt_key': key}, {'receipt_cloud_path': f"{SIMULATED_CLOUD_FOLDER}/{key}"}]}
+    if user.role != 'admin':
+        owner_filter['user_id'] = user.username
+    if get_db().expenses.find_one(owner_filter, {'_id': 1}) is None:
+        abort(404) # Not found and not yours look the same
+
+    # Content-addressed keys name immutable bytes, so the browser may keep them;
+    # 'private' keeps shared proxies and CDNs from caching other people's receipts.
+    max_age = RECEIPT_CACHE_MAX_AGE if CONTENT_KEY_RE.match(key) else 0
+    backend = get_storage_backend()
+    local_path = backend.local_path(key)
+    if local_path is not None:
+        if not os.path.isfile(local_path):
+            abort(404)
+        response = send_file(local_path, max_age=max_age)
+    else:
+        if not backend.exists(key):
+            abort(404)
+        response = send_file(backend.open(key), mimetype=mimetypes.guess_type(key)[0] or 'application/octet-stream',
+                             max_age=max_age)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if max_age:
+        response.cache_control.immutable = True
+    return response
+
 @bp.route('/admindashboard.html')
 def serve_admin_dashboard():
-    # Determine the correct path to the frontend_web directory.
-    # current_app.root_path is typically the 'app' directory in this structure.
-    # So, os.path.dirname(current_app.root_path) gives the project root.
-    project_root_path = os.path.dirname(current_app.root_path)
-    frontend_web_dir = os.path.join(project_root_path, 'frontend_web')
-    return send_from_directory(frontend_web_dir, 'admindashboard.html')
+    # Pages and scripts come from an in-memory, precompressed bundle of
+    # frontend_web (see asset_services); nothing is read from disk per request.
+    return serve_asset('admindashboard.html')
 
 @bp.route('/js/<path:filename>')
 def serve_js(filename):
-    project_root_path = os.path.dirname(current_app.root_path)
-    js_dir = os.path.join(project_root_path, 'frontend_web', 'js')
-    return send_from_directory(js_dir, filename)
+    # Both the content-hashed URLs used by the pages and the plain file names
+    return serve_asset(f"js/{filename}")
 
 @bp.route('/')
 @bp.route('/login.html')
 def serve_login_page():
-    project_root_path = os.path.dirname(current_app.root_path)
-    frontend_web_dir = os.path.join(project_root_path, 'frontend_web')
-    return send_from_directory(frontend_web_dir, 'login.html')
+    return serve_asset('login.html')
 
 @bp.route('/signup.html')
 def serve_signup_page():
-    project_root_path = os.path.dirname(current_app.root_path)
-    frontend_web_dir = os.path.join(project_root_path, 'frontend_web')
-    return send_from_directory(frontend_web_dir, 'signup.html')
+    return serve_asset('signup.html')
 
 @bp.route('/expenses.html')
 def serve_expenses_page():
-    project_root_path = os.path.dirname(current_app.root_path)
-    frontend_web_dir = os.path.join(project_root_path, 'frontend_web')
-    return send_from_directory(frontend_web_dir, 'expenses.html')
+    return serve_asset('expenses.html')
 
 @bp.route('/expense_overview.html')
 def serve_expense_overview_page():
-    project_root_path = os.path.dirname(current_app.root_path)
-    frontend_web_dir = os.path.join(project_root_path, 'frontend_web')
-    return send_from_directory(frontend_web_dir, 'expense_overview.html')
+    return serve_asset('expense_overview.html')
@@ -0,0 +1,141 @@
+# app/search_services.py
+# Expense search and vendor autocomplete from maintained indexes.
+# Every expense document carries 'search_tokens': the normalized (lower-case,
+# accents stripped) words of its vendor and description plus their prefixes.
+# A search term therefore matches with an equality lookup on one multikey
+# index entry (see indexes.py), never with a regex scan, and the index's
+# (date, _id) suffix keeps results in listing order. Expense.to_document()
+# computes the tokens, so every insert, update and bulk import keeps them current.
+# 'vendor_suggestions' holds one document per (user, vendor) with the prefixes
+# of the vendor's name and a use count; autocomplete reads the top few entries
+# of a single index range. Documents written before this existed are
+# backfilled with `flask rebuild-search-index`.
+import re
+import unicodedata
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+
+from .database import get_db
+
+SUGGESTIONS_COLLECTION = 'vendor_suggestions'
+MIN_PREFIX_LENGTH = 2 # Shorter search terms would match a large share of all expenses
+MAX_PREFIX_LENGTH = 15 # Longer terms are matched on their first 15 characters
+MAX_DESCRIPTION_TOKENS = 40 # Bounds the index entries one long description can add
+MAX_QUERY_TERMS = 8
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text):
+    """Lower-case with accents removed: 'Café Zürich' -> 'cafe zurich'."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text):
+    """Normalized words of `text`, in order, without duplicates."""
+    return list(dict.fromkeys(_WORD_RE.findall(normalize(text))))
+
+
+def _prefixes(word, min_length=MIN_PREFIX_LENGTH):
+    return [word[:length] for length in range(min_length, min(len(word), MAX_PREFIX_LENGTH) + 1)]
+
+
+def search_tokens(vendor, description):
+    """The index entries for an expense: every prefix (2-15 characters) of every word."""
+    words = tokenize(vendor) + tokenize(description)[:MAX_DESCRIPTION_TOKENS]
+    tokens = set()
+    for word in words:
+        tokens.update(_prefixes(word) or [word]) # One-character words are kept whole
+    return sorted(tokens)
+
+
+def search_terms(text):
+    """
+    Index entries a search for `text` must all match: each word, cut to
+    MAX_PREFIX_LENGTH. Raises ValueError if nothing searchable is left.
+    """
+    words = [word[:MAX_PREFIX_LENGTH] for word in tokenize(text)]
+    words = [word for word in words if len(word) >= MIN_PREFIX_LENGTH]
+    if not words:
+        raise ValueError(f"Search terms must have at least {MIN_PREFIX_LENGTH} letters or digits")
+    # Longest first: the planner bounds the index scan on the first $all value
+    return sorted(words, key=len, reverse=True)[:MAX_QUERY_TERMS]
+
+
+# --- Vendor autocomplete ---
+
+def _vendor_prefixes(key):
+    # Prefixes of the whole name and of each word, so 'corp' finds 'Acme Corp'
+    prefixes = set(_prefixes(key, min_length=1))
+    for word in key.split():
+        prefixes.update(_prefixes(word, min_length=1))
+    return sorted(prefixes)
+
+
+def record_vendor_uses(pairs):
+    """Counts one use of each (user_id, vendor) in `pairs` (e.g. the expenses of an import batch)."""
+    counts = Counter()
+    names = {}
+    for user_id, vendor in pairs:
+        key = ' '.join(tokenize(vendor))
+        if user_id and key:
+            counts[(user_id, key)] += 1
+            names[(user_id, key)] = vendor.strip()
+    suggestions = get_db()[SUGGESTIONS_COLLECTION]
+    now = datetime.utcnow()
+    for (user_id, key), count in counts.items():
+        suggestions.update_one(
+            {'user_id': user_id, 'key': key},
+            {'$inc': {'count': count},
+             '$set': {'name': names[(user_id, key)], 'last_used': now, 'prefixes': _vendor_prefixes(key)}},
+            upsert=True
+        )
+
+
+def suggest_vendors(user_id, prefix, limit=10):
+    """The user's most used vendor names starting with `prefix` (at word boundaries)."""
+    key = ' '.join(tokenize(prefix))
+    if not key:
+        return []
+    query = {'user_id': user_id}
+    if len(key) <= MAX_PREFIX_LENGTH:
+        query['prefixes'] = key
+    else:
+        # Beyond the stored prefixes: narrow by the longest stored one, then check the rest
+        query['prefixes'] = key[:MAX_PREFIX_LENGTH]
+        query['key'] = {'$regex': '(^| )' + re.escape(key)}
+    docs = (get_db()[SUGGESTIONS_COLLECTION].find(query, {'_id': 0, 'name': 1})
+            .sort([('count', -1), ('key', 1)]).limit(limit))
+    return [doc['name'] for doc in docs]
+
+
+def rebuild_search_index():
+    """
+    Recomputes 'search_tokens' on every expense and the vendor suggestions from
+    scratch. Returns (expenses updated, suggestion documents).
+    """
+    db = get_db()
+    db[SUGGESTIONS_COLLECTION].delete_many({})
+    updated = 0
+    uses = Counter()
+    for doc in db.expenses.find({}, {'user_id': 1, 'vendor': 1, 'description': 1}):
+        tokens = search_tokens(doc.get('vendor'), doc.get('description'))
+        updated += db.expenses.update_one({'_id': doc['_id']}, {'$set': {'search_tokens': tokens}}).modified_count
+        uses[(doc.get('user_id'), doc.get('vendor'))] += 1
+    record_vendor_uses(uses.elements())
+    return updated, db[SUGGESTIONS_COLLECTION].count_documents({})
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Recompute expense search tokens and vendor suggestions from all expenses."""
+    updated, suggestions = rebuild_search_index()
+    click.echo(f"Updated {updated} expense(s); {suggestions} vendor suggestion(s).")
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_search_index_command)
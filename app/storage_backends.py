@@ -0,0 +1,207 @@
+# app/storage_backends.py
+# Storage backends behind upload_file_to_cloud / get_file_url_from_cloud /
+# delete_file_from_cloud. storage_services decides *what* to store (content
+# keys, reference counts); a backend only knows how to put, read and delete
+# objects by key.
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import uuid
+
+CONTENT_KEY_RE = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+
+class StorageBackend:
+    """
+    Interface for receipt storage.
+    Uploads are first written to a staging file (see new_staging_path) while they
+    are hashed, then committed under their content key with put_file.
+    """
+
+    def new_staging_path(self):
+        """Returns a local path the caller may write a new upload to."""
+        raise NotImplementedError
+
+    def put_file(self, key, staging_path):
+        """
+        Stores the staged file under `key` and consumes the staging file.
+        If `key` already exists the staged copy is discarded.
+        Returns True if a new object was written, False if it already existed.
+        """
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Deletes the object. Returns True if it existed."""
+        raise NotImplementedError
+
+    def open(self, key):
+        """Returns a readable binary file object for the stored object."""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Returns a local filesystem path for the object, or None for remote backends."""
+        return None
+
+
+class LocalShardedBackend(StorageBackend):
+    """
+    Stores objects on the local filesystem under nested prefix directories,
+    e.g. <root>/ab/cd/abcdef....pdf, so no single directory grows to hundreds
+    of thousands of entries. Content keys are sharded on their own leading hex
+    digits; other (legacy) names are sharded on a hash of the name.
+    """
+
+    STAGING_DIR = '.staging'
+
+    def __init__(self, root, depth=2, width=2):
+        self.root = root
+        self.depth = depth
+        self.width = width
+
+    def _shard_dirs(self, key):
+        digest = key if CONTENT_KEY_RE.match(key) else hashlib.sha256(key.encode()).hexdigest()
+        return [digest[i * self.width:(i + 1) * self.width] for i in range(self.depth)]
+
+    def path_for(self, key):
+        return os.path.join(self.root, *self._shard_dirs(key), key)
+
+    def new_staging_path(self):
+        # Staged in the same filesystem as the final location so put_file is a rename, not a copy.
+        staging_dir = os.path.join(self.root, self.STAGING_DIR)
+        os.makedirs(staging_dir, exist_ok=True)
+        return os.path.join(staging_dir, f"{uuid.uuid4().hex}.part")
+
+    def put_file(self, key, staging_path):
+        path = self.path_for(key)
+        if os.path.exists(path):
+            os.remove(staging_path)
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(staging_path, path)
+        return True
+
+    def local_path(self, key):
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            # Not yet moved by `flask migrate-storage`: fall back to the old flat layout.
+            flat_path = os.path.join(self.root, key)
+            if os.path.exists(flat_path):
+                return flat_path
+        return path
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def delete(self, key):
+        path = self.local_path(key)
+        if not os.path.exists(path):
+            return False
+        os.remove(path)
+        return True
+
+    def open(self, key):
+        return open(self.local_path(key), 'rb')
+
+    def migrate_flat_layout(self):
+        """
+        Moves files stored directly in the root directory into their shard
+        directories. Safe to re-run. Returns the number of files moved.
+        """
+        moved = 0
+        if not os.path.isdir(self.root):
+            return moved
+        for name in os.listdir(self.root):
+            flat_path = os.path.join(self.root, name)
+            if name.startswith('.') or not os.path.isfile(flat_path):
+                continue
+            path = self.path_for(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                os.remove(flat_path) # Same name already sharded; content keys name identical bytes
+            else:
+                os.replace(flat_path, path)
+            moved += 1
+        return moved
+
+
+class S3Backend(StorageBackend):
+    """
+    Stores objects in an S3-compatible bucket. `client` is anything with the
+    boto3 S3 client methods used here (upload_file, head_object, delete_object,
+    get_object), so the backend can be exercised against a local stand-in
+    such as MinIO (via S3_ENDPOINT_URL) or an in-memory fake in tests.
+    """
+
+    def __init__(self, client, bucket, prefix=''):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _object_key(self, key):
+        return f"{self.prefix}{key}"
+
+    @staticmethod
+    def _is_not_found(error):
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+        return code in ('404', 'NoSuchKey', 'NotFound')
+
+    def new_staging_path(self):
+        fd, path = tempfile.mkstemp(suffix='.part')
+        os.close(fd)
+        return path
+
+    def put_file(self, key, staging_path):
+        try:
+            if self.exists(key):
+                return False
+            self.client.upload_file(staging_path, self.bucket, self._object_key(key))
+            return True
+        finally:
+            os.remove(staging_path)
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except Exception as e:
+            if self._is_not_found(e):
+                return False
+            raise
+
+    def delete(self, key):
+        existed = self.exists(key)
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        return existed
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))['Body']
+
+    def download_to_temp(self, key):
+        """Copies the object to a local temp file (for OCR). The caller removes it."""
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        with os.fdopen(fd, 'wb') as out:
+            body = self.open(key)
+            shutil.copyfileobj(body, out)
+            if hasattr(body, 'close'):
+                body.close()
+        return path
+
+
+def create_storage_backend(config, local_root):
+    """Builds the backend selected by STORAGE_BACKEND ('local' or 's3')."""
+    kind = config.get('STORAGE_BACKEND', 'local')
+    if kind == 'local':
+        return LocalShardedBackend(local_root, depth=config.get('STORAGE_SHARD_DEPTH', 2))
+    if kind == 's3':
+        try:
+            import boto3 # Optional dependency, only needed for the S3 backend
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND='s3' requires the boto3 package.")
+        client = boto3.client('s3', endpoint_url=config.get('S3_ENDPOINT_URL'))
+        return S3Backend(client, config['S3_BUCKET'], prefix=config.get('S3_PREFIX', ''))
+    raise ValueError(f"Unknown STORAGE_BACKEND '{kind}'. Use 'local' or 's3'.")
@@ -1,82 +1,211 @@
 import os
+import hashlib
+import time
+from datetime import datetime, timedelta
+import click
 from werkzeug.utils import secure_filename
-from flask import current_app, url_for
+from flask import current_app
+from flask.cli import with_appcontext
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from .database import get_db
+from .metrics_services import STORAGE_SECONDS
+from .storage_backends import create_storage_backend, CONTENT_KEY_RE
 
 SIMULATED_CLOUD_FOLDER = 'cloud_simulator'
+# Uploads are copied to storage in chunks of this size while being hashed.
+INGEST_CHUNK_SIZE = 64 * 1024
+# A new reference to an object whose last reference is being released waits
+# (up to RELEASE_WAIT_ATTEMPTS polls) for the release to finish. A release
+# older than STALE_RELEASE_SECONDS is assumed to have died and is cleared.
+RELEASE_WAIT_SECONDS = 0.01
+RELEASE_WAIT_ATTEMPTS = 500
+STALE_RELEASE_SECONDS = 60
 
-def _ensure_simulated_cloud_folder_exists():
-    # Get base upload folder from app config
-    # current_app.config['UPLOAD_FOLDER'] is 'uploads' (relative to project root)
-    # project_root = os.path.dirname(current_app.root_path)
-    # base_upload_folder_path = os.path.join(project_root, current_app.config['UPLOAD_FOLDER'])
-    
-    # The provided snippet had a complex logic for base_upload_folder.
-    # Let's simplify assuming UPLOAD_FOLDER is relative to project root as configured.
+# Receipts are content-addressed: a stored object is named after the SHA-256 of
+# its bytes (plus the original extension, so it can be served with the right
+# content type). Identical uploads share one object, and since the bytes behind
+# a key can never change, receipt URLs are immutable and cacheable forever.
+# The 'receipt_blobs' collection counts how many expenses reference each object.
+# Releasing the last reference marks its document 'deleting' and keeps it until
+# the object is gone, so an ingest of the same bytes cannot join an object that
+# is about to disappear; it waits and then stores the object again.
+# Where the bytes live is up to the configured StorageBackend (app/storage_backends.py);
+# expenses keep the backend-independent path 'cloud_simulator/<key>'.
+
+def _simulated_cloud_root():
+    # UPLOAD_FOLDER is relative to the project root (or absolute)
     project_root = os.path.dirname(current_app.root_path) # <project_root>
     base_upload_folder_abs = os.path.join(project_root, current_app.config.get('UPLOAD_FOLDER', 'uploads'))
-    
-    cloud_dir = os.path.join(base_upload_folder_abs, SIMULATED_CLOUD_FOLDER)
+    return os.path.join(base_upload_folder_abs, SIMULATED_CLOUD_FOLDER)
+
+def get_storage_backend():
+    """Returns the app's StorageBackend, creating it on first use."""
+    backend = current_app.extensions.get('storage_backend')
+    if backend is None:
+        backend = create_storage_backend(current_app.config, _simulated_cloud_root())
+        current_app.extensions['storage_backend'] = backend
+    return backend
 
-    if not os.path.exists(cloud_dir):
-        os.makedirs(cloud_dir, exist_ok=True) # exist_ok=True is helpful
-    return cloud_dir
+def _key_from_cloud_path(cloud_path):
+    return os.path.basename(cloud_path)
+
+def content_key_for(sha256_hex, original_filename):
+    ext = os.path.splitext(secure_filename(original_filename))[1].lower()
+    return f"{sha256_hex}{ext}"
+
+def _take_reference(key, sha256_hex, size):
+    """Adds one reference to `key`, waiting out a release of its last reference."""
+    blobs = get_db().receipt_blobs
+    for _ in range(RELEASE_WAIT_ATTEMPTS):
+        try:
+            # Upserting past a 'deleting' document collides with its _id
+            blobs.update_one(
+                {'_id': key, 'deleting': {'$ne': True}},
+                {'$inc': {'refcount': 1},
+                 '$setOnInsert': {'sha256': sha256_hex, 'size': size, 'created_at': datetime.utcnow()}},
+                upsert=True
+            )
+            return
+        except DuplicateKeyError:
+            stale_before = datetime.utcnow() - timedelta(seconds=STALE_RELEASE_SECONDS)
+            blobs.delete_one({'_id': key, 'deleting': True, 'deleting_at': {'$lt': stale_before}})
+            time.sleep(RELEASE_WAIT_SECONDS)
+    raise OSError(f"Stored receipt {key} is still being deleted")
+
+def copy_and_hash(file_stream, dest_path):
+    """Copies a stream to dest_path in chunks. Returns (sha256 hex digest, size in bytes)."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(dest_path, 'wb') as out:
+        while True:
+            chunk = file_stream.read(INGEST_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            out.write(chunk)
+    return digest.hexdigest(), size
+
+@STORAGE_SECONDS.time('ingest') # Also covers upload_file_to_cloud, which delegates here
+def ingest_receipt(file_stream, original_filename, user_id):
+    """
+    Streams an upload into content-addressed storage in a single pass,
+    computing its SHA-256 and size on the way. The data goes to a staging file
+    provided by the backend; once the hash is known it is committed under its
+    content key, or discarded if an identical receipt is already stored.
+    Each call adds one reference to the stored object; release it with
+    delete_file_from_cloud().
+    Returns a dict with 'key', 'cloud_path', 'sha256', 'size' and 'deduplicated'.
+    """
+    backend = get_storage_backend()
+    staging_path = backend.new_staging_path()
+
+    try:
+        sha256_hex, size = copy_and_hash(file_stream, staging_path)
+        key = content_key_for(sha256_hex, original_filename)
+        # Take the reference before placing the file: once it is counted no
+        # release can delete the object, and put_file() stores the object again
+        # if it is missing (a release finished just before us).
+        _take_reference(key, sha256_hex, size)
+        deduplicated = not backend.put_file(key, staging_path)
+    finally:
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+
+    return {
+        'key': key,
+        # A "cloud path" - for simulation, this is relative to the SIMULATED_CLOUD_FOLDER
+        'cloud_path': f"{SIMULATED_CLOUD_FOLDER}/{key}",
+        'sha256': sha256_hex,
+        'size': size,
+        'deduplicated': deduplicated,
+    }
 
 def upload_file_to_cloud(file_stream, original_filename, user_id):
     """
     Placeholder for uploading a file to cloud storage.
-    Saves the file locally to 'uploads/cloud_simulator/' and returns a simulated cloud path.
+    Stores the file through the configured backend under its content key and returns a simulated cloud path.
     `file_stream` is the actual file object (e.g., request.files['receipt']).
     `original_filename` is the name of the file from the upload.
     `user_id` can be used to structure paths in a real cloud storage.
     """
-    cloud_dir = _ensure_simulated_cloud_folder_exists() # This is an absolute path
-    filename = secure_filename(original_filename)
-    
-    # Save the file
-    filepath = os.path.join(cloud_dir, filename) # cloud_dir is absolute
-    file_stream.save(filepath)
-    
-    # Return a "cloud path" - for simulation, this is relative to the SIMULATED_CLOUD_FOLDER
-    simulated_cloud_path = f"{SIMULATED_CLOUD_FOLDER}/{filename}"
-    return simulated_cloud_path
+    return ingest_receipt(file_stream, original_filename, user_id)['cloud_path']
+
+def get_local_path_for_cloud(cloud_path):
+    """
+    Returns the local filesystem path of a stored object, for consumers such as
+    OCR that read the stored receipt instead of keeping their own copy.
+    Returns None for remote backends; use the backend's download_to_temp() there.
+    """
+    if not cloud_path:
+        return None
+    return get_storage_backend().local_path(_key_from_cloud_path(cloud_path))
 
 def get_file_url_from_cloud(cloud_path):
     """
     Placeholder for getting a downloadable URL for a file from cloud storage.
+    Receipts are served by the /receipts/<key> route; content-addressed keys
+    never change, so these URLs can be cached indefinitely.
     """
     if not cloud_path:
         return None
-    # This assumes UPLOAD_FOLDER ('uploads') is served at the root of the domain,
-    # and cloud_path is 'cloud_simulator/filename.ext'.
-    # So the URL becomes /uploads/cloud_simulator/filename.ext
-    # This requires static file serving to be configured for the 'uploads' directory.
-    # For a pure placeholder, returning the path or a more abstract URL is fine.
-    # The example f"/uploads/{cloud_path}" is reasonable for a local sim.
-    base_served_path = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-    return f"/{base_served_path}/{cloud_path}" 
+    return f"/receipts/{_key_from_cloud_path(cloud_path)}"
 
+def _remove_stored_file(key):
+    try:
+        if get_storage_backend().delete(key):
+            current_app.logger.info(f"Successfully deleted stored receipt: {key}")
+            return True
+        current_app.logger.warning(f"Stored receipt not found for deletion: {key}")
+    except OSError as e:
+        current_app.logger.error(f"Error deleting stored receipt {key}: {e}")
+    return False
+
+@STORAGE_SECONDS.time('release')
 def delete_file_from_cloud(cloud_path):
     """
-    Placeholder for deleting a file from cloud storage.
-    Deletes the file from the local 'uploads/cloud_simulator/' directory.
-    cloud_path is 'cloud_simulator/filename.ext'
+    Releases one reference to a stored receipt.
+    The object itself is only deleted once no expense references it any more.
+    Files stored before content addressing (no reference count) are deleted directly.
+    cloud_path is 'cloud_simulator/<key>'
+    Returns True if a reference was released or a legacy file was deleted.
     """
     if not cloud_path:
         return False
-    
-    project_root = os.path.dirname(current_app.root_path)
-    base_upload_folder_abs = os.path.join(project_root, current_app.config.get('UPLOAD_FOLDER', 'uploads'))
-    # cloud_path already contains SIMULATED_CLOUD_FOLDER, so join directly with base_upload_folder_abs
-    filepath_to_delete = os.path.join(base_upload_folder_abs, cloud_path)
 
-    if os.path.exists(filepath_to_delete):
-        try:
-            os.remove(filepath_to_delete)
-            current_app.logger.info(f"Successfully deleted simulated cloud file: {filepath_to_delete}")
-            return True
-        except OSError as e:
-            current_app.logger.error(f"Error deleting simulated cloud file {filepath_to_delete}: {e}")
-            return False
-    else:
-        current_app.logger.warning(f"Simulated cloud file not found for deletion: {filepath_to_delete}")
-        return False
+    key = _key_from_cloud_path(cloud_path)
+    blobs = get_db().receipt_blobs
+    blob = blobs.find_one_and_update({'_id': key}, {'$inc': {'refcount': -1}},
+                                     return_document=ReturnDocument.AFTER)
+    if blob is None:
+        return _remove_stored_file(key)
+    if blob['refcount'] <= 0:
+        # Only the caller that marks the document deletes the file, and only if
+        # nobody took a new reference in the meantime. The marked document makes
+        # concurrent ingests wait until the file is gone (see _take_reference).
+        claimed = blobs.update_one({'_id': key, 'refcount': {'$lte': 0}, 'deleting': {'$ne': True}},
+                                   {'$set': {'deleting': True, 'deleting_at': datetime.utcnow()}})
+        if claimed.modified_count:
+            try:
+                _remove_stored_file(key)
+            finally:
+                blobs.delete_one({'_id': key, 'deleting': True})
+    return True
+
+def get_receipt_reference_count(key):
+    blob = get_db().receipt_blobs.find_one({'_id': key}, {'refcount': 1})
+    return blob['refcount'] if blob else 0
+
+@click.command('migrate-storage')
+@with_appcontext
+def migrate_storage_command():
+    """Move receipts from the flat cloud_simulator directory into sharded subdirectories."""
+    backend = get_storage_backend()
+    if not hasattr(backend, 'migrate_flat_layout'):
+        click.echo("The configured storage backend has no flat layout to migrate.")
+        return
+    click.echo(f"Moved {backend.migrate_flat_layout()} file(s) into the sharded layout.")
+
+def init_app(app):
+    app.cli.add_command(migrate_storage_command)
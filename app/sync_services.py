@@ -0,0 +1,130 @@
+# app/sync_services.py
+# Delta sync for offline-capable clients (GET /expenses/changes).
+# Every write stamps the expense with 'updated_at' (see app/models.py) and a
+# deleted expense leaves a tombstone in 'expense_tombstones'. A client keeps
+# the opaque token from its last sync and asks for what changed since: both
+# collections are read in (updated_at, _id) order from their
+# (user_id, updated_at, _id) indexes, so a sync costs what changed, not the
+# size of the history.
+# updated_at comes from the app servers' clocks, and a write stamped at t may
+# commit after a reader has already returned other changes stamped after t.
+# The token handed out at the end of a sync is therefore never later than
+# now - SYNC_OVERLAP_SECONDS: the next sync repeats that short window, and
+# clients apply changes idempotently (upsert / delete by id).
+# Tombstones expire after TOMBSTONE_RETENTION_SECONDS (TTL index); a token
+# older than that cannot tell about every deletion and is rejected, and the
+# client starts over with a full sync.
+import base64
+from datetime import datetime, timedelta
+
+import click
+from bson.objectid import ObjectId
+from flask.cli import with_appcontext
+
+from .database import get_db
+from .indexes import TOMBSTONE_RETENTION_SECONDS, available_hint
+
+TOMBSTONES_COLLECTION = 'expense_tombstones'
+SYNC_INDEX = 'user_id_1_updated_at_1__id_1'
+_MIN_OBJECT_ID = ObjectId('0' * 24)
+
+
+class SyncTokenExpired(ValueError):
+    """The token is older than the tombstone retention; a full sync is needed."""
+
+
+def encode_sync_token(updated_at, object_id):
+    raw = f"{updated_at.isoformat()}|{object_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_sync_token(token):
+    """Returns (updated_at, ObjectId). Raises ValueError if malformed, SyncTokenExpired if too old."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        time_part, id_part = base64.urlsafe_b64decode(padded.encode()).decode().split('|', 1)
+        position = datetime.fromisoformat(time_part), ObjectId(id_part)
+    except Exception:
+        raise ValueError("Invalid sync token")
+    if position[0] < datetime.utcnow() - timedelta(seconds=TOMBSTONE_RETENTION_SECONDS):
+        raise SyncTokenExpired("Sync token expired; start a full sync without 'since'")
+    return position
+
+
+def _after(position):
+    updated_at, object_id = position
+    return {'$or': [
+        {'updated_at': {'$gt': updated_at}},
+        {'updated_at': updated_at, '_id': {'$gt': object_id}},
+    ]}
+
+
+def _read(collection, user_id, position, limit, projection=None):
+    if position is not None:
+        query = dict(_after(position), user_id=user_id)
+    elif collection.name == TOMBSTONES_COLLECTION:
+        return [] # A full sync starts from nothing, so there is nothing to delete
+    else:
+        # Expenses not stamped yet are left to `flask backfill-updated-at`
+        query = {'user_id': user_id, 'updated_at': {'$gt': datetime.min}}
+    docs = collection.find(query, projection).sort([('updated_at', 1), ('_id', 1)]).limit(limit + 1)
+    if available_hint(collection, SYNC_INDEX): # Unhinted until `flask init-db` has built it
+        docs = docs.hint(SYNC_INDEX)
+    return list(docs)
+
+
+def get_changes(user_id, since=None, limit=500, overlap_seconds=5, projection=None):
+    """
+    Changes to `user_id`'s expenses after the `since` token (everything if None).
+    Returns (changed expense documents, deleted expense ids, next token, has_more).
+    Pass the next token back as `since`; while has_more is true, call again
+    straight away for the rest.
+    """
+    position = decode_sync_token(since) if since else None
+    db = get_db()
+    changed = _read(db.expenses, user_id, position, limit, projection)
+    deleted = _read(db[TOMBSTONES_COLLECTION], user_id, position, limit)
+
+    # Merge both streams in (updated_at, _id) order and keep the first `limit`
+    merged = sorted([(doc['updated_at'], doc['_id'], 'changed', doc) for doc in changed] +
+                    [(doc['updated_at'], doc['_id'], 'deleted', doc) for doc in deleted],
+                    key=lambda entry: (entry[0], entry[1]))
+    has_more = len(merged) > limit
+    page = merged[:limit]
+
+    if page:
+        position = (page[-1][0], page[-1][1])
+    if not has_more:
+        # Rewind into the overlap window so writes still in flight are not skipped
+        horizon = (datetime.utcnow() - timedelta(seconds=overlap_seconds), _MIN_OBJECT_ID)
+        position = min(position, horizon) if position is not None else horizon
+    return ([doc for _, _, kind, doc in page if kind == 'changed'],
+            [str(doc['_id']) for _, _, kind, doc in page if kind == 'deleted'],
+            encode_sync_token(*position), has_more)
+
+
+def record_tombstone(expense_id, user_id, deleted_at):
+    get_db()[TOMBSTONES_COLLECTION].replace_one(
+        {'_id': expense_id}, {'user_id': user_id, 'updated_at': deleted_at}, upsert=True)
+
+
+def backfill_updated_at():
+    """Sets updated_at = created_at on expenses written before updated_at existed. Returns the count."""
+    expenses = get_db().expenses
+    updated = 0
+    for doc in expenses.find({'updated_at': {'$exists': False}}, {'created_at': 1}):
+        stamp = doc.get('created_at') or doc['_id'].generation_time.replace(tzinfo=None)
+        updated += expenses.update_one({'_id': doc['_id'], 'updated_at': {'$exists': False}},
+                                       {'$set': {'updated_at': stamp}}).modified_count
+    return updated
+
+
+@click.command('backfill-updated-at')
+@with_appcontext
+def backfill_updated_at_command():
+    """Stamp updated_at on older expenses so /expenses/changes can return them."""
+    click.echo(f"Stamped {backfill_updated_at()} expense(s).")
+
+
+def init_app(app):
+    app.cli.add_command(backfill_updated_at_command)
@@ -1 +1,103 @@
 # Utility functions will be defined here
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    A small thread-safe LRU cache whose entries also expire after a time-to-live.
+    Each entry may carry its own expiry (e.g. a session's expires_at); the
+    effective expiry is whichever comes first. When the cache is full the least
+    recently used entry is evicted.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=60, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._data = OrderedDict() # key -> (value, expires_at_monotonic)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires = entry
+            if expires <= self._clock():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, self._clock() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def stream_json_page(docs, serialize, limit, make_cursor, key='expenses', batch_size=100):
+    """
+    Generator that encodes one page of documents as
+    {"<key>": [...], "next_cursor": ...} without building the whole list.
+
+    `docs` is an iterable yielding up to limit + 1 documents (see
+    Expense.find_page_documents); the extra document only tells us that another
+    page exists. Items are encoded `batch_size` at a time, so memory use depends
+    on the batch size, not on the number of results.
+    """
+    yield '{"%s": [' % key
+    batch = []
+    emitted = False
+    last_doc = None
+    next_cursor = None
+    for count, doc in enumerate(docs):
+        if count == limit:
+            next_cursor = make_cursor(last_doc)
+            break
+        batch.append(json.dumps(serialize(doc)))
+        last_doc = doc
+        if len(batch) >= batch_size:
+            yield (',' if emitted else '') + ','.join(batch)
+            emitted = True
+            batch = []
+    if batch:
+        yield (',' if emitted else '') + ','.join(batch)
+    yield '], "next_cursor": %s}' % json.dumps(next_cursor)
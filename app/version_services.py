@@ -0,0 +1,42 @@
+# app/version_services.py
+# Change versions for expense listings.
+# 'change_versions' holds a counter per user ('user:<username>') and one for
+# all expenses ('global'). Every write that can change what a listing shows
+# increments the owner's counter and the global one *after* the write, so a
+# reader that sees a version has also been able to see the data behind it.
+# The list endpoints derive their ETags from these counters and answer
+# If-None-Match with 304 after a single lookup here, without querying 'expenses'.
+import hashlib
+
+from .database import get_db
+
+VERSIONS_COLLECTION = 'change_versions'
+GLOBAL_KEY = 'global'
+
+
+def _user_key(user_id):
+    return f"user:{user_id}"
+
+
+def bump_versions(user_ids):
+    """Increments the global version and that of each user in `user_ids`."""
+    versions = get_db()[VERSIONS_COLLECTION]
+    for key in [_user_key(user_id) for user_id in dict.fromkeys(user_ids)] + [GLOBAL_KEY]:
+        versions.update_one({'_id': key}, {'$inc': {'version': 1}}, upsert=True)
+
+
+def get_version(user_id=None):
+    """The version of one user's expenses, or of all expenses if user_id is None."""
+    key = _user_key(user_id) if user_id is not None else GLOBAL_KEY
+    doc = get_db()[VERSIONS_COLLECTION].find_one({'_id': key}, {'version': 1})
+    return doc['version'] if doc else 0
+
+
+def listing_etag(scope, version, *parts):
+    """
+    Strong ETag (unquoted) for one listing response: who it is for, the data
+    version and everything in the request that shapes the body (page size,
+    cursor, filters).
+    """
+    raw = '|'.join(str(part) for part in (scope, version) + parts)
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
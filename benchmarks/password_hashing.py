@@ -0,0 +1,80 @@
+"""
+Password hashing throughput benchmark.
+
+Reports how many logins per second one core can sustain with the configured
+PASSWORD_HASH_METHOD / PASSWORD_HASH_ITERATIONS, and how throughput scales
+through the bounded PasswordHasher pool.  A login costs one hash check (plus
+one extra hash the first time an outdated hash is upgraded).
+
+    python benchmarks/password_hashing.py
+    python benchmarks/password_hashing.py --iterations 600000 --workers 4 --seconds 5
+
+Use the numbers to pick the work factor (slowest you can afford at peak
+login rate) and PASSWORD_HASH_WORKERS (cores you are willing to spend).
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.security import generate_password_hash, check_password_hash  # noqa: E402
+
+from config import Config  # noqa: E402
+from app.password_services import PasswordHasher, hash_method_string  # noqa: E402
+
+
+def single_core_rate(method, seconds):
+    password_hash = generate_password_hash('benchmark-password', method)
+    checks = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        check_password_hash(password_hash, 'benchmark-password')
+        checks += 1
+    return checks / (time.perf_counter() - started)
+
+
+def pool_rate(hasher, seconds, clients):
+    password_hash = hasher.hash('benchmark-password')
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        done = 0
+        while time.perf_counter() < deadline:
+            hasher.verify(password_hash, 'benchmark-password')
+            done += 1
+        return done
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        total = sum(pool.map(lambda _: client(), range(clients)))
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--method', default=Config.PASSWORD_HASH_METHOD)
+    parser.add_argument('--iterations', type=int, default=Config.PASSWORD_HASH_ITERATIONS)
+    parser.add_argument('--workers', type=int, default=Config.PASSWORD_HASH_WORKERS)
+    parser.add_argument('--clients', type=int, default=16, help='concurrent simulated login requests')
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    method = hash_method_string(args.method, args.iterations)
+    print(f"method: {method}")
+
+    per_core = single_core_rate(method, args.seconds)
+    print(f"single core:        {per_core:8.1f} logins/s  ({1000 / per_core:.1f} ms per check)")
+
+    hasher = PasswordHasher(args.method, args.iterations, max_workers=args.workers,
+                            max_pending=args.clients, queue_timeout=60)
+    pooled = pool_rate(hasher, args.seconds, args.clients)
+    hasher.shutdown()
+    print(f"pool ({args.workers} workers):    {pooled:8.1f} logins/s  ({pooled / args.workers:.1f} per worker, "
+          f"{args.clients} concurrent clients, {os.cpu_count()} cores available)")
+
+
+if __name__ == '__main__':
+    main()
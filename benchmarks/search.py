@@ -0,0 +1,117 @@
+"""
+Search and vendor autocomplete latency benchmark.
+
+Needs a real MongoDB (mongomock has no indexes to measure). Seeds --expenses
+synthetic expenses into a scratch database, creates the declared indexes,
+then times one page of search results and vendor suggestions the way the
+endpoints run them, and reports latency percentiles.
+
+    MONGODB_URI=mongodb://localhost:27017 python benchmarks/search.py
+    python benchmarks/search.py --expenses 1000000 --queries 500 --keep
+
+The scratch database (--database) is dropped afterwards unless --keep is
+given; a kept database is reused by the next run instead of seeding again.
+Exits with status 1 if the p95 of either query type exceeds --budget-ms.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+WORDS = ('lunch dinner taxi hotel flight train parking fuel coffee printer paper client team '
+         'conference software license office supplies shuttle airport workshop training').split()
+VENDOR_PARTS = ('acme globex initech umbrella stark wayne wonka cyberdyne hooli vandelay '
+                'soylent tyrell massive dynamic oscorp aperture black mesa gringotts').split()
+
+
+def seed(count, users, batch_size=5000):
+    from app.database import get_db
+    from app.models import Expense
+    from app.search_services import record_vendor_uses
+
+    rng = random.Random(42)
+    vendors = [f"{a.title()} {b.title()}" for a in VENDOR_PARTS for b in VENDOR_PARTS if a != b]
+    expenses = get_db().expenses
+    for start in range(0, count, batch_size):
+        docs = []
+        for _ in range(min(batch_size, count - start)):
+            expense = Expense(user_id=f"user{rng.randrange(users)}", amount=round(rng.uniform(1, 500), 2),
+                              currency='USD', date_str=f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                              vendor=rng.choice(vendors), description=' '.join(rng.sample(WORDS, 3)),
+                              receipt_cloud_path=None)
+            docs.append(expense.to_document())
+        expenses.insert_many(docs, ordered=False)
+        record_vendor_uses((doc['user_id'], doc['vendor']) for doc in docs)
+        print(f"\rseeded {start + len(docs)}/{count}", end='', flush=True)
+    print()
+
+
+def time_ms(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1], samples[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--expenses', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--database', default='expense_search_bench')
+    parser.add_argument('--budget-ms', type=float, default=20.0)
+    parser.add_argument('--keep', action='store_true', help='keep the seeded database for the next run')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_NAME'] = args.database
+    from app import create_app
+    from app.database import get_db
+    from app.indexes import ensure_indexes
+    from app.models import Expense
+    from app.search_services import search_terms, suggest_vendors
+
+    app = create_app()
+    failed = False
+    with app.app_context():
+        db = get_db()
+        if db.expenses.estimated_document_count() < args.expenses:
+            db.expenses.drop()
+            db.vendor_suggestions.drop()
+            ensure_indexes(db)
+            seed(args.expenses, args.users)
+        else:
+            ensure_indexes(db)
+
+        rng = random.Random(7)
+
+        def search():
+            terms = search_terms(f"{rng.choice(VENDOR_PARTS)[:3]} {rng.choice(WORDS)}")
+            list(Expense.find_page_documents(Expense.listing_query({'q': terms}), limit=50,
+                                             projection=Expense.ADMIN_LIST_PROJECTION))
+
+        def suggest():
+            suggest_vendors(f"user{rng.randrange(args.users)}", rng.choice(VENDOR_PARTS)[:rng.randint(1, 4)])
+
+        print(f"{db.expenses.estimated_document_count()} expenses, {db.vendor_suggestions.estimated_document_count()} vendor suggestions")
+        for label, fn in (('search page (50 rows)', search), ('vendor suggestions', suggest)):
+            p50, p95, worst = time_ms(fn, args.queries)
+            print(f"{label:24s} p50 {p50:6.2f} ms   p95 {p95:6.2f} ms   max {worst:6.2f} ms")
+            failed = failed or p95 > args.budget_ms
+
+        if not args.keep:
+            db.client.drop_database(args.database)
+
+    if failed:
+        print(f"FAIL: p95 exceeds the {args.budget_ms:.0f} ms budget")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Cold start benchmark.
+
+Starts fresh Python processes that import the app and call create_app(), the
+work a pre-forked worker does before it can serve, and reports the time taken.
+MongoDB is pointed at an unroutable address by default. create_app() must not
+touch the database, so a slow or unreachable Mongo should not affect startup.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 10 --budget 0.5 --mongodb-uri mongodb://db.internal:27017
+
+Exits with status 1 if the median startup time exceeds --budget seconds.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = """
+import time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app()
+done = time.perf_counter()
+print(f"{imported - started} {done - imported}")
+"""
+
+
+def measure_once(env):
+    result = subprocess.run([sys.executable, '-c', CHILD], cwd=PROJECT_ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    import_seconds, create_seconds = map(float, result.stdout.split()[-2:])
+    return import_seconds, create_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=1.0, help='allowed median seconds for import + create_app()')
+    # 10.255.255.1 is not routable: any connection attempt would hang until the timeout
+    parser.add_argument('--mongodb-uri', default='mongodb://10.255.255.1:27017/?serverSelectionTimeoutMS=30000')
+    args = parser.parse_args()
+
+    env = dict(os.environ, MONGODB_URI=args.mongodb_uri,
+               ENSURE_INDEXES_ON_STARTUP='false', SEED_ON_STARTUP='false')
+    samples = [measure_once(env) for _ in range(args.runs)]
+    imports = [s[0] for s in samples]
+    creates = [s[1] for s in samples]
+    totals = [a + b for a, b in samples]
+
+    print(f"runs: {args.runs}  (MONGODB_URI={args.mongodb_uri})")
+    print(f"import app:    median {statistics.median(imports) * 1000:7.1f} ms")
+    print(f"create_app():  median {statistics.median(creates) * 1000:7.1f} ms")
+    print(f"total:         median {statistics.median(totals) * 1000:7.1f} ms   max {max(totals) * 1000:7.1f} ms")
+
+    if statistics.median(totals) > args.budget:
+        print(f"FAIL: startup exceeds the {args.budget:.2f}s budget")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
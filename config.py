@@ -17,6 +17,113 @@ class Config:
     # Based on user's URI appName=Revio1, but allow override.
     DATABASE_NAME_FALLBACK = 'Revio1' # Or a more generic 'expense_app_db'
     DATABASE_NAME = os.environ.get('DATABASE_NAME') or DATABASE_NAME_FALLBACK
+
+    # Password hashing (app/password_services.py). Hashes made with another method or
+    # iteration count are upgraded on the user's next successful login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256'
+    PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS') or 260000)
+    # Hashing runs on this many threads per worker process (roughly: cores you are willing
+    # to spend on logins); at most PASSWORD_HASH_MAX_PENDING more requests wait, for up to
+    # PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS, before login/signup answer 503.
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING') or 32)
+    PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS') or 2.0)
+
+    # MongoClient connection pool (one client is shared per worker process).
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE') or 100)
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE') or 0)
+    # Close pooled connections idle for longer than this. None keeps them open indefinitely.
+    MONGO_MAX_IDLE_TIME_MS = int(os.environ['MONGO_MAX_IDLE_TIME_MS']) if os.environ.get('MONGO_MAX_IDLE_TIME_MS') else None
+    # How long a request may wait for a free pooled connection. None waits indefinitely.
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ['MONGO_WAIT_QUEUE_TIMEOUT_MS']) if os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS') else None
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS') or 5000)
+    # Indexes (app/indexes.py) are created with `flask init-db` and demo users with
+    # `flask seed`. For local development they can instead run in create_app(), at
+    # the cost of Mongo round trips (and password hashes) before the app can serve.
+    ENSURE_INDEXES_ON_STARTUP = os.environ.get('ENSURE_INDEXES_ON_STARTUP', 'false').lower() in ('1', 'true', 'yes')
+    SEED_ON_STARTUP = os.environ.get('SEED_ON_STARTUP', 'false').lower() in ('1', 'true', 'yes')
+
+    # In-process session/user cache used by app.auth. The TTL bounds how long a
+    # role change made by another worker process can go unnoticed.
+    AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CACHE_MAX_ENTRIES') or 10000)
+    AUTH_CACHE_TTL_SECONDS = int(os.environ.get('AUTH_CACHE_TTL_SECONDS') or 60)
+
+    # Receipt storage: 'local' (sharded directories under UPLOAD_FOLDER/cloud_simulator) or 's3'.
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND') or 'local'
+    STORAGE_SHARD_DEPTH = int(os.environ.get('STORAGE_SHARD_DEPTH') or 2)
+    # S3 settings; S3_ENDPOINT_URL points at an S3-compatible stand-in such as MinIO.
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX') or 'receipts/'
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+
+    # Receipt OCR runs on a background pool: 'thread', 'process', or 'sync' (inline, for development).
+    OCR_EXECUTOR = os.environ.get('OCR_EXECUTOR') or 'thread'
+    OCR_MAX_WORKERS = int(os.environ.get('OCR_MAX_WORKERS') or 2)
+    # In-process cache of OCR results by receipt SHA-256 (filled by POST /receipts/scan).
+    OCR_CACHE_MAX_ENTRIES = int(os.environ.get('OCR_CACHE_MAX_ENTRIES') or 1000)
+    OCR_CACHE_TTL_SECONDS = int(os.environ.get('OCR_CACHE_TTL_SECONDS') or 3600)
+
+    # Expense listings are paginated; clients may ask for up to EXPENSES_MAX_PAGE_SIZE rows.
+    EXPENSES_DEFAULT_PAGE_SIZE = int(os.environ.get('EXPENSES_DEFAULT_PAGE_SIZE') or 50)
+    EXPENSES_MAX_PAGE_SIZE = int(os.environ.get('EXPENSES_MAX_PAGE_SIZE') or 200)
+    # Listings are streamed from the Mongo cursor; this many rows are encoded per chunk.
+    EXPENSES_STREAM_BATCH_SIZE = int(os.environ.get('EXPENSES_STREAM_BATCH_SIZE') or 100)
+
+    # POST /expenses/import writes valid rows with insert_many in batches of this size
+    # and reports at most BULK_IMPORT_MAX_ERRORS row errors in its response.
+    BULK_IMPORT_BATCH_SIZE = int(os.environ.get('BULK_IMPORT_BATCH_SIZE') or 1000)
+    BULK_IMPORT_MAX_ERRORS = int(os.environ.get('BULK_IMPORT_MAX_ERRORS') or 1000)
+    # Most expense IDs accepted by one POST /api/admin/expenses/status call.
+    BULK_STATUS_MAX_IDS = int(os.environ.get('BULK_STATUS_MAX_IDS') or 1000)
+
+    # FX rates for totals across currencies (app/fx_services.py). Rates are base-currency
+    # units per unit of a currency, read from FX_RATES_FILE (CSV: date,currency,rate) or,
+    # if unset, from the fx_rates collection; cached in memory for FX_CACHE_TTL_SECONDS.
+    FX_BASE_CURRENCY = os.environ.get('FX_BASE_CURRENCY') or 'USD'
+    FX_RATES_FILE = os.environ.get('FX_RATES_FILE')
+    FX_CACHE_TTL_SECONDS = int(os.environ.get('FX_CACHE_TTL_SECONDS') or 3600)
+    REPORTING_CURRENCY = os.environ.get('REPORTING_CURRENCY') or 'USD'
+
+    # JSON responses are gzip/brotli-compressed for clients that accept it; buffered
+    # bodies only from COMPRESSION_MIN_SIZE bytes (streamed listings always).
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE') or 1024)
+    COMPRESSION_LEVEL = int(os.environ.get('COMPRESSION_LEVEL') or 6)
+    # Live dashboard updates (app/event_services.py): 'local' publishes from this process'
+    # writes; 'change_stream' tails MongoDB (replica set required) so all workers see all writes.
+    EVENTS_SOURCE = os.environ.get('EVENTS_SOURCE') or 'local'
+    EVENTS_HISTORY_SIZE = int(os.environ.get('EVENTS_HISTORY_SIZE') or 1000)
+    EVENTS_SUBSCRIBER_QUEUE_SIZE = int(os.environ.get('EVENTS_SUBSCRIBER_QUEUE_SIZE') or 100)
+    # Streams send a comment every EVENTS_HEARTBEAT_SECONDS to keep proxies from timing out and
+    # end after EVENTS_MAX_STREAM_SECONDS (the browser reconnects), so no worker thread is held forever.
+    EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS') or 15)
+    EVENTS_MAX_STREAM_SECONDS = float(os.environ.get('EVENTS_MAX_STREAM_SECONDS') or 300)
+
+    # GET /expenses/changes (delta sync) returns at most SYNC_MAX_PAGE_SIZE changes per call.
+    SYNC_DEFAULT_PAGE_SIZE = int(os.environ.get('SYNC_DEFAULT_PAGE_SIZE') or 500)
+    SYNC_MAX_PAGE_SIZE = int(os.environ.get('SYNC_MAX_PAGE_SIZE') or 2000)
+    # Each sync re-reads the last few seconds so writes still committing are never skipped.
+    SYNC_OVERLAP_SECONDS = float(os.environ.get('SYNC_OVERLAP_SECONDS') or 5)
+
+    # GET /metrics (Prometheus text format). Set METRICS_TOKEN to require
+    # "Authorization: Bearer <METRICS_TOKEN>" from the scraper; the MongoDB
+    # connection pool gauges are only exported once a token is set.
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+
+    # Per-request cProfile capture (app/profiling_services.py). When enabled, admins
+    # profile a request by sending "X-Profile: 1"; PROFILING_SAMPLE_RATE also
+    # profiles that share of all requests. The newest PROFILING_MAX_FILES
+    # profiles are kept in PROFILING_DIR (relative to the project root, or absolute).
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE') or 0.0)
+    PROFILING_DIR = os.environ.get('PROFILING_DIR') or 'profiles'
+    PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES') or 50)
+
+    # frontend_web is compressed once, at the highest level, when first served.
+    # Set STATIC_ASSETS_AUTO_RELOAD while editing the frontend to rebuild on every request.
+    STATIC_COMPRESSION_LEVEL = int(os.environ.get('STATIC_COMPRESSION_LEVEL') or 9)
+    STATIC_ASSETS_AUTO_RELOAD = os.environ.get('STATIC_ASSETS_AUTO_RELOAD', 'false').lower() in ('1', 'true', 'yes')
     
     # Add other configurations like database URI later
     # SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or         #    'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'app.db')
@@ -25,10 +25,31 @@ document.addEventListener('DOMContentLoaded', function () {
     // Other admin dashboard specific JavaScript can go here...
     console.log('Admin dashboard loaded for admin user.');
 
+    // Search box: reload the first page for the new terms once typing pauses
+    const searchInput = document.getElementById('adminExpenseSearch');
+    if (searchInput) {
+        let searchTimer = null;
+        searchInput.addEventListener('input', function () {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => {
+                adminExpensesSearch = searchInput.value.trim();
+                fetchAndDisplayAdminExpenses();
+            }, 250);
+        });
+    }
+
     fetchAndDisplayAdminExpenses(); // Fetch and display expenses
 });
 
-async function fetchAndDisplayAdminExpenses() {
+// Pagination state for the expenses table. The API returns one page at a time
+// plus an opaque next_cursor; further pages are loaded as the admin scrolls.
+const ADMIN_EXPENSES_PAGE_SIZE = 50;
+let adminExpensesNextCursor = null;
+let adminExpensesLoading = false;
+let adminExpensesReloadQueued = false; // A fresh first page was asked for while one was in flight
+let adminExpensesSearch = ''; // Current search terms (?q=)
+
+async function fetchAndDisplayAdminExpenses(append = false) {
     const token = getToken(); // From auth_utils.js
     if (!token) {
         // This case should ideally be caught by redirectToLoginIfNoToken,
@@ -45,13 +66,35 @@ async function fetchAndDisplayAdminExpenses() {
         return;
     }
 
-    // Clear previous content and show loading message
-    expensesTableBody.innerHTML = '';
+    if (append && !adminExpensesNextCursor) {
+        return; // There is nothing more to load
+    }
+    if (adminExpensesLoading) {
+        // A page is already in flight. Extra scroll loads can be dropped, but a
+        // reload (new search terms, live update) must run once it has finished.
+        if (!append) {
+            adminExpensesReloadQueued = true;
+        }
+        return;
+    }
+    adminExpensesLoading = true;
+
+    let url = `/api/admin/expenses?limit=${ADMIN_EXPENSES_PAGE_SIZE}`;
+    if (adminExpensesSearch) {
+        url += `&q=${encodeURIComponent(adminExpensesSearch)}`;
+    }
+    if (append) {
+        url += `&cursor=${encodeURIComponent(adminExpensesNextCursor)}`;
+    } else {
+        // Clear previous content and show loading message
+        expensesTableBody.innerHTML = '';
+        adminExpensesNextCursor = null;
+    }
     expensesMessage.textContent = 'Loading expenses...';
     expensesMessage.className = 'text-blue-600 text-base mb-4'; // Style for loading message
 
     try {
-        const response = await fetch('/api/admin/expenses', {
+        const response = await fetchWithETag(url, {
             method: 'GET',
             headers: {
                 'Authorization': `Bearer ${token}`,
@@ -60,48 +103,12 @@ async function fetchAndDisplayAdminExpenses() {
         });
 
         if (response.ok) {
-            const expenses = await response.json();
-            if (expenses && expenses.length > 0) {
+            const page = await response.json();
+            const expenses = page.expenses || [];
+            adminExpensesNextCursor = page.next_cursor || null;
+            if (expenses.length > 0 || append) {
                 expensesMessage.textContent = ''; // Clear loading message
-                expenses.forEach(expense => {
-                    const row = expensesTableBody.insertRow();
-                    row.insertCell().textContent = expense.employee_id || 'N/A';
-                    row.insertCell().textContent = expense.amount ? expense.amount.toFixed(2) : '0.00';
-                    row.insertCell().textContent = expense.currency || 'N/A';
-                    row.insertCell().textContent = expense.date ? new Date(expense.date).toLocaleDateString() : 'N/A';
-                    row.insertCell().textContent = expense.vendor || 'N/A';
-                    row.insertCell().textContent = expense.description || 'N/A';
-                    
-                    // Style status based on its value
-                    const statusCell = row.insertCell();
-                    statusCell.textContent = expense.status || 'N/A';
-                    if (expense.status === 'approved') {
-                        statusCell.className = 'text-green-600 font-semibold';
-                    } else if (expense.status === 'rejected') {
-                        statusCell.className = 'text-red-600 font-semibold';
-                    } else if (expense.status === 'pending') {
-                        statusCell.className = 'text-yellow-600 font-semibold';
-                    }
-                    
-                    const actionsCell = row.insertCell();
-                    if (expense.status === 'pending') {
-                        const approveButton = document.createElement('button');
-                        approveButton.textContent = 'Approve';
-                        approveButton.className = 'bg-green-500 hover:bg-green-700 text-white text-xs py-1 px-2 rounded mr-1';
-                        approveButton.setAttribute('data-expense-id', expense.id);
-                        approveButton.setAttribute('data-action', 'approve');
-                        actionsCell.appendChild(approveButton);
-
-                        const rejectButton = document.createElement('button');
-                        rejectButton.textContent = 'Reject';
-                        rejectButton.className = 'bg-red-500 hover:bg-red-700 text-white text-xs py-1 px-2 rounded';
-                        rejectButton.setAttribute('data-expense-id', expense.id);
-                        rejectButton.setAttribute('data-action', 'reject');
-                        actionsCell.appendChild(rejectButton);
-                    } else {
-                        actionsCell.textContent = 'N/A'; // Or leave empty
-                    }
-                });
+                expenses.forEach(expense => appendAdminExpenseRow(expensesTableBody, expense));
             } else {
                 expensesMessage.textContent = 'No expenses submitted yet.';
                 expensesMessage.className = 'text-gray-500 text-base mb-4';
@@ -123,9 +130,103 @@ async function fetchAndDisplayAdminExpenses() {
     } catch (error) {
         console.error('Network or other error fetching expenses:', error);
         displayErrorMessage('Failed to fetch expenses due to a network or server error. Please try again later.');
+    } finally {
+        adminExpensesLoading = false;
+    }
+
+    if (adminExpensesReloadQueued) {
+        adminExpensesReloadQueued = false;
+        fetchAndDisplayAdminExpenses(); // Replaces what was just shown with the current terms
+        return;
+    }
+
+    // If the first pages do not fill the window there is nothing to scroll, so keep loading.
+    if (adminExpensesNextCursor && isNearPageBottom()) {
+        fetchAndDisplayAdminExpenses(true);
     }
 }
 
+function appendAdminExpenseRow(expensesTableBody, expense) {
+    const row = buildAdminExpenseRow(expense);
+    expensesTableBody.appendChild(row);
+    return row;
+}
+
+function buildAdminExpenseRow(expense) {
+    const row = document.createElement('tr');
+    row.setAttribute('data-expense-id', expense.id);
+    row.setAttribute('data-date', expense.date || ''); // Lets live updates insert rows in list order
+
+    row.insertCell().setAttribute('data-role', 'select');
+    row.insertCell().textContent = expense.employee_id || 'N/A';
+    row.insertCell().textContent = expense.amount ? expense.amount.toFixed(2) : '0.00';
+    row.insertCell().textContent = expense.currency || 'N/A';
+    row.insertCell().textContent = expense.date ? new Date(expense.date).toLocaleDateString() : 'N/A';
+    row.insertCell().textContent = expense.vendor || 'N/A';
+    row.insertCell().textContent = expense.description || 'N/A';
+    row.insertCell().setAttribute('data-role', 'status');
+    row.insertCell().setAttribute('data-role', 'actions');
+    renderStatusCells(row, expense.id, expense.status);
+    return row;
+}
+
+// Fills the status, actions and selection cells of a row for `status`.
+// Only pending expenses can be approved/rejected or selected for bulk actions.
+function renderStatusCells(row, expenseId, status) {
+    const selectCell = row.querySelector('[data-role="select"]');
+    selectCell.innerHTML = '';
+    if (status === 'pending') {
+        const checkbox = document.createElement('input');
+        checkbox.type = 'checkbox';
+        checkbox.className = 'expense-select';
+        checkbox.value = expenseId;
+        selectCell.appendChild(checkbox);
+    }
+
+    // Style status based on its value
+    const statusCell = row.querySelector('[data-role="status"]');
+    statusCell.textContent = status || 'N/A';
+    statusCell.className = '';
+    if (status === 'approved') {
+        statusCell.className = 'text-green-600 font-semibold';
+    } else if (status === 'rejected') {
+        statusCell.className = 'text-red-600 font-semibold';
+    } else if (status === 'pending') {
+        statusCell.className = 'text-yellow-600 font-semibold';
+    }
+
+    const actionsCell = row.querySelector('[data-role="actions"]');
+    actionsCell.innerHTML = '';
+    if (status === 'pending') {
+        const approveButton = document.createElement('button');
+        approveButton.textContent = 'Approve';
+        approveButton.className = 'bg-green-500 hover:bg-green-700 text-white text-xs py-1 px-2 rounded mr-1';
+        approveButton.setAttribute('data-expense-id', expenseId);
+        approveButton.setAttribute('data-action', 'approve');
+        actionsCell.appendChild(approveButton);
+
+        const rejectButton = document.createElement('button');
+        rejectButton.textContent = 'Reject';
+        rejectButton.className = 'bg-red-500 hover:bg-red-700 text-white text-xs py-1 px-2 rounded';
+        rejectButton.setAttribute('data-expense-id', expenseId);
+        rejectButton.setAttribute('data-action', 'reject');
+        actionsCell.appendChild(rejectButton);
+    } else {
+        actionsCell.textContent = status === 'approved' ? 'Approved' : status === 'rejected' ? 'Rejected' : 'N/A';
+    }
+}
+
+function isNearPageBottom() {
+    return window.innerHeight + window.scrollY >= document.documentElement.scrollHeight - 200;
+}
+
+// Infinite scroll: load the next page when the admin nears the bottom of the table.
+window.addEventListener('scroll', function () {
+    if (adminExpensesNextCursor && isNearPageBottom()) {
+        fetchAndDisplayAdminExpenses(true);
+    }
+});
+
 function displayErrorMessage(message) {
     const expensesMessage = document.getElementById('expensesMessage');
     if (expensesMessage) {
@@ -190,22 +291,9 @@ async function handleExpenseAction(expenseId, actionType, buttonElement) {
             // Update UI
             const row = buttonElement.closest('tr');
             if (row) {
-                // Assuming status is the 7th cell (index 6)
-                const statusCell = row.cells[6]; 
-                statusCell.textContent = newStatus;
-                statusCell.className = newStatus === 'approved' ? 'text-green-600 font-semibold' : 'text-red-600 font-semibold';
-                
-                // Remove buttons from actions cell (8th cell, index 7)
-                const actionsCell = row.cells[7];
-                actionsCell.innerHTML = newStatus === 'approved' ? 'Approved' : 'Rejected'; // Or just 'N/A'
-            }
-            // Display temporary success message (optional)
-            const expensesMessage = document.getElementById('expensesMessage');
-            if (expensesMessage) {
-                expensesMessage.textContent = successMessage;
-                expensesMessage.className = 'text-green-600 text-base mb-4 font-semibold';
-                setTimeout(() => { if(expensesMessage.textContent === successMessage) expensesMessage.textContent = ''; }, 3000);
+                applyStatusToRow(row, newStatus);
             }
+            displaySuccessMessage(successMessage);
         } else {
             const errorData = await response.json().catch(() => ({ error: `Failed to ${actionType} expense.` }));
             let errorMessage = `Error ${actionType}ing expense: ${response.status} ${response.statusText}`;
@@ -231,3 +319,185 @@ async function handleExpenseAction(expenseId, actionType, buttonElement) {
         if(otherButton) otherButton.disabled = false;
     }
 }
+
+function applyStatusToRow(row, newStatus) {
+    renderStatusCells(row, row.getAttribute('data-expense-id'), newStatus);
+    updateBulkActionState();
+}
+
+function displaySuccessMessage(message) {
+    // Display temporary success message
+    const expensesMessage = document.getElementById('expensesMessage');
+    if (expensesMessage) {
+        expensesMessage.textContent = message;
+        expensesMessage.className = 'text-green-600 text-base mb-4 font-semibold';
+        setTimeout(() => { if(expensesMessage.textContent === message) expensesMessage.textContent = ''; }, 3000);
+    }
+}
+
+// --- Multi-select and bulk approve/reject ---
+// Ticked rows are sent in one POST /api/admin/expenses/status request instead
+// of one approve/reject request per expense.
+
+function getSelectedExpenseIds() {
+    return Array.from(document.querySelectorAll('#expensesTableBody input.expense-select:checked')).map(cb => cb.value);
+}
+
+function updateBulkActionState() {
+    const selectedCount = getSelectedExpenseIds().length;
+    const countLabel = document.getElementById('selectedCount');
+    if (countLabel) countLabel.textContent = `${selectedCount} selected`;
+    ['bulkApproveButton', 'bulkRejectButton'].forEach(id => {
+        const button = document.getElementById(id);
+        if (button) button.disabled = selectedCount === 0;
+    });
+    const selectAll = document.getElementById('selectAllExpenses');
+    if (selectAll && selectedCount === 0) selectAll.checked = false;
+}
+
+async function handleBulkStatusAction(newStatus) {
+    const token = getToken();
+    if (!token) {
+        displayErrorMessage('Authentication token not found. Please log in.');
+        redirectToLoginIfNoToken();
+        return;
+    }
+    const ids = getSelectedExpenseIds();
+    if (ids.length === 0) return;
+
+    const bulkButtons = ['bulkApproveButton', 'bulkRejectButton'].map(id => document.getElementById(id)).filter(Boolean);
+    bulkButtons.forEach(button => button.disabled = true);
+
+    try {
+        const response = await fetch('/api/admin/expenses/status', {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${token}`,
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ ids: ids, status: newStatus })
+        });
+        const result = await response.json().catch(() => ({}));
+
+        if (response.ok) {
+            (result.matched || []).forEach(expenseId => {
+                const row = document.querySelector(`#expensesTableBody tr[data-expense-id="${expenseId}"]`);
+                if (row) applyStatusToRow(row, newStatus);
+            });
+            let message = `${(result.matched || []).length} expense(s) ${newStatus}.`;
+            const skipped = (result.not_found || []).length + (result.invalid || []).length;
+            if (skipped > 0) message += ` ${skipped} could not be found.`;
+            displaySuccessMessage(message);
+        } else {
+            if (response.status === 401 || response.status === 403) {
+                clearAuthData();
+                window.location.href = 'login.html';
+                return;
+            }
+            displayErrorMessage(`Error updating expenses: ${response.status} ${response.statusText}` + (result.error ? ` - ${result.error}` : ''));
+        }
+    } catch (error) {
+        console.error('Network or other error during bulk status update:', error);
+        displayErrorMessage('Failed to update expenses due to a network or server error.');
+    } finally {
+        updateBulkActionState();
+    }
+}
+
+document.addEventListener('DOMContentLoaded', function () {
+    const expensesTableBody = document.getElementById('expensesTableBody');
+    if (expensesTableBody) {
+        expensesTableBody.addEventListener('change', function (event) {
+            if (event.target.classList.contains('expense-select')) updateBulkActionState();
+        });
+    }
+
+    const selectAll = document.getElementById('selectAllExpenses');
+    if (selectAll) {
+        selectAll.addEventListener('change', function () {
+            document.querySelectorAll('#expensesTableBody input.expense-select').forEach(cb => cb.checked = selectAll.checked);
+            updateBulkActionState();
+        });
+    }
+
+    const bulkApproveButton = document.getElementById('bulkApproveButton');
+    if (bulkApproveButton) bulkApproveButton.addEventListener('click', () => handleBulkStatusAction('approved'));
+    const bulkRejectButton = document.getElementById('bulkRejectButton');
+    if (bulkRejectButton) bulkRejectButton.addEventListener('click', () => handleBulkStatusAction('rejected'));
+});
+
+// --- Live updates ---
+// GET /api/admin/expenses/events streams expense changes made by anyone (this
+// admin, other admins, employees submitting). Rows are patched in place, so
+// the list is never refetched after an approve/reject. EventSource reconnects
+// by itself and sends Last-Event-ID, so nothing is missed across reconnects.
+
+function findExpenseRow(expenseId) {
+    return document.querySelector(`#expensesTableBody tr[data-expense-id="${expenseId}"]`);
+}
+
+let liveReloadTimer = null;
+function scheduleLiveReload() {
+    // Imports and resets can arrive in bursts; reload the first page once
+    clearTimeout(liveReloadTimer);
+    liveReloadTimer = setTimeout(() => fetchAndDisplayAdminExpenses(), 500);
+}
+
+function insertLiveExpenseRow(expense) {
+    const expensesTableBody = document.getElementById('expensesTableBody');
+    if (!expensesTableBody || findExpenseRow(expense.id)) return;
+    if (adminExpensesSearch) return; // Cannot tell client-side whether it matches the search
+    // Rows are ordered newest first; put the expense before the first older one
+    const olderRow = Array.from(expensesTableBody.rows).find(row => (row.getAttribute('data-date') || '') < (expense.date || ''));
+    if (olderRow) {
+        expensesTableBody.insertBefore(buildAdminExpenseRow(expense), olderRow);
+    } else if (!adminExpensesNextCursor) {
+        expensesTableBody.appendChild(buildAdminExpenseRow(expense)); // Belongs at the end of a fully loaded list
+    } // Otherwise it is on a page not loaded yet and arrives with scrolling
+    const expensesMessage = document.getElementById('expensesMessage');
+    if (expensesMessage && expensesMessage.textContent === 'No expenses submitted yet.') expensesMessage.textContent = '';
+}
+
+function connectExpenseEvents() {
+    const token = getToken();
+    if (!token || typeof EventSource === 'undefined') return;
+    const source = new EventSource(`/api/admin/expenses/events?token=${encodeURIComponent(token)}`);
+
+    source.addEventListener('expense.created', event => {
+        insertLiveExpenseRow(JSON.parse(event.data).expense);
+    });
+    source.addEventListener('expense.updated', event => {
+        const expense = JSON.parse(event.data).expense;
+        const row = findExpenseRow(expense.id);
+        if (row) {
+            row.replaceWith(buildAdminExpenseRow(expense));
+            updateBulkActionState();
+        }
+    });
+    source.addEventListener('expense.status', event => {
+        const data = JSON.parse(event.data);
+        data.ids.forEach(expenseId => {
+            const row = findExpenseRow(expenseId);
+            if (row) renderStatusCells(row, expenseId, data.status);
+        });
+        updateBulkActionState();
+    });
+    source.addEventListener('expense.deleted', event => {
+        JSON.parse(event.data).ids.forEach(expenseId => {
+            const row = findExpenseRow(expenseId);
+            if (row) row.remove();
+        });
+        updateBulkActionState();
+    });
+    source.addEventListener('expenses.imported', scheduleLiveReload);
+    source.addEventListener('reset', scheduleLiveReload);
+    source.onerror = () => {
+        // The browser retries on its own; a closed stream here usually means the session ended
+        if (source.readyState === EventSource.CLOSED) console.warn('Expense event stream closed.');
+    };
+    return source;
+}
+
+document.addEventListener('DOMContentLoaded', function () {
+    if (getUserRole() === 'admin') connectExpenseEvents();
+});
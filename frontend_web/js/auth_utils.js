@@ -30,6 +30,48 @@ function getUserRole() {
 function clearAuthData() {
     localStorage.removeItem('authToken');
     localStorage.removeItem('userData');
+    clearETagCache();
+}
+
+const ETAG_CACHE_PREFIX = 'etag-cache:';
+
+// GET with If-None-Match. The last body for each URL is kept in sessionStorage
+// together with its ETag; a 304 from the server is answered from that copy, so
+// callers always get a normal 200 response to read JSON from.
+async function fetchWithETag(url, options = {}) {
+    const cacheKey = ETAG_CACHE_PREFIX + url;
+    let cached = null;
+    try {
+        cached = JSON.parse(sessionStorage.getItem(cacheKey));
+    } catch (e) {
+        cached = null;
+    }
+
+    const headers = Object.assign({}, options.headers);
+    if (cached && cached.etag) {
+        headers['If-None-Match'] = cached.etag;
+    }
+    const response = await fetch(url, Object.assign({}, options, { headers: headers }));
+
+    if (response.status === 304 && cached) {
+        return new Response(cached.body, { status: 200, headers: { 'Content-Type': 'application/json' } });
+    }
+    const etag = response.headers.get('ETag');
+    if (response.ok && etag) {
+        const body = await response.clone().text();
+        try {
+            sessionStorage.setItem(cacheKey, JSON.stringify({ etag: etag, body: body }));
+        } catch (e) {
+            // Storage full: just don't cache this listing
+        }
+    }
+    return response;
+}
+
+function clearETagCache() {
+    Object.keys(sessionStorage)
+        .filter(key => key.startsWith(ETAG_CACHE_PREFIX))
+        .forEach(key => sessionStorage.removeItem(key));
 }
 
 function redirectToLoginIfNoToken() {
@@ -59,18 +59,63 @@ document.addEventListener('DOMContentLoaded', function () {
         `;
     };
 
-    // Function to fetch and render expenses
-    const loadExpenses = async () => {
+    // Pagination state: /expenses returns one page plus an opaque next_cursor.
+    const PAGE_SIZE = 20;
+    let nextCursor = null;
+    let isLoadingExpenses = false;
+    let reloadQueued = false; // Filters changed while a page was in flight
+    let filterGeneration = 0; // Bumped on every filter change; pages fetched for older filters are dropped
+
+    // Filters are applied by the server (GET /expenses?status=...&from=...&to=...)
+    const activeFilters = {};
+    const STATUS_CYCLE = ['', 'pending', 'approved', 'rejected'];
+
+    const buildExpensesUrl = (cursor) => {
+        const params = new URLSearchParams({ limit: PAGE_SIZE });
+        Object.entries(activeFilters).forEach(([key, value]) => {
+            if (value) params.set(key, value);
+        });
+        if (cursor) params.set('cursor', cursor);
+        return API_BASE_URL + '/expenses?' + params.toString();
+    };
+
+    const setButtonLabel = (button, text) => {
+        const label = button.querySelector('p');
+        if (label) label.textContent = text;
+    };
+
+    const reloadWithFilters = () => {
+        filterGeneration += 1;
+        nextCursor = null;
+        loadExpenses();
+    };
+
+    const isNearPageBottom = () => window.innerHeight + window.scrollY >= document.documentElement.scrollHeight - 200;
+
+    // Function to fetch and render expenses. With append=true the next page is added below the current list.
+    const loadExpenses = async (append = false) => {
         const authToken = getToken(); // Use getToken() from auth_utils.js
         if (!authToken) { // Should have been redirected by redirectToLoginIfNoToken, but good to double check
             if(recentSubmissionsContainer) recentSubmissionsContainer.innerHTML = '<p class="px-4 text-red-500">Please log in to see expenses.</p>';
             if(pastExpensesContainer) pastExpensesContainer.innerHTML = '';
             return;
         }
+        if (append && !nextCursor) {
+            return; // There is nothing more to load
+        }
+        if (isLoadingExpenses) {
+            // A page is already in flight. Extra scroll loads can be dropped, but a
+            // reload for new filters must run once it has finished.
+            if (!append) reloadQueued = true;
+            return;
+        }
+        isLoadingExpenses = true;
+        const generation = filterGeneration;
+
+        const url = buildExpensesUrl(append ? nextCursor : null);
 
         try {
-            // Note: The fetch URL will be updated in a subsequent subtask to use API_BASE_URL
-            const response = await fetch(API_BASE_URL + '/expenses', { // Updated to use API_BASE_URL
+            const response = await fetchWithETag(url, { // Revalidates with If-None-Match; 304s are served from the cached page
                 headers: { 'Authorization': 'Bearer ' + authToken }
             });
             if (!response.ok) {
@@ -80,9 +125,14 @@ document.addEventListener('DOMContentLoaded', function () {
                 }
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
-            const expenses = await response.json();
+            const page = await response.json();
+            if (generation !== filterGeneration) {
+                return; // Fetched for filters that have since changed; the queued reload runs instead
+            }
+            const expenses = page.expenses || [];
+            nextCursor = page.next_cursor || null;
 
-            if (recentSubmissionsContainer) {
+            if (recentSubmissionsContainer && !append) {
                 recentSubmissionsContainer.innerHTML = ''; 
                 expenses.slice(0, 3).forEach(expense => {
                     recentSubmissionsContainer.innerHTML += createExpenseItemHTML(expense);
@@ -93,11 +143,11 @@ document.addEventListener('DOMContentLoaded', function () {
             }
 
             if (pastExpensesContainer) {
-                pastExpensesContainer.innerHTML = ''; 
+                if (!append) pastExpensesContainer.innerHTML = ''; 
                 expenses.forEach(expense => { 
-                    pastExpensesContainer.innerHTML += createExpenseItemHTML(expense);
+                    pastExpensesContainer.insertAdjacentHTML('beforeend', createExpenseItemHTML(expense));
                 });
-                 if (expenses.length === 0 && recentSubmissionsContainer.innerHTML.includes('No recent submissions')) {
+                 if (append || (expenses.length === 0 && recentSubmissionsContainer.innerHTML.includes('No recent submissions'))) {
                  } else if (expenses.length === 0) {
                      pastExpensesContainer.innerHTML = '<p class="px-4 text-gray-500">No past expenses found.</p>';
                 }
@@ -105,10 +155,31 @@ document.addEventListener('DOMContentLoaded', function () {
 
         } catch (error) {
             console.error('Error fetching expenses:', error);
-            if(recentSubmissionsContainer) recentSubmissionsContainer.innerHTML = `<p class="px-4 text-red-500">Error loading expenses: ${error.message}</p>`;
+            if(recentSubmissionsContainer && !append && generation === filterGeneration) recentSubmissionsContainer.innerHTML = `<p class="px-4 text-red-500">Error loading expenses: ${error.message}</p>`;
+        } finally {
+            isLoadingExpenses = false;
+            if (reloadQueued) {
+                reloadQueued = false;
+                loadExpenses(); // Replaces what is shown with the current filters
+            }
+        }
+        if (generation !== filterGeneration) {
+            return; // Superseded by a reload for newer filters
+        }
+
+        // If the first pages do not fill the window there is nothing to scroll, so keep loading.
+        if (nextCursor && isNearPageBottom()) {
+            loadExpenses(true);
         }
     };
 
+    // Infinite scroll: fetch the next page as the user nears the bottom.
+    window.addEventListener('scroll', () => {
+        if (nextCursor && isNearPageBottom()) {
+            loadExpenses(true);
+        }
+    });
+
     // Event Listeners
     if (addExpenseButton) {
         addExpenseButton.addEventListener('click', () => {
@@ -118,9 +189,8 @@ document.addEventListener('DOMContentLoaded', function () {
 
     if (searchButton && searchInput) {
         searchButton.addEventListener('click', () => {
-            const searchTerm = searchInput.value;
-            console.log('Search term:', searchTerm);
-            alert('Search functionality to be implemented. Searched for: ' + searchTerm);
+            activeFilters.q = searchInput.value.trim(); // Matched server-side against vendor and description
+            reloadWithFilters();
         });
     }
     
@@ -134,8 +204,28 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     if (categoryFilterButton) categoryFilterButton.addEventListener('click', () => alert('Category filter functionality to be implemented.'));
-    if (dateFilterButton) dateFilterButton.addEventListener('click', () => alert('Date filter functionality to be implemented.'));
-    if (statusFilterButton) statusFilterButton.addEventListener('click', () => alert('Status filter functionality to be implemented.'));
+    if (dateFilterButton) {
+        dateFilterButton.addEventListener('click', () => {
+            const from = prompt('Show expenses from (YYYY-MM-DD, leave empty for no limit):', activeFilters.from || '');
+            if (from === null) return; // Cancelled
+            const to = prompt('Show expenses up to (YYYY-MM-DD, leave empty for no limit):', activeFilters.to || '');
+            if (to === null) return;
+            activeFilters.from = from.trim();
+            activeFilters.to = to.trim();
+            setButtonLabel(dateFilterButton, activeFilters.from || activeFilters.to
+                ? `${activeFilters.from || '…'} – ${activeFilters.to || '…'}` : 'Date');
+            reloadWithFilters();
+        });
+    }
+    if (statusFilterButton) {
+        // Each click moves to the next status: all -> pending -> approved -> rejected -> all
+        statusFilterButton.addEventListener('click', () => {
+            const next = STATUS_CYCLE[(STATUS_CYCLE.indexOf(activeFilters.status || '') + 1) % STATUS_CYCLE.length];
+            activeFilters.status = next;
+            setButtonLabel(statusFilterButton, next ? next.charAt(0).toUpperCase() + next.slice(1) : 'Status');
+            reloadWithFilters();
+        });
+    }
     if (chatWithAIButton) chatWithAIButton.addEventListener('click', () => alert('Chat with AI functionality to be implemented.'));
 
     loadExpenses();
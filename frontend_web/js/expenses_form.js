@@ -44,6 +44,63 @@ document.addEventListener('DOMContentLoaded', function () {
         messageContainer.style.marginBottom = '10px';
     };
 
+    // Scan the receipt as soon as it is chosen and pre-fill empty fields from OCR.
+    // The server caches the result by file content, so submitting the same
+    // receipt afterwards does not run OCR a second time.
+    receiptInput.addEventListener('change', async function () {
+        if (!receiptInput.files || !receiptInput.files[0]) return;
+        const authToken = getToken();
+        if (!authToken) return;
+
+        const scanData = new FormData();
+        scanData.append('receipt', receiptInput.files[0]);
+        try {
+            const response = await fetch(API_BASE_URL + '/receipts/scan', {
+                method: 'POST',
+                headers: { 'Authorization': 'Bearer ' + authToken },
+                body: scanData
+            });
+            if (!response.ok) return; // Pre-fill is best effort; the form still works without it
+            const ocr = (await response.json()).ocr_data || {};
+            if (ocr.ocr_vendor && !expenseNameInput.value) expenseNameInput.value = ocr.ocr_vendor;
+            if (ocr.ocr_amount != null && !amountInput.value) amountInput.value = ocr.ocr_amount;
+            if (ocr.ocr_date && !dateInput.value) dateInput.value = ocr.ocr_date;
+        } catch (error) {
+            console.error('Receipt scan error:', error);
+        }
+    });
+
+    // Vendor autocomplete from the user's previous expenses (GET /vendors/suggest).
+    // Requests are debounced and a response for an outdated prefix is ignored.
+    const vendorSuggestions = document.getElementById('vendorSuggestions');
+    let suggestTimer = null;
+    let latestPrefix = '';
+    expenseNameInput.addEventListener('input', function () {
+        clearTimeout(suggestTimer);
+        const prefix = expenseNameInput.value.trim();
+        latestPrefix = prefix;
+        if (!vendorSuggestions || !prefix) return;
+        suggestTimer = setTimeout(async () => {
+            const authToken = getToken();
+            if (!authToken) return;
+            try {
+                const response = await fetch(API_BASE_URL + '/vendors/suggest?prefix=' + encodeURIComponent(prefix), {
+                    headers: { 'Authorization': 'Bearer ' + authToken }
+                });
+                if (!response.ok || prefix !== latestPrefix) return;
+                const vendors = (await response.json()).vendors || [];
+                vendorSuggestions.innerHTML = '';
+                vendors.forEach(name => {
+                    const option = document.createElement('option');
+                    option.value = name;
+                    vendorSuggestions.appendChild(option);
+                });
+            } catch (error) {
+                console.error('Vendor suggestion error:', error); // Autocomplete is optional
+            }
+        }, 150);
+    });
+
     submitButton.addEventListener('click', async function (event) {
         event.preventDefault();
         displayMessage(''); 
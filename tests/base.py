@@ -11,7 +11,7 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from app import create_app, models
+from app import create_app, models, database
 from app.database import get_db # For clearing collections
 import mongomock
 from unittest.mock import patch
@@ -23,6 +23,8 @@ class BaseTestCase(unittest.TestCase):
         self.mock_mongo_client = mongomock.MongoClient()
         # Configure the mock constructor to return our mongomock client instance
         mock_mongo_constructor.return_value = self.mock_mongo_client
+        # The client is process-wide, so drop any client left over from a previous test.
+        database.close_mongo_client()
 
         self.app = create_app()
         self.app.config['TESTING'] = True
@@ -41,6 +43,9 @@ class BaseTestCase(unittest.TestCase):
         models.create_dummy_users()
 
     def tearDown(self):
+        # Let background OCR jobs finish before the database goes away
+        self.app.extensions['ocr_queue'].shutdown(wait=True)
+
         # Clear mongomock collections after each test
         # Ensure an app context is active for get_db() to work correctly
         # (it relies on current_app and g)
@@ -60,6 +65,7 @@ class BaseTestCase(unittest.TestCase):
                 self.mock_mongo_client.drop_database(db_name)
 
         self.app_context.pop() 
+        database.close_mongo_client()
         shutil.rmtree(self.temp_upload_folder)
         # The patch applied via decorator to setUp stops automatically.
 
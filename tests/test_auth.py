@@ -0,0 +1,56 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from tests.base import BaseTestCase
+from app.models import User, Admin
+
+
+class TestAuthCache(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = self.login_as('emp1', 'emp1pass')
+        self.headers = {'Authorization': f'Bearer {self.token}'}
+        self.cache = self.app.extensions['auth_cache']
+
+    def test_cached_request_skips_database(self):
+        self.assertEqual(self.client.get('/me', headers=self.headers).status_code, 200)
+        with patch('app.auth.get_db', side_effect=AssertionError("database should not be hit")), \
+             patch.object(User, 'get_by_username', side_effect=AssertionError("database should not be hit")):
+            response = self.client.get('/me', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['username'], 'emp1')
+        self.assertEqual(self.cache.sessions.hits, 1)
+
+    def test_logout_invalidates_cached_session(self):
+        self.client.get('/me', headers=self.headers)
+        self.client.post('/logout', headers=self.headers)
+        response = self.client.get('/me', headers=self.headers)
+        self.assertEqual(response.status_code, 401)
+
+    def test_role_change_invalidates_cached_user(self):
+        self.client.get('/me', headers=self.headers)
+        Admin('emp1', User.get_by_username('emp1').password_hash, _is_from_db=True).save()
+        response = self.client.get('/me', headers=self.headers)
+        self.assertEqual(response.json['role'], 'admin')
+
+    def test_cached_session_honors_expires_at(self):
+        self.client.get('/me', headers=self.headers)
+        self.cache.sessions.get(self.token)['expires_at'] = datetime.utcnow() - timedelta(seconds=1)
+        response = self.client.get('/me', headers=self.headers)
+        self.assertEqual(response.status_code, 401)
+        self.assertIsNone(self.cache.sessions.get(self.token))
+
+    def test_cache_stats_admin_only(self):
+        response = self.client.get('/api/admin/auth/cache-stats', headers=self.headers)
+        self.assertEqual(response.status_code, 403)
+
+        admin_token = self.login_as('admin1', 'admin1pass')
+        response = self.client.get('/api/admin/auth/cache-stats', headers={'Authorization': f'Bearer {admin_token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hits', response.json['sessions'])
+        self.assertIn('misses', response.json['users'])
+
+
+if __name__ == '__main__':
+    unittest.main()
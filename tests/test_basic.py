@@ -1,5 +1,6 @@
 import unittest
 import json
+import hashlib
 from io import BytesIO
 import os
 import sys # Added for path adjustment if needed, though BaseTestCase handles it
@@ -8,7 +9,9 @@ import sys # Added for path adjustment if needed, though BaseTestCase handles it
 # BaseTestCase already adds project_root to sys.path
 from tests.base import BaseTestCase 
 from app.models import User, Employee, Admin, Expense # Added Expense
+from unittest.mock import patch
 from app.storage_services import SIMULATED_CLOUD_FOLDER # To check paths
+from app.database import get_db
 from bson.objectid import ObjectId # Added ObjectId
 
 
@@ -144,13 +147,36 @@ class TestExpenseRoutes(BaseTestCase):
         self.assertEqual(json_response['expense']['amount'], 100.50)
         self.assertEqual(json_response['expense']['vendor'], 'Test Vendor')
         self.assertIn('ocr_data', json_response) 
-        self.assertTrue(json_response['expense']['receipt_url'].endswith(f'{SIMULATED_CLOUD_FOLDER}/receipt.pdf')) # Changed to .pdf
+        # Receipts are content-addressed: stored and served under their SHA-256
+        receipt_key = hashlib.sha256(receipt_content).hexdigest() + '.pdf'
+        self.assertEqual(json_response['expense']['receipt_url'], f'/receipts/{receipt_key}')
         
         # Check if file was "uploaded"
         # self.app.config['UPLOAD_FOLDER'] is the temp_upload_folder (absolute path)
-        expected_receipt_path = os.path.join(self.app.config['UPLOAD_FOLDER'], SIMULATED_CLOUD_FOLDER, 'receipt.pdf') # Changed to .pdf
+        # Stored in the sharded layout: cloud_simulator/<first 2 hex>/<next 2 hex>/<key>
+        expected_receipt_path = os.path.join(self.app.config['UPLOAD_FOLDER'], SIMULATED_CLOUD_FOLDER,
+                                             receipt_key[:2], receipt_key[2:4], receipt_key)
         self.assertTrue(os.path.exists(expected_receipt_path))
 
+    def test_submit_expense_single_pass_ingestion(self):
+        receipt_content = b"single pass receipt" * 10000
+        data = {'amount': '5.00', 'date': '2024-01-15', 'vendor': 'Hash Co',
+                'receipt': (BytesIO(receipt_content), 'hashed.pdf')}
+        with patch('app.ocr_queue.extract_text_from_receipt', return_value={'ocr_status': 'SUCCESS'}) as mock_ocr:
+            response = self.client.post('/expenses', headers={'Authorization': f'Bearer {self.employee_token}'},
+                                        data=data, content_type='multipart/form-data')
+            self.assertEqual(response.status_code, 201, msg=response.get_data(as_text=True))
+            self.app.extensions['ocr_queue'].wait(timeout=5)
+
+        expense = Expense.get_by_id(response.get_json()['expense']['id'])
+        self.assertEqual(expense.receipt_sha256, hashlib.sha256(receipt_content).hexdigest())
+        self.assertEqual(expense.receipt_size, len(receipt_content))
+        # OCR was handed the stored object, and no temp copy was written
+        key = expense.receipt_key
+        stored_path = os.path.join(self.app.config['UPLOAD_FOLDER'], SIMULATED_CLOUD_FOLDER, key[:2], key[2:4], key)
+        mock_ocr.assert_called_once_with(stored_path)
+        self.assertFalse(os.path.exists(os.path.join(self.app.config['UPLOAD_FOLDER'], 'temp_for_ocr')))
+
 
     def test_submit_expense_missing_data(self):
         data = {'amount': '50'} 
@@ -188,7 +214,7 @@ class TestExpenseRoutes(BaseTestCase):
 
         response = self.client.get('/expenses', headers={'Authorization': f'Bearer {self.employee_token}'})
         self.assertEqual(response.status_code, 200)
-        expenses_json = response.get_json()
+        expenses_json = response.get_json()['expenses']
         self.assertEqual(len(expenses_json), 1)
         # Verify using the ID from the submission response
         retrieved_expense = None
@@ -200,7 +226,7 @@ class TestExpenseRoutes(BaseTestCase):
         self.assertIsNotNone(retrieved_expense, "Submitted expense not found in GET response.")
         self.assertEqual(retrieved_expense['amount'], 123.45)
         self.assertEqual(retrieved_expense['vendor'], 'My Vendor')
-        self.assertTrue(retrieved_expense['receipt_url'].endswith(f'{SIMULATED_CLOUD_FOLDER}/my_receipt.pdf'))
+        self.assertEqual(retrieved_expense['receipt_url'], f'/receipts/{hashlib.sha256(b"receipt data").hexdigest()}.pdf')
 
     def test_get_expenses_unauthorized(self):
         # Create emp2 if it doesn't exist. User.save() now uses mongomock.
@@ -219,7 +245,7 @@ class TestExpenseRoutes(BaseTestCase):
         # emp2 tries to get expenses, should only see their own (none in this case)
         response_emp2_gets_expenses = self.client.get('/expenses', headers={'Authorization': f'Bearer {other_employee_token}'})
         self.assertEqual(response_emp2_gets_expenses.status_code, 200)
-        self.assertEqual(len(response_emp2_gets_expenses.get_json()), 0, 
+        self.assertEqual(len(response_emp2_gets_expenses.get_json()['expenses']), 0, 
                          "emp2 should not see emp1's expenses.")
 
 # --- Admin Expense Routes Tests ---
@@ -258,7 +284,7 @@ class TestAdminExpenseRoutes(BaseTestCase):
 
         response = self.client.get('/api/admin/expenses', headers={'Authorization': f'Bearer {self.admin_token}'})
         self.assertEqual(response.status_code, 200)
-        data = response.get_json()
+        data = response.get_json()['expenses']
         self.assertIsInstance(data, list)
         self.assertEqual(len(data), 2)
         # Check for required fields in one of the expenses
@@ -276,10 +302,112 @@ class TestAdminExpenseRoutes(BaseTestCase):
     def test_get_all_expenses_admin_no_expenses(self):
         response = self.client.get('/api/admin/expenses', headers={'Authorization': f'Bearer {self.admin_token}'})
         self.assertEqual(response.status_code, 200)
-        data = response.get_json()
+        data = response.get_json()['expenses']
         self.assertIsInstance(data, list)
         self.assertEqual(len(data), 0)
 
+    def test_get_all_expenses_admin_pagination(self):
+        # Two expenses share a date so the _id tiebreaker is exercised
+        dates = ["2024-01-10", "2024-01-12", "2024-01-12", "2024-01-14", "2024-01-15"]
+        for i, date_str in enumerate(dates):
+            self._create_sample_expense(self.employee_user_for_admin_tests.username, f"{i + 1}.00", "USD", date_str, f"Vendor {i}", "Paged")
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            url = '/api/admin/expenses?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            response = self.client.get(url, headers={'Authorization': f'Bearer {self.admin_token}'})
+            self.assertEqual(response.status_code, 200)
+            page = response.get_json()
+            self.assertLessEqual(len(page['expenses']), 2)
+            seen.extend(page['expenses'])
+            pages += 1
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(len({e['id'] for e in seen}), 5)
+        self.assertEqual([e['date'][:10] for e in seen], sorted(dates, reverse=True))
+
+    def test_get_all_expenses_admin_filters(self):
+        emp = self.employee_user_for_admin_tests.username
+        self._create_sample_expense(emp, "50.00", "USD", "2024-01-10", "Acme", "Jan", status="approved")
+        self._create_sample_expense(emp, "150.00", "EUR", "2024-02-10", "Acme", "Feb")
+        self._create_sample_expense(emp, "250.00", "USD", "2024-03-10", "Globex", "Mar", status="rejected")
+        self._create_sample_expense("emp1", "75.00", "USD", "2024-02-20", "Acme", "Other user")
+
+        def ids(query):
+            response = self.client.get(f'/api/admin/expenses?{query}', headers={'Authorization': f'Bearer {self.admin_token}'})
+            self.assertEqual(response.status_code, 200, msg=response.get_data(as_text=True))
+            return [e['description'] for e in response.get_json()['expenses']]
+
+        self.assertEqual(ids('status=pending'), ['Other user', 'Feb'])
+        self.assertEqual(ids('status=approved,rejected'), ['Mar', 'Jan'])
+        self.assertEqual(ids('from=2024-02-10&to=2024-02-20'), ['Other user', 'Feb'])
+        self.assertEqual(ids('min_amount=60&max_amount=150'), ['Other user', 'Feb'])
+        self.assertEqual(ids('vendor=Acme&currency=usd'), ['Other user', 'Jan'])
+        self.assertEqual(ids(f'user_id={emp}&vendor=Acme'), ['Feb', 'Jan'])
+
+        # Pagination within a filtered listing
+        first = self.client.get('/api/admin/expenses?vendor=Acme&limit=2', headers={'Authorization': f'Bearer {self.admin_token}'}).get_json()
+        second = self.client.get(f'/api/admin/expenses?vendor=Acme&limit=2&cursor={first["next_cursor"]}',
+                                 headers={'Authorization': f'Bearer {self.admin_token}'}).get_json()
+        self.assertEqual([e['description'] for e in second['expenses']], ['Jan'])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_get_all_expenses_admin_invalid_filters(self):
+        for query in ('status=paid', 'from=01/02/2024', 'min_amount=abc', 'from=2024-03-01&to=2024-02-01',
+                      'min_amount=10&max_amount=5'):
+            response = self.client.get(f'/api/admin/expenses?{query}', headers={'Authorization': f'Bearer {self.admin_token}'})
+            self.assertEqual(response.status_code, 400, msg=query)
+            self.assertIn('error', response.get_json())
+
+    def test_employee_filters_stay_within_own_expenses(self):
+        emp = self.employee_user_for_admin_tests.username
+        self._create_sample_expense(emp, "10.00", "USD", "2024-01-10", "Acme", "Mine", status="approved")
+        self._create_sample_expense(emp, "20.00", "USD", "2024-01-11", "Acme", "Mine pending")
+        self._create_sample_expense("emp1", "30.00", "USD", "2024-01-12", "Acme", "Not mine", status="approved")
+        response = self.client.get('/expenses?status=approved&user_id=emp1',
+                                   headers={'Authorization': f'Bearer {self.employee_token_for_admin_tests}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e['description'] for e in response.get_json()['expenses']], ['Mine'])
+
+    def test_get_all_expenses_admin_page_size_capped(self):
+        self.app.config['EXPENSES_MAX_PAGE_SIZE'] = 2
+        for i in range(3):
+            self._create_sample_expense(self.employee_user_for_admin_tests.username, "1.00", "USD", "2024-02-01", f"Cap {i}", "Capped")
+        response = self.client.get('/api/admin/expenses?limit=1000', headers={'Authorization': f'Bearer {self.admin_token}'})
+        self.assertEqual(len(response.get_json()['expenses']), 2)
+        self.assertIsNotNone(response.get_json()['next_cursor'])
+
+    def test_get_all_expenses_admin_streamed_in_batches(self):
+        self.app.config['EXPENSES_STREAM_BATCH_SIZE'] = 2
+        for i in range(5):
+            self._create_sample_expense(self.employee_user_for_admin_tests.username, f"{i}.50", "USD", f"2024-03-0{i + 1}", f"Stream {i}", "Streamed")
+        response = self.client.get('/api/admin/expenses?limit=4', headers={'Authorization': f'Bearer {self.admin_token}'},
+                                   buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        chunks = list(response.response)
+        self.assertGreater(len(chunks), 3) # Opening, two batches of two, closing
+        data = json.loads(''.join(c.decode() if isinstance(c, bytes) else c for c in chunks))
+        self.assertEqual([e['vendor'] for e in data['expenses']], ['Stream 4', 'Stream 3', 'Stream 2', 'Stream 1'])
+        self.assertIsNotNone(data['next_cursor'])
+
+    def test_listings_use_per_endpoint_projection(self):
+        self._create_sample_expense(self.employee_user_for_admin_tests.username, "12.00", "USD", "2024-04-01", "Proj Co", "Projected")
+        with patch.object(Expense, 'find_page_documents', wraps=Expense.find_page_documents) as spy:
+            response = self.client.get('/api/admin/expenses', headers={'Authorization': f'Bearer {self.admin_token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(spy.call_args.kwargs['projection'], Expense.ADMIN_LIST_PROJECTION)
+        self.assertNotIn('receipt_cloud_path', Expense.ADMIN_LIST_PROJECTION)
+        self.assertEqual(response.get_json()['expenses'][0]['vendor'], 'Proj Co')
+
+    def test_get_all_expenses_admin_invalid_cursor(self):
+        response = self.client.get('/api/admin/expenses?cursor=not-a-cursor', headers={'Authorization': f'Bearer {self.admin_token}'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/admin/expenses?limit=abc', headers={'Authorization': f'Bearer {self.admin_token}'})
+        self.assertEqual(response.status_code, 400)
+
     def test_get_all_expenses_employee_forbidden(self):
         response = self.client.get('/api/admin/expenses', headers={'Authorization': f'Bearer {self.employee_token_for_admin_tests}'})
         self.assertEqual(response.status_code, 403)
@@ -381,6 +509,57 @@ class TestAdminExpenseRoutes(BaseTestCase):
         response = self.client.post(f'/api/admin/expenses/{non_existent_id}/reject', headers={'Authorization': f'Bearer {self.admin_token}'})
         self.assertEqual(response.status_code, 404)
 
+    # Tests for POST /api/admin/expenses/status
+    def test_bulk_status_update_admin(self):
+        e1 = self._create_sample_expense(self.employee_user_for_admin_tests.username, "10.00", "USD", "2024-02-01", "Bulk A", "One")
+        e2 = self._create_sample_expense(self.employee_user_for_admin_tests.username, "20.00", "USD", "2024-02-02", "Bulk B", "Two")
+        untouched = self._create_sample_expense(self.employee_user_for_admin_tests.username, "30.00", "USD", "2024-02-03", "Bulk C", "Three")
+        missing_id = str(ObjectId())
+        ids = [str(e1._id), str(e2._id), missing_id, "not-an-id", str(e1._id)]
+
+        response = self.client.post('/api/admin/expenses/status', headers={'Authorization': f'Bearer {self.admin_token}'},
+                                    json={'ids': ids, 'status': 'approved'})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['matched'], [str(e1._id), str(e2._id)])
+        self.assertEqual(data['not_found'], [missing_id])
+        self.assertEqual(data['invalid'], ["not-an-id"])
+        self.assertEqual(Expense.get_by_id(str(e1._id)).status, 'approved')
+        self.assertEqual(Expense.get_by_id(str(e2._id)).status, 'approved')
+        self.assertEqual(Expense.get_by_id(str(untouched._id)).status, 'pending')
+
+    def test_bulk_status_update_uses_single_update_many(self):
+        expenses = [self._create_sample_expense(self.employee_user_for_admin_tests.username, "5.00", "USD", "2024-02-01", f"V{i}", "") for i in range(5)]
+        collection = type(get_db().expenses)
+        with patch.object(collection, 'update_many', autospec=True, side_effect=collection.update_many) as update_many, \
+             patch.object(collection, 'update_one', autospec=True) as update_one:
+            response = self.client.post('/api/admin/expenses/status', headers={'Authorization': f'Bearer {self.admin_token}'},
+                                        json={'ids': [str(e._id) for e in expenses], 'status': 'rejected'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(update_many.call_count, 1)
+        # Only the spend rollups (one $inc per bucket) may use update_one, never the expenses themselves
+        self.assertEqual([c.args[0].name for c in update_one.call_args_list if c.args[0].name == 'expenses'], [])
+
+    def test_bulk_status_update_validation(self):
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        expense = self._create_sample_expense(self.employee_user_for_admin_tests.username, "5.00", "USD", "2024-02-01", "V", "")
+        response = self.client.post('/api/admin/expenses/status', headers=headers, json={'ids': [str(expense._id)], 'status': 'paid'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/admin/expenses/status', headers=headers, json={'ids': [], 'status': 'approved'})
+        self.assertEqual(response.status_code, 400)
+        self.app.config['BULK_STATUS_MAX_IDS'] = 1
+        response = self.client.post('/api/admin/expenses/status', headers=headers,
+                                    json={'ids': [str(ObjectId()), str(ObjectId())], 'status': 'approved'})
+        self.assertEqual(response.status_code, 400)
+        # A JSON body that is not an object
+        response = self.client.post('/api/admin/expenses/status', headers=headers, json=[str(expense._id)])
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_status_update_employee_forbidden(self):
+        response = self.client.post('/api/admin/expenses/status', headers={'Authorization': f'Bearer {self.employee_token_for_admin_tests}'},
+                                    json={'ids': [str(ObjectId())], 'status': 'approved'})
+        self.assertEqual(response.status_code, 403)
+
 
 if __name__ == '__main__':
     unittest.main()
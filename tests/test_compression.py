@@ -0,0 +1,116 @@
+import gzip
+import json
+import os
+import unittest
+import zlib
+
+from tests.base import BaseTestCase
+from app import compression_services
+from app.asset_services import AssetBundle, get_asset_bundle, IMMUTABLE_MAX_AGE
+from app.models import Expense
+
+
+class TestJsonCompression(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = self.login_as('emp1', 'emp1pass')
+        for i in range(30):
+            Expense(user_id='emp1', amount=i, currency='USD', date_str='2024-01-01', vendor=f'Vendor {i}',
+                    description='Team lunch with a fairly long description', receipt_cloud_path=None).save()
+
+    def _get(self, url, encoding=None, etag=None):
+        headers = {'Authorization': f'Bearer {self.token}'}
+        if encoding:
+            headers['Accept-Encoding'] = encoding
+        if etag:
+            headers['If-None-Match'] = etag
+        return self.client.get(url, headers=headers)
+
+    def test_streamed_listing_is_gzipped(self):
+        response = self._get('/expenses?limit=30', 'gzip, deflate')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertNotIn('Content-Length', response.headers)
+        body = json.loads(gzip.decompress(response.get_data()))
+        self.assertEqual(len(body['expenses']), 30)
+
+    def test_identity_without_accept_encoding(self):
+        for encoding in (None, 'gzip;q=0', 'identity'):
+            response = self._get('/expenses?limit=30', encoding)
+            self.assertNotIn('Content-Encoding', response.headers, msg=encoding)
+            self.assertEqual(len(response.json['expenses']), 30)
+
+    def test_buffered_bodies_compressed_above_threshold(self):
+        def login():
+            return self.client.post('/login', json={'username': 'emp1', 'password': 'emp1pass'},
+                                    headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', login().headers)
+        self.app.extensions['compression']['min_size'] = 10
+        response = login()
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('token', json.loads(gzip.decompress(response.get_data())))
+
+    def test_compressed_listing_has_own_etag_and_revalidates(self):
+        plain = self._get('/expenses?limit=30').headers['ETag']
+        gzipped = self._get('/expenses?limit=30', 'gzip')
+        gzipped.get_data()
+        self.assertEqual(gzipped.headers['ETag'], plain[:-1] + '-gzip"')
+        response = self._get('/expenses?limit=30', 'gzip', gzipped.headers['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], gzipped.headers['ETag'])
+
+    def test_compress_stream_round_trip(self):
+        chunks = ['{"a": [', '1,2,3', ']}']
+        data = b''.join(compression_services.compress_stream(iter(chunks), 'gzip'))
+        self.assertEqual(zlib.decompress(data, 16 + zlib.MAX_WBITS), b'{"a": [1,2,3]}')
+
+
+class TestStaticAssets(BaseTestCase):
+    def test_pages_reference_hashed_immutable_scripts(self):
+        bundle = get_asset_bundle()
+        page = self.client.get('/login.html')
+        self.assertEqual(page.status_code, 200)
+        self.assertIn('no-cache', page.headers['Cache-Control'])
+        html = page.get_data(as_text=True)
+        hashed = bundle.hashed_urls['js/login.js']
+        self.assertIn(f'src="{hashed}"', html)
+        self.assertNotIn('src="js/login.js"', html)
+
+        script = self.client.get('/' + hashed, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(script.status_code, 200)
+        self.assertEqual(script.headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', script.headers['Cache-Control'])
+        self.assertIn(f'max-age={IMMUTABLE_MAX_AGE}', script.headers['Cache-Control'])
+        with open(os.path.join(bundle.root, 'js', 'login.js'), 'rb') as f:
+            self.assertEqual(gzip.decompress(script.get_data()), f.read())
+
+    def test_plain_urls_and_revalidation(self):
+        response = self.client.get('/js/auth_utils.js')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+        again = self.client.get('/js/auth_utils.js', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.client.get('/js/missing.js').status_code, 404)
+        self.assertEqual(self.client.get('/js/../config.py').status_code, 404)
+
+    def test_bundle_is_built_once(self):
+        self.client.get('/')
+        bundle = get_asset_bundle()
+        self.client.get('/expenses.html')
+        self.assertIs(get_asset_bundle(), bundle)
+
+    @unittest.skipUnless(compression_services.brotli, "brotli not installed")
+    def test_brotli_preferred_when_available(self):
+        response = self.client.get('/login.html', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+
+    def test_tiny_files_not_precompressed(self):
+        bundle = AssetBundle(get_asset_bundle().root, encodings=['gzip'])
+        for url, asset in bundle.assets.items():
+            for data in asset.encoded.values():
+                self.assertLess(len(data), len(asset.body), msg=url)
+
+
+if __name__ == '__main__':
+    unittest.main()
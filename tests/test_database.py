@@ -0,0 +1,233 @@
+import itertools
+import os
+import subprocess
+import sys
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+import mongomock
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from tests.base import BaseTestCase
+from app import create_app, database
+from app.models import User, Expense
+from app.database import get_db
+from app.indexes import INDEXES, ensure_indexes, listing_index_for, _pinned_fields
+
+
+class TestMongoClientPool(BaseTestCase):
+    def test_client_shared_across_app_contexts(self):
+        client = database.get_mongo_client()
+        with self.app.app_context():
+            self.assertIs(database.get_mongo_client(), client)
+        # Requests reuse the same client as well
+        self.client.get('/health')
+        self.assertIs(database.get_mongo_client(), client)
+
+    def test_client_recreated_after_fork(self):
+        first = database.get_mongo_client()
+        with patch('app.database.MongoClient') as mock_constructor, \
+             patch('app.database.os.getpid', return_value=-1):
+            mock_constructor.return_value = object()
+            second = database.get_mongo_client()
+        self.assertIsNot(first, second)
+        self.assertIs(second, mock_constructor.return_value)
+        # Put the test's mongomock client back for tearDown
+        with patch('app.database.MongoClient', return_value=first):
+            database.reinit_mongo_client()
+            self.assertIs(database.get_mongo_client(), first)
+
+    def test_pool_options_from_config(self):
+        self.app.config['MONGO_MAX_POOL_SIZE'] = 7
+        self.app.config['MONGO_MAX_IDLE_TIME_MS'] = 1000
+        self.app.config['MONGO_WAIT_QUEUE_TIMEOUT_MS'] = None
+        options = database._client_options(self.app.config)
+        self.assertEqual(options['maxPoolSize'], 7)
+        self.assertEqual(options['maxIdleTimeMS'], 1000)
+        self.assertNotIn('waitQueueTimeoutMS', options)
+        self.assertIn(database.pool_stats_listener, options['event_listeners'])
+
+    def test_pool_stats_endpoint(self):
+        listener = database.pool_stats_listener
+        listener.connection_check_out_started(None)
+        listener.connection_checked_out(None)
+        # Without an admin token only up/down is reported
+        response = self.client.get('/health/db')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'status': 'UP'})
+        emp_token = self.login_as('emp1', 'emp1pass')
+        response = self.client.get('/health/db', headers={'Authorization': f'Bearer {emp_token}'})
+        self.assertEqual(response.json, {'status': 'UP'})
+
+        admin_token = self.login_as('admin1', 'admin1pass')
+        response = self.client.get('/health/db', headers={'Authorization': f'Bearer {admin_token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['checked_out'], 1)
+        self.assertEqual(response.json['waiting'], 0)
+        self.assertEqual(response.json['max_waiting'], 1)
+        self.assertTrue(response.json['client_initialized'])
+
+
+class TestIndexManager(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # As after `flask init-db`; create_app() no longer creates indexes itself
+        ensure_indexes(get_db())
+
+    def test_declared_indexes_created_by_init_db(self):
+        db = get_db()
+        self.mock_mongo_client.drop_database(self.app.config['DATABASE_NAME'])
+        result = self.app.test_cli_runner().invoke(args=['init-db'])
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        for collection_name, models in INDEXES.items():
+            existing = db[collection_name].index_information()
+            for model in models:
+                self.assertIn(model.document['name'], existing)
+        ttl_index = db.sessions.index_information()['expires_at_ttl']
+        self.assertEqual(ttl_index['expireAfterSeconds'], 0)
+
+    def test_ensure_indexes_is_idempotent(self):
+        summary = ensure_indexes(get_db())
+        self.assertTrue(summary)
+        self.assertEqual({action for _, _, action in summary}, {'unchanged'})
+
+    def test_changed_index_definition_is_replaced(self):
+        db = get_db()
+        db.sessions.drop_index('expires_at_ttl')
+        db.sessions.create_index([('expires_at', ASCENDING)], name='old_expiry', expireAfterSeconds=3600)
+        summary = ensure_indexes(db, {'sessions': INDEXES['sessions']})
+        self.assertEqual(summary, [('sessions', 'expires_at_ttl', 'replaced')])
+        existing = db.sessions.index_information()
+        self.assertNotIn('old_expiry', existing)
+        self.assertEqual(existing['expires_at_ttl']['expireAfterSeconds'], 0)
+
+    def test_new_index_is_created(self):
+        extra = {'expenses': [IndexModel([('vendor', ASCENDING)], name='vendor_test')]}
+        self.assertEqual(ensure_indexes(get_db(), extra), [('expenses', 'vendor_test', 'created')])
+
+    def test_init_db_command(self):
+        result = self.app.test_cli_runner().invoke(args=['init-db'])
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assertIn('sessions.expires_at_ttl: unchanged', result.output)
+
+
+class TestListingQueryPlans(BaseTestCase):
+    """
+    mongomock cannot explain() queries, so the plan is checked structurally:
+    every supported filter combination must be hinted to a declared index that
+    starts with fields the query pins and continues with the listing sort keys.
+    Such an index can answer the query without a collection scan or an
+    in-memory sort.
+    """
+    SAMPLE_FILTERS = {
+        'status': ['pending'],
+        'user_id': 'emp1',
+        'vendor': 'Acme',
+        'currency': 'EUR',
+        'from': datetime(2024, 1, 1),
+        'to': datetime(2024, 3, 31),
+        'min_amount': 10.0,
+        'max_amount': 500.0,
+        'q': ['lunch'],
+    }
+
+    def _filter_combinations(self):
+        keys = list(self.SAMPLE_FILTERS)
+        for size in range(len(keys) + 1):
+            for combo in itertools.combinations(keys, size):
+                filters = {key: self.SAMPLE_FILTERS[key] for key in combo}
+                yield filters
+                if 'status' in filters:
+                    yield dict(filters, status=['approved', 'pending'])
+                if 'q' in filters:
+                    yield dict(filters, q=['lunch', 'team'])
+
+    def _assert_index_serves(self, query):
+        name = listing_index_for(query)
+        declared = {model.document['name']: list(model.document['key'].items()) for model in INDEXES['expenses']}
+        self.assertIn(name, declared, msg=query)
+        keys = declared[name]
+        self.assertEqual(keys[-2:], [('date', DESCENDING), ('_id', DESCENDING)], msg=name)
+        self.assertTrue({field for field, _ in keys[:-2]} <= _pinned_fields(query), msg=(query, name))
+
+    def test_every_filter_combination_uses_an_index(self):
+        combinations = list(self._filter_combinations())
+        self.assertGreater(len(combinations), 256)
+        for filters in combinations:
+            self._assert_index_serves(Expense.listing_query(filters))
+            # Employee listings always pin their own user_id
+            self._assert_index_serves(Expense.listing_query(dict(filters, user_id='emp1')))
+
+    def test_most_selective_index_is_preferred(self):
+        query = Expense.listing_query
+        self.assertEqual(listing_index_for(query({'user_id': 'u', 'status': ['pending']})), 'user_id_1_status_1_date_-1__id_-1')
+        self.assertEqual(listing_index_for(query({'user_id': 'u', 'vendor': 'Acme'})), 'vendor_1_date_-1__id_-1')
+        # An employee's search walks only their own expenses
+        self.assertEqual(listing_index_for(query({'user_id': 'u', 'q': ['lunch'], 'status': ['pending']})),
+                         'user_id_1_search_tokens_1_date_-1__id_-1')
+        self.assertEqual(listing_index_for(query({'q': ['lunch']})), 'search_tokens_1_date_-1__id_-1')
+        self.assertEqual(listing_index_for(query({'currency': 'EUR', 'status': ['pending']})), 'status_1_date_-1__id_-1')
+        self.assertEqual(listing_index_for(query({'min_amount': 5.0})), 'date_-1__id_-1')
+
+    def test_find_page_documents_hints_the_index(self):
+        ensure_indexes(get_db())
+        with patch.object(mongomock.collection.Cursor, 'hint', autospec=True,
+                          side_effect=lambda cursor, index: cursor) as hint:
+            Expense.find_page_documents(Expense.listing_query({'user_id': 'emp1', 'status': ['pending']}),
+                                        limit=5, cursor=Expense.encode_cursor({'date': datetime(2024, 1, 1), '_id': ObjectId()}))
+        hint.assert_called_once()
+        self.assertEqual(hint.call_args.args[1], 'user_id_1_status_1_date_-1__id_-1')
+
+    def test_listing_without_indexes_is_not_hinted(self):
+        # Before `flask init-db` the hint would fail the query, so it is left off
+        Expense(user_id='emp1', amount=5, currency='USD', date_str='2024-01-01', vendor='Acme',
+                description='', receipt_cloud_path=None).save()
+        with patch.object(mongomock.collection.Cursor, 'hint', autospec=True) as hint:
+            docs = list(Expense.find_page_documents(Expense.listing_query({'user_id': 'emp1'}), limit=5))
+        hint.assert_not_called()
+        self.assertEqual(len(docs), 1)
+        token = self.login_as('emp1', 'emp1pass')
+        response = self.client.get('/expenses', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()['expenses']), 1)
+
+
+class TestColdStart(BaseTestCase):
+    def test_create_app_does_not_touch_mongo_or_disk(self):
+        database.close_mongo_client()
+        upload_folder = os.path.join(self.temp_upload_folder, 'not-created')
+        with patch('app.database.MongoClient') as mongo_client, \
+             patch('config.Config.UPLOAD_FOLDER', upload_folder):
+            app = create_app()
+        mongo_client.assert_not_called()
+        self.assertFalse(os.path.exists(upload_folder))
+        self.assertIn('main', app.blueprints)
+
+    def test_startup_work_is_opt_in(self):
+        database.close_mongo_client()
+        with patch('config.Config.ENSURE_INDEXES_ON_STARTUP', True), \
+             patch('config.Config.SEED_ON_STARTUP', True), \
+             patch('app.indexes.ensure_indexes') as ensure, \
+             patch('app.models.create_dummy_users') as seed, \
+             patch('app.database.MongoClient', return_value=self.mock_mongo_client):
+            create_app()
+        ensure.assert_called_once()
+        seed.assert_called_once()
+
+    def test_seed_command(self):
+        get_db().users.delete_many({})
+        result = self.app.test_cli_runner().invoke(args=['seed'])
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assertIsNotNone(User.get_by_username('emp1'))
+        self.assertIsNotNone(User.get_by_username('admin1'))
+
+    def test_routes_import_is_silent(self):
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, '-c', 'import app.routes'], cwd=project_root,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, msg=result.stderr)
+        self.assertEqual(result.stdout, '')
+
+if __name__ == '__main__':
+    unittest.main()
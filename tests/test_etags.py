@@ -0,0 +1,93 @@
+import json
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from tests.base import BaseTestCase
+from app.database import get_db
+from app.models import Expense
+from app.version_services import get_version
+
+
+class TestListingETags(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.emp_token = self.login_as('emp1', 'emp1pass')
+        self.admin_token = self.login_as('admin1', 'admin1pass')
+        self.expense = self._expense('emp1')
+
+    def _expense(self, user_id, status='pending'):
+        expense = Expense(user_id=user_id, amount=10, currency='USD', date_str='2024-01-01', vendor='V',
+                          description='', receipt_cloud_path=None, status=status)
+        expense.save()
+        return expense
+
+    def _get(self, url, token, etag=None):
+        headers = {'Authorization': f'Bearer {token}'}
+        if etag:
+            headers['If-None-Match'] = etag
+        response = self.client.get(url, headers=headers)
+        response.get_data()  # drain streamed listings inside the request context
+        return response
+
+    def _expense_queries(self):
+        collection = type(get_db().expenses)
+        return patch.object(collection, 'find', autospec=True, side_effect=collection.find)
+
+    def test_not_modified_without_querying_expenses(self):
+        for url, token in (('/expenses', self.emp_token), ('/api/admin/expenses', self.admin_token)):
+            first = self._get(url, token)
+            self.assertEqual(first.status_code, 200)
+            etag = first.headers['ETag']
+            self.assertFalse(etag.startswith('W/'))
+            self.assertEqual(first.headers['Cache-Control'], 'private, no-cache')
+
+            with self._expense_queries() as find:
+                second = self._get(url, token, etag)
+            self.assertEqual(second.status_code, 304, msg=url)
+            self.assertEqual(second.headers['ETag'], etag)
+            self.assertEqual(second.get_data(), b'')
+            self.assertNotIn('expenses', [call.args[0].name for call in find.call_args_list])
+
+    def test_save_and_status_changes_invalidate(self):
+        emp_etag = self._get('/expenses', self.emp_token).headers['ETag']
+        admin_etag = self._get('/api/admin/expenses', self.admin_token).headers['ETag']
+
+        Expense.update_status(str(self.expense._id), 'approved')
+        self.assertEqual(self._get('/expenses', self.emp_token, emp_etag).status_code, 200)
+        self.assertEqual(self._get('/api/admin/expenses', self.admin_token, admin_etag).status_code, 200)
+
+        emp_etag = self._get('/expenses', self.emp_token).headers['ETag']
+        self._expense('emp1')
+        response = self._get('/expenses', self.emp_token, emp_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json['expenses']), 2)
+
+    def test_other_users_writes_keep_employee_etag(self):
+        emp_etag = self._get('/expenses', self.emp_token).headers['ETag']
+        admin_etag = self._get('/api/admin/expenses', self.admin_token).headers['ETag']
+        self._expense('someone_else')
+        self.assertEqual(self._get('/expenses', self.emp_token, emp_etag).status_code, 304)
+        self.assertEqual(self._get('/api/admin/expenses', self.admin_token, admin_etag).status_code, 200)
+
+    def test_bulk_writes_and_ocr_bump_versions(self):
+        before = get_version('emp1'), get_version()
+        Expense.update_status_many([str(self.expense._id)], 'rejected')
+        Expense.set_ocr_result(self.expense._id, 'completed', {})
+        self.assertEqual(get_version('emp1'), before[0] + 2)
+        self.assertEqual(get_version(), before[1] + 2)
+
+        body = json.dumps({'amount': 1, 'date': '2024-01-01', 'vendor': 'I'}).encode()
+        self.client.post('/expenses/import', headers={'Authorization': f'Bearer {self.emp_token}'},
+                         data={'file': (BytesIO(body), 'rows.ndjson')}, content_type='multipart/form-data')
+        self.assertEqual(get_version('emp1'), before[0] + 3)
+
+    def test_etag_depends_on_page_and_user(self):
+        page = self._get('/expenses?limit=1', self.emp_token).headers['ETag']
+        other_page = self._get('/expenses?limit=2', self.emp_token).headers['ETag']
+        self.assertNotEqual(page, other_page)
+        self.assertEqual(self._get('/expenses?limit=2', self.emp_token, page).status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import io
+import json
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+import mongomock
+from bson import ObjectId
+
+from tests.base import BaseTestCase
+from app.event_services import (EventBus, event_from_change, get_event_bus, EXPENSE_CREATED, EXPENSE_UPDATED,
+                                EXPENSE_STATUS, EXPENSES_IMPORTED, RESET)
+from app.models import Expense
+
+
+def parse_sse(text):
+    """[(id, event, data)] for the messages in an SSE body."""
+    messages = []
+    for block in text.split('\n\n'):
+        fields = {}
+        for line in block.splitlines():
+            if line.startswith(':') or ': ' not in line:
+                continue
+            key, value = line.split(': ', 1)
+            fields[key] = value
+        if 'event' in fields:
+            messages.append((fields.get('id'), fields['event'], json.loads(fields['data'])))
+    return messages
+
+
+class TestEventBus(unittest.TestCase):
+    def test_publish_reaches_subscribers(self):
+        bus = EventBus()
+        subscription, backlog = bus.subscribe()
+        self.assertEqual(backlog, [])
+        event_id = bus.publish(EXPENSE_STATUS, {'ids': ['1'], 'status': 'approved'})
+        self.assertEqual(subscription.get(timeout=1), (event_id, EXPENSE_STATUS, {'ids': ['1'], 'status': 'approved'}))
+        self.assertIsNone(subscription.get(timeout=0.01))
+        bus.unsubscribe(subscription)
+        bus.publish(EXPENSE_STATUS, {})
+        self.assertIsNone(subscription.get(timeout=0.01))
+
+    def test_replay_after_last_event_id(self):
+        bus = EventBus(history_size=3)
+        ids = [bus.publish('x', {'n': n}) for n in range(3)]
+        _, backlog = bus.subscribe(ids[0])
+        self.assertEqual([event[2]['n'] for event in backlog], [1, 2])
+        _, backlog = bus.subscribe(ids[-1])
+        self.assertEqual(backlog, [])
+
+        bus.publish('x', {'n': 3})
+        bus.publish('x', {'n': 4}) # ids[1] has left the history, so ids[0] can no longer be resumed
+        _, backlog = bus.subscribe(ids[0])
+        self.assertEqual([event[1] for event in backlog], [RESET])
+        _, backlog = bus.subscribe('other-process-7')
+        self.assertEqual([event[1] for event in backlog], [RESET])
+
+    def test_slow_subscriber_is_cut_off(self):
+        bus = EventBus(queue_size=2)
+        slow, _ = bus.subscribe()
+        for n in range(3):
+            bus.publish('x', {'n': n})
+        self.assertTrue(slow.overflowed)
+        self.assertEqual(bus.stats()['subscribers'], 0)
+        self.assertEqual(bus.stats()['disconnected_slow_clients'], 1)
+
+    def test_event_from_change(self):
+        expense_id = ObjectId()
+        doc = {'_id': expense_id, 'user_id': 'emp1', 'amount': 5.0, 'currency': 'USD', 'date': datetime(2024, 1, 1),
+               'vendor': 'Acme', 'description': '', 'status': 'pending', 'search_tokens': ['ac']}
+        insert = {'operationType': 'insert', 'documentKey': {'_id': expense_id}, 'fullDocument': doc}
+        event_type, data = event_from_change(insert)
+        self.assertEqual(event_type, EXPENSE_CREATED)
+        self.assertNotIn('search_tokens', data['expense'])
+
+        status = {'operationType': 'update', 'documentKey': {'_id': expense_id}, 'fullDocument': doc,
+                  'updateDescription': {'updatedFields': {'status': 'approved'}}}
+        self.assertEqual(event_from_change(status), (EXPENSE_STATUS, {'ids': [str(expense_id)], 'status': 'approved'}))
+
+        edit = dict(status, updateDescription={'updatedFields': {'amount': 7.0, 'status': 'pending'}})
+        self.assertEqual(event_from_change(edit)[0], EXPENSE_UPDATED)
+        ocr = dict(status, updateDescription={'updatedFields': {'ocr_status': 'completed'}})
+        self.assertIsNone(event_from_change(ocr))
+
+
+class TestExpenseEvents(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin_token = self.login_as('admin1', 'admin1pass')
+        self.bus = get_event_bus()
+        self.subscription, _ = self.bus.subscribe()
+
+    def tearDown(self):
+        self.bus.unsubscribe(self.subscription)
+        super().tearDown()
+
+    def _events(self):
+        events = []
+        while True:
+            event = self.subscription.get(timeout=0)
+            if event is None:
+                return events
+            events.append(event)
+
+    def _expense(self, **overrides):
+        fields = dict(user_id='emp1', amount=12.5, currency='USD', date_str='2024-01-01', vendor='Acme',
+                      description='Lunch', receipt_cloud_path=None)
+        fields.update(overrides)
+        expense = Expense(**fields)
+        expense.save()
+        return expense
+
+    def test_writes_publish_events(self):
+        expense = self._expense()
+        expense.amount = 20.0
+        expense.save()
+        Expense.update_status(str(expense._id), 'approved')
+        other = self._expense()
+        Expense.update_status_many([str(expense._id), str(other._id), 'bad-id'], 'rejected')
+
+        events = [(event_type, data) for _, event_type, data in self._events()]
+        self.assertEqual([event_type for event_type, _ in events],
+                         [EXPENSE_CREATED, EXPENSE_UPDATED, EXPENSE_STATUS, EXPENSE_CREATED, EXPENSE_STATUS])
+        self.assertEqual(events[0][1]['expense']['_id'], expense._id)
+        self.assertEqual(events[1][1]['expense']['amount'], 20.0)
+        self.assertEqual(events[2][1], {'ids': [str(expense._id)], 'status': 'approved'})
+        self.assertEqual(sorted(events[4][1]['ids']), sorted([str(expense._id), str(other._id)]))
+
+    def test_change_stream_status_update_is_compact(self):
+        # Replay the update a real update_status() writes as the change stream would report it
+        expense = self._expense()
+        with patch.object(mongomock.collection.Collection, 'find_one_and_update', autospec=True,
+                          side_effect=mongomock.collection.Collection.find_one_and_update) as write:
+            Expense.update_status(str(expense._id), 'approved')
+        update = write.call_args.args[2]
+        change = {'operationType': 'update', 'documentKey': {'_id': expense._id},
+                  'updateDescription': {'updatedFields': update['$set']}, 'fullDocument': {}}
+        self.assertIn('updated_at', update['$set'])
+        self.assertEqual(event_from_change(change), (EXPENSE_STATUS, {'ids': [str(expense._id)], 'status': 'approved'}))
+
+    def test_import_publishes_one_event(self):
+        token = self.login_as('emp1', 'emp1pass')
+        rows = b"date,amount,vendor\n2024-01-01,1,A\n2024-01-02,2,B\n"
+        self.client.post('/expenses/import', data={'file': (io.BytesIO(rows), 'rows.csv')},
+                         headers={'Authorization': f'Bearer {token}'}, content_type='multipart/form-data')
+        self.assertEqual([(event_type, data) for _, event_type, data in self._events()],
+                         [(EXPENSES_IMPORTED, {'count': 2})])
+
+    def test_change_stream_source_skips_local_publishes(self):
+        self.app.extensions['events']['source'] = 'change_stream'
+        self._expense()
+        self.assertEqual(self._events(), [])
+
+    def test_sse_stream(self):
+        self.app.config['EVENTS_MAX_STREAM_SECONDS'] = 0.2
+        self.app.config['EVENTS_HEARTBEAT_SECONDS'] = 0.05
+        first = self._expense()
+        last_seen = self._events()[-1][0]
+        second = self._expense(vendor='Globex')
+        Expense.update_status(str(second._id), 'approved')
+
+        response = self.client.get(f'/api/admin/expenses/events?token={self.admin_token}',
+                                   headers={'Last-Event-ID': last_seen})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        body = response.get_data(as_text=True)
+        self.assertTrue(body.startswith('retry: '))
+        self.assertIn(': keepalive', body)
+
+        messages = parse_sse(body)
+        self.assertEqual([event for _, event, _ in messages], [EXPENSE_CREATED, EXPENSE_STATUS])
+        row = messages[0][2]['expense']
+        self.assertEqual(row['id'], str(second._id))
+        self.assertEqual(row['vendor'], 'Globex')
+        self.assertEqual(row['date'], '2024-01-01T00:00:00')
+        self.assertNotEqual(row['id'], str(first._id))
+        self.assertEqual(self.bus.stats()['subscribers'], 1) # The stream unsubscribed when it ended
+
+    def test_sse_requires_admin(self):
+        emp_token = self.login_as('emp1', 'emp1pass')
+        self.assertEqual(self.client.get('/api/admin/expenses/events').status_code, 401)
+        self.assertEqual(self.client.get(f'/api/admin/expenses/events?token={emp_token}').status_code, 403)
+        # ?token= is only accepted by the stream
+        self.assertEqual(self.client.get(f'/api/admin/expenses?token={self.admin_token}').status_code, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+import numpy as np
+
+from tests.base import BaseTestCase
+from app.database import get_db
+from app.models import Expense
+from app import fx_services
+from app.fx_services import FxRateTable, get_fx_table, load_fx_rates_command
+
+RATES = [
+    ('EUR', datetime(2024, 1, 1), 1.10),
+    ('EUR', datetime(2024, 2, 1), 1.20),
+    ('GBP', datetime(2024, 1, 1), 1.25),
+]
+
+
+class TestFxRateTable(unittest.TestCase):
+    def setUp(self):
+        self.table = FxRateTable('USD', RATES)
+
+    def test_uses_latest_rate_on_or_before_date(self):
+        dates = np.array(['2024-01-15', '2024-02-01', '2024-03-31'], dtype='datetime64[D]')
+        np.testing.assert_allclose(self.table.rates_to_base('EUR', dates), [1.10, 1.20, 1.20])
+
+    def test_convert_between_non_base_currencies(self):
+        converted = self.table.convert([100, 100, 50], ['EUR', 'usd', 'GBP'],
+                                       np.array(['2024-01-10'] * 3, dtype='datetime64[D]'), 'EUR')
+        np.testing.assert_allclose(converted, [100, 100 / 1.10, 50 * 1.25 / 1.10])
+
+    def test_missing_rates_are_nan_and_counted(self):
+        dates = np.array(['2023-12-31', '2024-01-02', '2024-01-02'], dtype='datetime64[D]')
+        total, missing = self.table.total([10, 10, 10], ['EUR', 'JPY', 'USD'], dates, 'USD')
+        self.assertEqual(missing, 2)
+        self.assertAlmostEqual(total, 10.0)
+
+    def test_large_batch(self):
+        n = 200000
+        currencies = np.array(['USD', 'EUR', 'GBP'])[np.arange(n) % 3]
+        dates = np.full(n, np.datetime64('2024-02-15'))
+        total, missing = self.table.total(np.ones(n), currencies, dates, 'USD')
+        self.assertEqual(missing, 0)
+        expected = (n // 3 + (n % 3 > 0)) * 1.0 + (n // 3 + (n % 3 > 1)) * 1.20 + (n // 3) * 1.25
+        self.assertAlmostEqual(total, expected, places=4)
+
+
+class TestFxEndpoints(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for currency, rate_date, rate in RATES:
+            get_db().fx_rates.insert_one({'currency': currency, 'date': rate_date, 'rate': rate})
+        self.admin_token = self.login_as('admin1', 'admin1pass')
+        for amount, currency, date_str, status in [(100, 'USD', '2024-01-10', 'pending'),
+                                                   (100, 'EUR', '2024-01-20', 'pending'),
+                                                   (100, 'EUR', '2024-02-20', 'approved'),
+                                                   (40, 'GBP', '2024-02-05', 'pending')]:
+            Expense(user_id='emp1', amount=amount, currency=currency, date_str=date_str, vendor='V',
+                    description='', receipt_cloud_path=None, status=status).save()
+
+    def _get(self, url):
+        return self.client.get(url, headers={'Authorization': f'Bearer {self.admin_token}'})
+
+    def test_admin_totals_in_reporting_currency(self):
+        response = self._get('/api/admin/expenses/totals?currency=usd')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['currency'], 'USD')
+        self.assertEqual(response.json['count'], 4)
+        self.assertAlmostEqual(response.json['total'], 100 + 110 + 120 + 50, places=2)
+
+        response = self._get('/api/admin/expenses/totals?currency=EUR&status=pending&from=2024-01-01&to=2024-01-31')
+        self.assertEqual(response.json['count'], 2)
+        self.assertAlmostEqual(response.json['total'], round(100 / 1.10 + 100, 2), places=2)
+
+    def test_report_in_reporting_currency(self):
+        response = self._get('/api/admin/reports?from=2024-01&to=2024-02&reporting_currency=USD')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['group_by'], ['month'])
+        # Rollups are converted at the rate in effect at the end of each month
+        self.assertEqual(response.json['rows'], [
+            {'month': '2024-01', 'count': 2, 'total': 100 + 110.0, 'unconverted_count': 0},
+            {'month': '2024-02', 'count': 2, 'total': 120.0 + 50.0, 'unconverted_count': 0},
+        ])
+
+    def test_report_counts_unconvertible_buckets(self):
+        Expense(user_id='emp1', amount=5000, currency='JPY', date_str='2024-01-11', vendor='V',
+                description='', receipt_cloud_path=None).save()
+        response = self._get('/api/admin/reports?from=2024-01&to=2024-01&reporting_currency=USD&group_by=status')
+        self.assertEqual(response.json['rows'], [{'status': 'pending', 'count': 3, 'total': 210.0, 'unconverted_count': 1}])
+
+    def test_unknown_currency_rejected(self):
+        self.assertEqual(self._get('/api/admin/expenses/totals?currency=XYZ').status_code, 400)
+        self.assertEqual(self._get('/api/admin/reports?reporting_currency=XYZ').status_code, 400)
+
+    def test_rate_table_is_cached_and_reloaded_by_command(self):
+        first = get_fx_table()
+        self.assertIs(get_fx_table(), first)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write("date,currency,rate\n2024-01-01,JPY,0.0068\n")
+        try:
+            result = self.app.test_cli_runner().invoke(load_fx_rates_command, [f.name])
+        finally:
+            os.remove(f.name)
+        self.assertIn('Loaded 1 FX rate(s).', result.output)
+        self.assertIn('JPY', get_fx_table().currencies)
+
+    def test_expired_table_is_reloaded_once_under_load(self):
+        self.app.extensions.pop('fx_rates', None)
+        real_load = fx_services._load_rate_table
+        loads = []
+
+        def slow_load(config):
+            loads.append(1)
+            time.sleep(0.05) # Other requests pile up on the lock meanwhile
+            return real_load(config)
+
+        def request():
+            with self.app.app_context():
+                get_fx_table()
+
+        with patch('app.fx_services._load_rate_table', side_effect=slow_load):
+            threads = [threading.Thread(target=request) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(loads), 1)
+
+    def test_rates_file_takes_precedence(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write("date,currency,rate\n2024-01-01,CHF,1.15\n")
+        self.app.config['FX_RATES_FILE'] = f.name
+        self.app.extensions.pop('fx_rates', None)
+        try:
+            self.assertEqual(get_fx_table().currencies, ['CHF', 'USD'])
+        finally:
+            os.remove(f.name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import io
+import json
+import unittest
+import zipfile
+from io import BytesIO
+from unittest.mock import patch
+
+from pymongo.errors import BulkWriteError
+
+from tests.base import BaseTestCase
+from app.database import get_db
+from app.models import Employee
+
+
+class TestBulkImport(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.emp_token = self.login_as('emp1', 'emp1pass')
+        self.admin_token = self.login_as('admin1', 'admin1pass')
+
+    def _import(self, body, filename='rows.ndjson', token=None, receipts=None, query=''):
+        data = {'file': (BytesIO(body), filename)}
+        if receipts is not None:
+            data['receipts'] = (BytesIO(receipts), 'receipts.zip')
+        return self.client.post(f'/expenses/import{query}', headers={'Authorization': f'Bearer {token or self.emp_token}'},
+                                data=data, content_type='multipart/form-data')
+
+    @staticmethod
+    def _ndjson(rows):
+        return '\n'.join(json.dumps(row) for row in rows).encode()
+
+    def test_ndjson_import_reports_row_errors_without_aborting(self):
+        body = self._ndjson([
+            {'amount': '10.50', 'date': '2023-01-01', 'vendor': 'A'},
+            {'amount': 'abc', 'date': '2023-01-02', 'vendor': 'B'},
+            {'amount': 5, 'date': '01/03/2023', 'vendor': 'C'},
+            {'amount': 7, 'vendor': 'D'},
+            {'amount': 3, 'date': '2023-01-05T10:00:00', 'vendor': 'E', 'currency': 'EUR'},
+        ]) + b'\nnot json\n'
+        response = self._import(body)
+        self.assertEqual(response.status_code, 200, msg=response.get_data(as_text=True))
+        summary = response.json
+        self.assertEqual(summary['received'], 6)
+        self.assertEqual(summary['inserted'], 2)
+        self.assertEqual(summary['failed'], 4)
+        self.assertEqual([e['row'] for e in summary['errors']], [2, 3, 4, 6])
+        self.assertIn('date', summary['errors'][1]['error'])
+        self.assertIn('date', summary['errors'][2]['error'])
+
+        docs = list(get_db().expenses.find({}).sort('vendor', 1))
+        self.assertEqual([d['vendor'] for d in docs], ['A', 'E'])
+        self.assertEqual(docs[0]['user_id'], 'emp1')
+        self.assertEqual(docs[0]['status'], 'pending')
+        self.assertEqual(docs[1]['currency'], 'EUR')
+
+    def test_non_string_text_fields_are_row_errors(self):
+        body = self._ndjson([
+            {'amount': 1, 'date': '2023-01-01', 'vendor': 123},
+            {'amount': 2, 'date': '2023-01-01', 'vendor': 'Kept'},
+            {'amount': 3, 'date': '2023-01-01', 'vendor': 'V', 'description': ['a']},
+            {'amount': 4, 'date': '2023-01-01', 'vendor': 'V', 'currency': 5},
+        ])
+        response = self._import(body)
+        self.assertEqual(response.status_code, 200, msg=response.get_data(as_text=True))
+        self.assertEqual(response.json['inserted'], 1)
+        self.assertEqual([e['row'] for e in response.json['errors']], [1, 3, 4])
+        self.assertIn("'vendor' must be a string", response.json['errors'][0]['error'])
+        self.assertEqual([d['vendor'] for d in get_db().expenses.find({})], ['Kept'])
+
+    def test_undecodable_row_keeps_earlier_rows(self):
+        self.app.config['BULK_IMPORT_BATCH_SIZE'] = 1
+        body = self._ndjson([{'amount': i, 'date': '2023-01-01', 'vendor': f'V{i}'} for i in range(2)])
+        body += b'\n{"amount": 1, "date": "2023-01-01", "vendor": "\xff"}\n' + self._ndjson([{'amount': 9, 'date': '2023-01-01', 'vendor': 'Late'}])
+        response = self._import(body)
+        self.assertEqual(response.status_code, 200, msg=response.get_data(as_text=True))
+        self.assertEqual((response.json['received'], response.json['inserted'], response.json['failed']), (3, 2, 1))
+        self.assertEqual(response.json['errors'][0]['row'], 3)
+        self.assertIn('UTF-8', response.json['errors'][0]['error'])
+        self.assertEqual(sorted(d['vendor'] for d in get_db().expenses.find({})), ['V0', 'V1'])
+
+    def test_csv_import_in_batches(self):
+        lines = ['amount,date,vendor,description'] + [f'{i}.00,2023-02-{(i % 28) + 1:02d},Vendor {i},row {i}' for i in range(25)]
+        self.app.config['BULK_IMPORT_BATCH_SIZE'] = 10
+        collection = type(get_db().expenses)
+        with patch.object(collection, 'insert_many', autospec=True, side_effect=collection.insert_many) as insert_many:
+            response = self._import('\n'.join(lines).encode(), filename='rows.csv')
+        self.assertEqual(response.json['inserted'], 25)
+        self.assertEqual([len(call.args[1]) for call in insert_many.call_args_list], [10, 10, 5])
+        self.assertTrue(all(call.kwargs['ordered'] is False for call in insert_many.call_args_list))
+        self.assertEqual(get_db().expenses.count_documents({'user_id': 'emp1'}), 25)
+
+    def test_raw_body_import(self):
+        body = b'amount,date,vendor\n4,2023-03-01,Raw\n'
+        response = self.client.post('/expenses/import', headers={'Authorization': f'Bearer {self.emp_token}'},
+                                    data=body, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['inserted'], 1)
+
+    def test_employee_cannot_import_for_others(self):
+        response = self._import(self._ndjson([{'amount': 1, 'date': '2023-01-01', 'vendor': 'X', 'user_id': 'admin1'}]))
+        self.assertEqual(response.json['inserted'], 0)
+        self.assertIn('own expenses', response.json['errors'][0]['error'])
+
+    def test_admin_import_requires_known_user(self):
+        Employee('emp2', 'emp2pass').save()
+        body = self._ndjson([
+            {'amount': 1, 'date': '2023-01-01', 'vendor': 'X', 'user_id': 'emp2'},
+            {'amount': 1, 'date': '2023-01-01', 'vendor': 'Y'},
+            {'amount': 1, 'date': '2023-01-01', 'vendor': 'Z', 'user_id': 'ghost'},
+        ])
+        response = self._import(body, token=self.admin_token)
+        self.assertEqual(response.json['inserted'], 1)
+        self.assertEqual([e['row'] for e in response.json['errors']], [2, 3])
+        self.assertEqual(get_db().expenses.find_one({'vendor': 'X'})['user_id'], 'emp2')
+
+    def test_receipts_archive(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('r1.pdf', b'receipt one')
+        body = self._ndjson([
+            {'amount': 1, 'date': '2023-01-01', 'vendor': 'WithReceipt', 'receipt': 'r1.pdf'},
+            {'amount': 1, 'date': '2023-01-01', 'vendor': 'Missing', 'receipt': 'nope.pdf'},
+        ])
+        response = self._import(body, receipts=archive.getvalue())
+        self.assertEqual(response.json['inserted'], 1)
+        self.assertIn('not found in archive', response.json['errors'][0]['error'])
+        doc = get_db().expenses.find_one({'vendor': 'WithReceipt'})
+        self.assertTrue(doc['receipt_cloud_path'].startswith('cloud_simulator/'))
+        self.assertEqual(doc['receipt_size'], len(b'receipt one'))
+
+    def test_bulk_write_errors_are_mapped_to_rows(self):
+        rows = [{'amount': i, 'date': '2023-01-01', 'vendor': f'V{i}'} for i in range(3)]
+        error = BulkWriteError({'nInserted': 2, 'writeErrors': [{'index': 1, 'errmsg': 'duplicate key'}]})
+        with patch.object(type(get_db().expenses), 'insert_many', side_effect=error):
+            response = self._import(self._ndjson(rows))
+        self.assertEqual(response.json['inserted'], 2)
+        self.assertEqual(response.json['errors'], [{'row': 2, 'error': 'duplicate key'}])
+
+    def test_error_list_is_capped(self):
+        self.app.config['BULK_IMPORT_MAX_ERRORS'] = 2
+        response = self._import(self._ndjson([{'vendor': 'bad'}] * 5))
+        self.assertEqual(response.json['failed'], 5)
+        self.assertEqual(len(response.json['errors']), 2)
+        self.assertTrue(response.json['errors_truncated'])
+
+    def test_unknown_format_and_bad_archive_rejected(self):
+        self.assertEqual(self._import(b'x', filename='rows.txt').status_code, 400)
+        self.assertEqual(self._import(b'x', filename='rows.txt', query='?format=xml').status_code, 400)
+        response = self._import(self._ndjson([]), receipts=b'not a zip')
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_login(self):
+        response = self.client.post('/expenses/import', data=b'', content_type='text/csv')
+        self.assertEqual(response.status_code, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import io
+import unittest
+from types import SimpleNamespace
+
+from tests.base import BaseTestCase
+from app import database
+from app.metrics_services import (Histogram, REQUESTS_TOTAL, REQUEST_SECONDS,
+                                  STORAGE_SECONDS, OCR_SECONDS, command_timing_listener, reset_metrics)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_render_is_cumulative(self):
+        histogram = Histogram('test_seconds', 'Test.', ('op',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, 'read')
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{op="read",le="0.1"} 2', lines)
+        self.assertIn('test_seconds_bucket{op="read",le="1.0"} 3', lines)
+        self.assertIn('test_seconds_bucket{op="read",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_count{op="read"} 4', lines)
+        self.assertIn('test_seconds_sum{op="read"} 3.65', lines)
+
+    def test_label_values_are_escaped(self):
+        histogram = Histogram('test_seconds', 'Test.', ('op',))
+        histogram.observe(0.01, 'a"b\\c')
+        self.assertIn('test_seconds_count{op="a\\"b\\\\c"} 1', histogram.render())
+
+
+class TestMetricsEndpoint(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        reset_metrics()
+
+    def _scrape(self, headers=None, status=200):
+        response = self.client.get('/metrics', headers=headers or {})
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_requests_are_counted_by_route_template(self):
+        self.client.get('/health')
+        token = self.login_as('emp1', 'emp1pass')
+        self.client.get('/expenses/0123456789abcdef01234567/ocr', headers={'Authorization': f'Bearer {token}'})
+        self.client.get('/no-such-page')
+
+        self.assertEqual(REQUESTS_TOTAL.value('GET', '/health', '200'), 1)
+        self.assertEqual(REQUESTS_TOTAL.value('GET', '/expenses/<expense_id>/ocr', '404'), 1)
+        self.assertEqual(REQUESTS_TOTAL.value('GET', '<unmatched>', '404'), 1)
+        self.assertEqual(REQUEST_SECONDS.count('POST', '/login'), 1)
+
+        response = self._scrape()
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        body = response.get_data(as_text=True)
+        self.assertIn('http_requests_total{method="GET",route="/health",status="200"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{method="POST",route="/login"} 1', body)
+        self.assertIn('ocr_queue_depth 0', body)
+
+    def test_mongo_command_listener(self):
+        self.assertIn(command_timing_listener, database._client_options(self.app.config)['event_listeners'])
+        command_timing_listener.succeeded(SimpleNamespace(command_name='find', duration_micros=1500))
+        command_timing_listener.failed(SimpleNamespace(command_name='insert', duration_micros=200))
+        body = self._scrape().get_data(as_text=True)
+        self.assertIn('mongodb_command_duration_seconds_bucket{command="find",outcome="succeeded",le="0.0025"} 1', body)
+        self.assertIn('mongodb_command_duration_seconds_count{command="insert",outcome="failed"} 1', body)
+
+    def test_storage_and_ocr_are_timed(self):
+        self.app.extensions['ocr_queue'].mode = 'sync'
+        token = self.login_as('emp1', 'emp1pass')
+        response = self.client.post('/expenses', data={
+            'amount': '12.50', 'currency': 'USD', 'date': '2024-01-10', 'vendor': 'Acme',
+            'receipt': (io.BytesIO(b'receipt bytes'), 'receipt.png'),
+        }, headers={'Authorization': f'Bearer {token}'}, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 201, msg=response.get_data(as_text=True))
+        self.assertEqual(STORAGE_SECONDS.count('ingest'), 1)
+        self.assertEqual(OCR_SECONDS.count('queue', 'completed') + OCR_SECONDS.count('queue', 'failed'), 1)
+
+    def test_pool_gauges_only_for_token_scrapes(self):
+        body = self._scrape().get_data(as_text=True)
+        self.assertNotIn('mongodb_pool', body)
+        self.app.config['METRICS_TOKEN'] = 'scrape-secret'
+        body = self._scrape(headers={'Authorization': 'Bearer scrape-secret'}).get_data(as_text=True)
+        self.assertIn('mongodb_pool_connections_open', body)
+        self.assertIn('mongodb_pool_connections_checked_out', body)
+        self.assertIn('mongodb_pool_waiting_threads', body)
+
+    def test_token_and_disabled(self):
+        self.app.config['METRICS_TOKEN'] = 'scrape-secret'
+        self._scrape(status=401)
+        self._scrape(headers={'Authorization': 'Bearer scrape-secret'})
+        self.app.extensions['metrics']['enabled'] = False
+        self._scrape(status=404)
+        self.assertNotIn(command_timing_listener,
+                         database._client_options(dict(self.app.config, METRICS_ENABLED=False))['event_listeners'])
+
+    def tearDown(self):
+        reset_metrics()
+        super().tearDown()
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from tests.base import BaseTestCase
+from app.models import Employee, Expense
+from app.ocr_queue import OcrJobQueue, OCR_COMPLETED, OCR_FAILED, OCR_PENDING
+from app.storage_services import get_local_path_for_cloud, get_receipt_reference_count
+
+
+class TestOcrQueue(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = self.login_as('emp1', 'emp1pass')
+        self.queue = self.app.extensions['ocr_queue']
+
+    def _submit(self, token=None, filename='receipt.pdf'):
+        data = {'amount': '10.00', 'date': '2024-01-15', 'vendor': 'OCR Vendor',
+                'receipt': (BytesIO(b"receipt bytes"), filename)}
+        response = self.client.post('/expenses', headers={'Authorization': f'Bearer {token or self.token}'},
+                                    data=data, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 201, msg=response.get_data(as_text=True))
+        return response.get_json()
+
+    def test_expense_stored_pending_then_completed(self):
+        with patch('app.ocr_queue.extract_text_from_receipt', return_value={'ocr_vendor': 'Mock', 'ocr_status': 'SUCCESS'}):
+            submitted = self._submit()
+            self.assertEqual(submitted['expense']['ocr_status'], OCR_PENDING)
+            self.assertTrue(self.queue.wait(timeout=5))
+
+        expense_id = submitted['expense']['id']
+        response = self.client.get(f'/expenses/{expense_id}/ocr', headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['ocr_status'], OCR_COMPLETED)
+        self.assertEqual(response.json['ocr_data']['ocr_vendor'], 'Mock')
+
+    def test_ocr_failure_marks_expense_failed(self):
+        with patch('app.ocr_queue.extract_text_from_receipt', side_effect=RuntimeError("engine down")):
+            submitted = self._submit()
+            self.assertTrue(self.queue.wait(timeout=5))
+        expense = Expense.get_by_id(submitted['expense']['id'])
+        self.assertEqual(expense.ocr_status, OCR_FAILED)
+        self.assertIn('engine down', expense.ocr_data['error'])
+        self.assertEqual(self.queue.stats()['failed'], 1)
+
+    def test_expense_kept_when_ocr_cannot_be_queued(self):
+        with patch.object(self.queue, 'submit', side_effect=RuntimeError("pool broken")):
+            submitted = self._submit()
+        self.assertEqual(submitted['expense']['ocr_status'], OCR_FAILED)
+        expense = Expense.get_by_id(submitted['expense']['id'])
+        self.assertEqual(expense.ocr_status, OCR_FAILED)
+        # The stored expense keeps its receipt
+        self.assertEqual(get_receipt_reference_count(expense.receipt_key), 1)
+        self.assertTrue(os.path.exists(get_local_path_for_cloud(expense.receipt_cloud_path)))
+
+    def test_broken_pool_fails_the_job_not_the_submission(self):
+        with patch.object(self.queue, '_get_executor', side_effect=RuntimeError("cannot schedule new futures")):
+            submitted = self._submit()
+        self.assertEqual(Expense.get_by_id(submitted['expense']['id']).ocr_status, OCR_FAILED)
+        self.assertEqual(self.queue.stats()['queue_depth'], 0)
+
+    def test_other_employee_cannot_poll(self):
+        submitted = self._submit()
+        Employee("emp2", "emp2pass").save()
+        other_token = self.login_as("emp2", "emp2pass")
+        response = self.client.get(f"/expenses/{submitted['expense']['id']}/ocr", headers={'Authorization': f'Bearer {other_token}'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_stats_endpoint_reports_depth_and_timings(self):
+        self._submit()
+        self.assertTrue(self.queue.wait(timeout=5))
+        admin_token = self.login_as('admin1', 'admin1pass')
+        response = self.client.get('/api/admin/ocr/stats', headers={'Authorization': f'Bearer {admin_token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['submitted'], 1)
+        self.assertEqual(response.json['queue_depth'], 0)
+        self.assertEqual(len(response.json['recent_jobs']), 1)
+        self.assertIn('run_seconds', response.json['recent_jobs'][0])
+
+    def test_sync_mode_runs_inline(self):
+        queue = OcrJobQueue(self.app, mode='sync')
+        expense = Expense(user_id='emp1', amount=1, currency='USD', date_str='2024-01-01', vendor='V',
+                          description='', receipt_cloud_path=None, ocr_status=OCR_PENDING)
+        expense.save()
+        with patch('app.ocr_queue.extract_text_from_receipt', return_value={'ocr_status': 'SUCCESS'}):
+            queue.submit(expense._id, '/nonexistent')
+        self.assertEqual(Expense.get_by_id(str(expense._id)).ocr_status, OCR_COMPLETED)
+
+    def _scan(self, content=b"receipt bytes", filename='receipt.pdf'):
+        return self.client.post('/receipts/scan', headers={'Authorization': f'Bearer {self.token}'},
+                                data={'receipt': (BytesIO(content), filename)}, content_type='multipart/form-data')
+
+    def test_scan_runs_ocr_once_per_receipt(self):
+        ocr_result = {'ocr_vendor': 'Scanned', 'ocr_amount': 12.5, 'ocr_status': 'SUCCESS'}
+        with patch('app.ocr_queue.extract_text_from_receipt', return_value=ocr_result) as extract:
+            first = self._scan()
+            second = self._scan(filename='renamed.pdf')
+        self.assertEqual(first.status_code, 200)
+        self.assertFalse(first.json['cached'])
+        self.assertTrue(second.json['cached'])
+        self.assertEqual(second.json['ocr_data']['ocr_vendor'], 'Scanned')
+        self.assertEqual(first.json['sha256'], second.json['sha256'])
+        self.assertEqual(extract.call_count, 1)
+
+    def test_submit_reuses_scanned_result(self):
+        ocr_result = {'ocr_vendor': 'Scanned', 'ocr_status': 'SUCCESS'}
+        with patch('app.ocr_queue.extract_text_from_receipt', return_value=ocr_result) as extract:
+            self._scan()
+            submitted = self._submit()
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual(submitted['expense']['ocr_status'], OCR_COMPLETED)
+        self.assertEqual(submitted['ocr_data']['ocr_vendor'], 'Scanned')
+        self.assertEqual(self.queue.stats()['submitted'], 0)
+
+    def test_queued_ocr_result_is_cached(self):
+        with patch('app.ocr_queue.extract_text_from_receipt', return_value={'ocr_status': 'SUCCESS'}) as extract:
+            self._submit()
+            self.assertTrue(self.queue.wait(timeout=5))
+            second = self._submit()
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual(second['expense']['ocr_status'], OCR_COMPLETED)
+
+    def test_failed_scan_is_not_cached(self):
+        with patch('app.ocr_queue.extract_text_from_receipt', return_value={'error': 'unreadable'}) as extract:
+            self._scan()
+            response = self._scan()
+        self.assertFalse(response.json['cached'])
+        self.assertEqual(extract.call_count, 2)
+
+    def test_scan_cache_is_bounded(self):
+        cache = self.app.extensions['ocr_cache']
+        cache.max_entries = 2
+        with patch('app.ocr_queue.extract_text_from_receipt', return_value={'ocr_status': 'SUCCESS'}):
+            for content in (b"one", b"two", b"three"):
+                self._scan(content=content)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_scan_requires_login_and_allowed_type(self):
+        response = self.client.post('/receipts/scan', data={'receipt': (BytesIO(b"x"), 'r.pdf')},
+                                    content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self._scan(filename='receipt.exe').status_code, 400)
+
+    def test_unknown_mode_rejected(self):
+        with self.assertRaises(ValueError):
+            OcrJobQueue(self.app, mode='celery')
+
+    def test_concurrent_submits_share_one_executor(self):
+        queue = OcrJobQueue(self.app, mode='thread')
+        created = []
+
+        class SlowExecutor:
+            def __init__(self, max_workers):
+                time.sleep(0.05) # Widen the window in which a second thread could also create one
+                created.append(self)
+
+        with patch('app.ocr_queue.ThreadPoolExecutor', SlowExecutor):
+            threads = [threading.Thread(target=queue._get_executor) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(created), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from werkzeug.security import generate_password_hash
+
+from tests.base import BaseTestCase
+from app.database import get_db
+from app.models import User, Employee
+from app.password_services import PasswordHasher, HashingBusyError, get_password_hasher
+
+
+class TestPasswordHasher(unittest.TestCase):
+    def test_method_includes_iterations(self):
+        hasher = PasswordHasher(method='pbkdf2:sha256', iterations=1000, max_workers=1)
+        password_hash = hasher.hash('secret')
+        self.assertTrue(password_hash.startswith('pbkdf2:sha256:1000$'))
+        self.assertTrue(hasher.verify(password_hash, 'secret'))
+        self.assertFalse(hasher.verify(password_hash, 'wrong'))
+        self.assertFalse(hasher.needs_rehash(password_hash))
+        self.assertTrue(hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:500')))
+        hasher.shutdown()
+
+    def test_runs_on_pool_threads(self):
+        hasher = PasswordHasher(iterations=1000, max_workers=1)
+        seen = []
+        with patch('app.password_services.generate_password_hash',
+                   side_effect=lambda *a: seen.append(threading.current_thread().name) or 'x'):
+            hasher.hash('secret')
+        self.assertTrue(seen[0].startswith('password-hash'))
+        hasher.shutdown()
+
+    def test_rejects_when_saturated(self):
+        hasher = PasswordHasher(iterations=1000, max_workers=1, max_pending=0, queue_timeout=0.01)
+        release = threading.Event()
+        started = threading.Event()
+
+        def slow_hash(*args):
+            started.set()
+            release.wait(5)
+            return 'x'
+
+        with patch('app.password_services.generate_password_hash', side_effect=slow_hash):
+            worker = threading.Thread(target=hasher.hash, args=('a',))
+            worker.start()
+            self.assertTrue(started.wait(5))
+            with self.assertRaises(HashingBusyError):
+                hasher.hash('b')
+            release.set()
+            worker.join(5)
+        self.assertEqual(hasher.rejected, 1)
+        hasher.shutdown()
+
+
+class TestPasswordRoutes(BaseTestCase):
+    def test_outdated_hash_is_upgraded_on_login(self):
+        get_db().users.update_one({'_id': 'emp1'}, {'$set': {
+            'password_hash': generate_password_hash('emp1pass', 'pbkdf2:sha256:1000')}})
+        self.login_as('emp1', 'emp1pass')
+        stored = User.get_by_username('emp1').password_hash
+        self.assertEqual(stored.split('$', 1)[0], get_password_hasher().method)
+        # Still works with the upgraded hash
+        self.login_as('emp1', 'emp1pass')
+
+    def test_failed_login_does_not_rehash(self):
+        old_hash = generate_password_hash('emp1pass', 'pbkdf2:sha256:1000')
+        get_db().users.update_one({'_id': 'emp1'}, {'$set': {'password_hash': old_hash}})
+        response = self.client.post('/login', json={'username': 'emp1', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(User.get_by_username('emp1').password_hash, old_hash)
+
+    def test_busy_rehash_does_not_fail_login(self):
+        old_hash = generate_password_hash('emp1pass', 'pbkdf2:sha256:1000')
+        get_db().users.update_one({'_id': 'emp1'}, {'$set': {'password_hash': old_hash}})
+        with patch('app.models.hash_password', side_effect=HashingBusyError()):
+            self.login_as('emp1', 'emp1pass')
+        self.assertEqual(User.get_by_username('emp1').password_hash, old_hash)
+
+    def test_configured_method_used_for_new_users(self):
+        self.assertEqual(get_password_hasher().method, 'pbkdf2:sha256:%d' % self.app.config['PASSWORD_HASH_ITERATIONS'])
+        user = Employee('newuser', 'password123')
+        self.assertTrue(user.password_hash.startswith(get_password_hasher().method + '$'))
+
+    def test_login_and_signup_return_503_when_busy(self):
+        with patch.object(PasswordHasher, '_run', side_effect=HashingBusyError()):
+            response = self.client.post('/login', json={'username': 'emp1', 'password': 'emp1pass'})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '1')
+            response = self.client.post('/signup', json={'username': 'someone', 'password': 'password123'})
+            self.assertEqual(response.status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import pstats
+import tempfile
+import shutil
+
+from tests.base import BaseTestCase
+from app import profiling_services
+from app.models import Expense
+
+
+class TestRequestProfiling(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile_dir = tempfile.mkdtemp()
+        self.app.config.update(PROFILING_ENABLED=True, PROFILING_DIR=self.profile_dir, PROFILING_MAX_FILES=3)
+        profiling_services.init_app(self.app) # Registers the request hooks
+        self.admin_token = self.login_as('admin1', 'admin1pass')
+        self.emp_token = self.login_as('emp1', 'emp1pass')
+        Expense(user_id='emp1', amount=10, currency='USD', date_str='2024-01-10', vendor='Acme',
+                description='', receipt_cloud_path=None).save()
+
+    def tearDown(self):
+        shutil.rmtree(self.profile_dir)
+        super().tearDown()
+
+    def _get(self, url, token, profile=True):
+        headers = {'Authorization': f'Bearer {token}'}
+        if profile:
+            headers['X-Profile'] = '1'
+        response = self.client.get(url, headers=headers)
+        response.get_data() # Streamed listings are profiled until the body is consumed
+        response.close()
+        return response
+
+    def _profiles(self):
+        response = self.client.get('/api/admin/profiles', headers={'Authorization': f'Bearer {self.admin_token}'})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['profiles']
+
+    def test_admin_header_profiles_the_request(self):
+        response = self._get('/api/admin/expenses', self.admin_token)
+        self.assertEqual(response.status_code, 200)
+        profile_id = response.headers['X-Profile-Id']
+
+        profiles = self._profiles()
+        self.assertEqual(len(profiles), 1)
+        meta = profiles[0]
+        self.assertEqual(meta['id'], profile_id)
+        self.assertEqual((meta['route'], meta['user'], meta['status'], meta['trigger']),
+                         ('/api/admin/expenses', 'admin1', 200, 'header'))
+        self.assertGreater(meta['duration_seconds'], 0)
+
+        download = self.client.get(f'/api/admin/profiles/{profile_id}',
+                                   headers={'Authorization': f'Bearer {self.admin_token}'})
+        self.assertEqual(download.status_code, 200)
+        path = os.path.join(self.profile_dir, 'downloaded.prof')
+        with open(path, 'wb') as f:
+            f.write(download.get_data())
+        download.close()
+        # The profile covers the streamed body, not just the view function
+        functions = {name for _, _, name in pstats.Stats(path).stats}
+        self.assertIn('stream_json_page', functions)
+
+        text = self.client.get(f'/api/admin/profiles/{profile_id}?format=text&sort=tottime',
+                               headers={'Authorization': f'Bearer {self.admin_token}'})
+        self.assertIn('function calls', text.get_data(as_text=True))
+
+    def test_header_from_non_admin_is_ignored(self):
+        response = self._get('/expenses', self.emp_token)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(self._profiles(), [])
+
+    def test_sampling_and_ring(self):
+        self.app.config['PROFILING_SAMPLE_RATE'] = 1.0
+        for _ in range(5):
+            self._get('/expenses', self.emp_token, profile=False)
+        self.app.config['PROFILING_SAMPLE_RATE'] = 0.0
+        profiles = self._profiles()
+        self.assertEqual(len(profiles), 3) # PROFILING_MAX_FILES
+        self.assertEqual({(p['route'], p['user'], p['trigger']) for p in profiles}, {('/expenses', 'emp1', 'sample')})
+        self.assertEqual(len(os.listdir(self.profile_dir)), 6) # .prof + .json each
+        ids = [p['id'] for p in profiles]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_profile_download_requires_admin_and_valid_id(self):
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        self.assertEqual(self.client.get('/api/admin/profiles/..%2Fconfig', headers=headers).status_code, 404)
+        self.assertEqual(self.client.get('/api/admin/profiles/20240101T000000000000-deadbeef',
+                                         headers=headers).status_code, 404)
+        response = self.client.get('/api/admin/profiles', headers={'Authorization': f'Bearer {self.emp_token}'})
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,138 @@
+import json
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+import mongomock
+
+from tests.base import BaseTestCase
+from app.database import get_db
+from app.models import Expense
+from app.reporting_services import rebuild_rollups, get_report, rebuild_rollups_command
+
+
+class TestSpendRollups(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin_token = self.login_as('admin1', 'admin1pass')
+
+    def _expense(self, amount, date_str, user_id='emp1', currency='USD', status='pending'):
+        expense = Expense(user_id=user_id, amount=amount, currency=currency, date_str=date_str,
+                          vendor='V', description='', receipt_cloud_path=None, status=status)
+        expense.save()
+        return expense
+
+    def _rollups(self):
+        return {(d['user_id'], d['month'], d['currency'], d['status']): (d['count'], round(d['total'], 2))
+                for d in get_db().expense_rollups.find({'count': {'$ne': 0}})}
+
+    def test_save_and_status_changes_move_buckets(self):
+        e1 = self._expense(10, '2024-01-05')
+        self._expense(5.5, '2024-01-20')
+        self._expense(7, '2024-02-01', currency='EUR')
+        self.assertEqual(self._rollups(), {
+            ('emp1', '2024-01', 'USD', 'pending'): (2, 15.5),
+            ('emp1', '2024-02', 'EUR', 'pending'): (1, 7.0),
+        })
+
+        Expense.update_status(str(e1._id), 'approved')
+        self.assertEqual(self._rollups()[('emp1', '2024-01', 'USD', 'pending')], (1, 5.5))
+        self.assertEqual(self._rollups()[('emp1', '2024-01', 'USD', 'approved')], (1, 10.0))
+
+        # Re-saving an existing expense with a different amount and month
+        e1.amount = 12.0
+        e1.date = Expense.parse_date('2024-03-01')
+        e1.status = 'approved'
+        e1.save()
+        rollups = self._rollups()
+        self.assertNotIn(('emp1', '2024-01', 'USD', 'approved'), rollups)
+        self.assertEqual(rollups[('emp1', '2024-03', 'USD', 'approved')], (1, 12.0))
+
+    def test_bulk_status_and_import_update_rollups(self):
+        expenses = [self._expense(1, '2024-01-01') for _ in range(3)]
+        Expense.update_status_many([str(e._id) for e in expenses[:2]], 'rejected')
+        self.assertEqual(self._rollups()[('emp1', '2024-01', 'USD', 'rejected')], (2, 2.0))
+
+        token = self.login_as('emp1', 'emp1pass')
+        body = '\n'.join(json.dumps({'amount': 4, 'date': '2024-01-15', 'vendor': 'I'}) for _ in range(2)).encode()
+        self.client.post('/expenses/import', headers={'Authorization': f'Bearer {token}'},
+                         data={'file': (BytesIO(body), 'rows.ndjson')}, content_type='multipart/form-data')
+        self.assertEqual(self._rollups()[('emp1', '2024-01', 'USD', 'pending')], (3, 9.0))
+
+    def test_bulk_status_skips_expenses_changed_concurrently(self):
+        racer, other = self._expense(1, '2024-01-01'), self._expense(2, '2024-01-01')
+        real_update_many = mongomock.collection.Collection.update_many
+
+        def approve_first(collection, *args, **kwargs):
+            # Another admin approves `racer` between the bulk read and the bulk write
+            if not getattr(approve_first, 'done', False):
+                approve_first.done = True
+                Expense.update_status(str(racer._id), 'approved')
+            return real_update_many(collection, *args, **kwargs)
+
+        with patch.object(mongomock.collection.Collection, 'update_many', autospec=True, side_effect=approve_first):
+            Expense.update_status_many([str(racer._id), str(other._id)], 'rejected')
+
+        self.assertEqual(Expense.get_by_id(str(racer._id)).status, 'approved')
+        rollups = self._rollups()
+        self.assertEqual(rollups[('emp1', '2024-01', 'USD', 'approved')], (1, 1.0))
+        self.assertEqual(rollups[('emp1', '2024-01', 'USD', 'rejected')], (1, 2.0))
+        self.assertNotIn(('emp1', '2024-01', 'USD', 'pending'), rollups)
+
+    def test_rebuild_fixes_drift(self):
+        self._expense(10, '2024-01-05')
+        self._expense(20, '2024-01-06', status='approved')
+        get_db().expense_rollups.update_many({}, {'$inc': {'total': 1000}})
+        get_db().expense_rollups.insert_one({'user_id': 'ghost', 'month': '2020-01', 'currency': 'USD', 'status': 'pending', 'count': 3, 'total': 1})
+
+        self.assertEqual(rebuild_rollups(), 2)
+        self.assertEqual(self._rollups(), {
+            ('emp1', '2024-01', 'USD', 'pending'): (1, 10.0),
+            ('emp1', '2024-01', 'USD', 'approved'): (1, 20.0),
+        })
+        self.assertIn('month_1_user_id_1_currency_1_status_1', get_db().expense_rollups.index_information())
+
+    def test_rebuild_command(self):
+        self._expense(10, '2024-01-05')
+        result = self.app.test_cli_runner().invoke(rebuild_rollups_command)
+        self.assertIn('Rebuilt 1 rollup document(s).', result.output)
+
+    def test_report_endpoint_reads_rollups_only(self):
+        self._expense(10, '2024-01-05')
+        self._expense(5, '2024-02-05')
+        self._expense(8, '2024-02-07', currency='EUR', status='approved')
+        self._expense(99, '2024-05-01')
+
+        with patch.object(type(get_db().expenses), 'aggregate', autospec=True,
+                          side_effect=type(get_db().expenses).aggregate) as aggregate, \
+             patch.object(type(get_db().expenses), 'find', autospec=True,
+                          side_effect=type(get_db().expenses).find) as find:
+            response = self.client.get('/api/admin/reports?from=2024-01&to=2024-03',
+                                       headers={'Authorization': f'Bearer {self.admin_token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['rows'], [
+            {'month': '2024-01', 'currency': 'USD', 'count': 1, 'total': 10.0},
+            {'month': '2024-02', 'currency': 'EUR', 'count': 1, 'total': 8.0},
+            {'month': '2024-02', 'currency': 'USD', 'count': 1, 'total': 5.0},
+        ])
+        self.assertEqual({c.args[0].name for c in aggregate.call_args_list}, {'expense_rollups'})
+        self.assertNotIn('expenses', {c.args[0].name for c in find.call_args_list})
+
+    def test_report_grouping_and_filters(self):
+        self._expense(10, '2024-01-05')
+        self._expense(5, '2024-01-06', status='approved')
+        rows = get_report('2024-01', '2024-01', group_by=['status'], filters={'user_id': 'emp1', 'currency': 'USD'})
+        self.assertEqual(rows, [{'status': 'approved', 'count': 1, 'total': 5.0},
+                                {'status': 'pending', 'count': 1, 'total': 10.0}])
+
+    def test_report_validation_and_access(self):
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        self.assertEqual(self.client.get('/api/admin/reports?from=2024-13', headers=headers).status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/reports?from=2024-01&group_by=vendor', headers=headers).status_code, 400)
+        emp_token = self.login_as('emp1', 'emp1pass')
+        response = self.client.get('/api/admin/reports', headers={'Authorization': f'Bearer {emp_token}'})
+        self.assertEqual(response.status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import io
+import unittest
+
+from tests.base import BaseTestCase
+from app.database import get_db
+from app.models import Expense
+from app.search_services import (search_tokens, search_terms, suggest_vendors, normalize,
+                                 SUGGESTIONS_COLLECTION)
+
+
+class TestSearchTokens(unittest.TestCase):
+    def test_normalization_and_prefixes(self):
+        self.assertEqual(normalize('Café ZÜRICH'), 'cafe zurich')
+        tokens = search_tokens('Café Zürich', 'Team lunch')
+        for token in ('ca', 'caf', 'cafe', 'zu', 'zurich', 'te', 'team', 'lu', 'lunch'):
+            self.assertIn(token, tokens)
+        self.assertNotIn('c', tokens)
+        self.assertEqual(search_tokens(None, None), [])
+
+    def test_search_terms(self):
+        self.assertEqual(search_terms('Lunch  Zür'), ['lunch', 'zur'])
+        self.assertEqual(search_terms('a ' + 'x' * 30), ['x' * 15])
+        with self.assertRaises(ValueError):
+            search_terms('a !')
+
+
+class TestExpenseSearch(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin_token = self.login_as('admin1', 'admin1pass')
+        self.emp_token = self.login_as('emp1', 'emp1pass')
+        self._expense('emp1', 'Café Zürich', 'Team lunch', '2024-01-10')
+        self._expense('emp1', 'Acme Corp', 'Printer paper', '2024-01-11')
+        self._expense('emp2', 'Acme Corp', 'Lunch with client', '2024-01-12')
+
+    def _expense(self, user_id, vendor, description, date_str):
+        expense = Expense(user_id=user_id, amount=10, currency='USD', date_str=date_str, vendor=vendor,
+                          description=description, receipt_cloud_path=None)
+        expense.save()
+        return expense
+
+    def _search(self, q, token=None, url='/api/admin/expenses'):
+        response = self.client.get(url, query_string={'q': q},
+                                   headers={'Authorization': f'Bearer {token or self.admin_token}'})
+        self.assertEqual(response.status_code, 200, msg=response.get_data(as_text=True))
+        return [e['description'] for e in response.get_json()['expenses']]
+
+    def test_admin_search_matches_word_prefixes(self):
+        self.assertEqual(self._search('lunch'), ['Lunch with client', 'Team lunch'])
+        self.assertEqual(self._search('zur'), ['Team lunch'])
+        self.assertEqual(self._search('ACME lun'), ['Lunch with client'])
+        self.assertEqual(self._search('cme'), []) # Only word prefixes match
+        bad = self.client.get('/api/admin/expenses?q=!', headers={'Authorization': f'Bearer {self.admin_token}'})
+        self.assertEqual(bad.status_code, 400)
+
+    def test_employee_search_is_scoped(self):
+        self.assertEqual(self._search('lunch', self.emp_token, '/expenses'), ['Team lunch'])
+
+    def test_updates_refresh_tokens(self):
+        expense = self._expense('emp1', 'Globex', 'Taxi', '2024-01-13')
+        expense.description = 'Airport shuttle'
+        expense.save()
+        self.assertEqual(self._search('taxi'), [])
+        self.assertEqual(self._search('shuttle'), ['Airport shuttle'])
+
+    def test_bulk_import_is_searchable(self):
+        csv_data = b"date,amount,vendor,description\n2024-02-01,5,Initech,Stapler refill\n"
+        response = self.client.post('/expenses/import', data={'file': (io.BytesIO(csv_data), 'rows.csv')},
+                                    headers={'Authorization': f'Bearer {self.emp_token}'},
+                                    content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200, msg=response.get_data(as_text=True))
+        self.assertEqual(self._search('stap'), ['Stapler refill'])
+        self.assertEqual(suggest_vendors('emp1', 'ini'), ['Initech'])
+
+    def test_rebuild_search_index_backfills(self):
+        db = get_db()
+        db.expenses.update_many({}, {'$unset': {'search_tokens': ''}})
+        db[SUGGESTIONS_COLLECTION].delete_many({})
+        self.assertEqual(self._search('lunch'), [])
+        result = self.app.test_cli_runner().invoke(args=['rebuild-search-index'])
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assertIn('Updated 3 expense(s); 3 vendor suggestion(s).', result.output)
+        self.assertEqual(self._search('lunch'), ['Lunch with client', 'Team lunch'])
+
+
+class TestVendorSuggestions(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.emp_token = self.login_as('emp1', 'emp1pass')
+        for vendor, uses in (('Acme Corp', 3), ('Acorn Café', 1), ('Blue Acme', 2)):
+            for _ in range(uses):
+                Expense(user_id='emp1', amount=1, currency='USD', date_str='2024-01-01', vendor=vendor,
+                        description='', receipt_cloud_path=None).save()
+        Expense(user_id='emp2', amount=1, currency='USD', date_str='2024-01-01', vendor='Acme Secret',
+                description='', receipt_cloud_path=None).save()
+
+    def _suggest(self, prefix, **params):
+        response = self.client.get('/vendors/suggest', query_string=dict(params, prefix=prefix),
+                                   headers={'Authorization': f'Bearer {self.emp_token}'})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['vendors']
+
+    def test_most_used_first_and_per_user(self):
+        self.assertEqual(self._suggest('ac'), ['Acme Corp', 'Blue Acme', 'Acorn Café'])
+        self.assertEqual(self._suggest('acm', limit=1), ['Acme Corp'])
+        self.assertEqual(self._suggest('acme c'), ['Acme Corp'])
+        self.assertEqual(self._suggest('cafe'), ['Acorn Café'])
+        self.assertEqual(self._suggest(''), [])
+        self.assertNotIn('Acme Secret', self._suggest('acme'))
+
+    def test_long_prefixes(self):
+        Expense(user_id='emp1', amount=1, currency='USD', date_str='2024-01-01',
+                vendor='Internationalization Consultants', description='', receipt_cloud_path=None).save()
+        self.assertEqual(self._suggest('internationalization con'), ['Internationalization Consultants'])
+        self.assertEqual(self._suggest('internationalization x'), [])
+
+    def test_requires_login(self):
+        self.assertEqual(self.client.get('/vendors/suggest?prefix=ac').status_code, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
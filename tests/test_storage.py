@@ -0,0 +1,221 @@
+import os
+import hashlib
+import unittest
+from datetime import datetime, timedelta
+from io import BytesIO
+from unittest.mock import patch
+
+from tests.base import BaseTestCase
+from app.database import get_db
+from app.models import Expense
+from app.storage_backends import LocalShardedBackend, S3Backend, create_storage_backend
+from app.storage_services import (SIMULATED_CLOUD_FOLDER, delete_file_from_cloud, get_local_path_for_cloud,
+                                  get_receipt_reference_count, ingest_receipt)
+
+
+class FakeS3Error(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3Client:
+    """In-memory stand-in for the subset of the boto3 S3 client used by S3Backend."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_file(self, filename, bucket, key):
+        with open(filename, 'rb') as f:
+            self.objects[(bucket, key)] = f.read()
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error('404')
+        return {'ContentLength': len(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error('NoSuchKey')
+        return {'Body': BytesIO(self.objects[(Bucket, Key)])}
+
+
+class TestContentAddressedStorage(BaseTestCase):
+    def _stored_path(self, key):
+        return os.path.join(self.app.config['UPLOAD_FOLDER'], SIMULATED_CLOUD_FOLDER, key[:2], key[2:4], key)
+
+    def test_identical_uploads_share_one_object(self):
+        first = ingest_receipt(BytesIO(b"same bytes"), 'receipt.jpg', 'emp1')
+        second = ingest_receipt(BytesIO(b"same bytes"), 'receipt.jpg', 'emp2')
+        self.assertEqual(first['key'], hashlib.sha256(b"same bytes").hexdigest() + '.jpg')
+        self.assertEqual(first['key'], second['key'])
+        self.assertFalse(first['deduplicated'])
+        self.assertTrue(second['deduplicated'])
+        self.assertEqual(get_receipt_reference_count(first['key']), 2)
+        stored = [name for _, _, files in os.walk(os.path.join(self.app.config['UPLOAD_FOLDER'], SIMULATED_CLOUD_FOLDER))
+                  for name in files]
+        self.assertEqual(stored, [first['key']]) # No leftover staging files
+
+    def test_same_filename_different_content_no_overwrite(self):
+        first = ingest_receipt(BytesIO(b"alice's receipt"), 'receipt.jpg', 'alice')
+        second = ingest_receipt(BytesIO(b"bob's receipt"), 'receipt.jpg', 'bob')
+        self.assertNotEqual(first['key'], second['key'])
+        with open(self._stored_path(first['key']), 'rb') as f:
+            self.assertEqual(f.read(), b"alice's receipt")
+
+    def test_blob_deleted_only_when_last_reference_released(self):
+        first = ingest_receipt(BytesIO(b"shared"), 'r.pdf', 'emp1')
+        ingest_receipt(BytesIO(b"shared"), 'r.pdf', 'emp2')
+
+        self.assertTrue(delete_file_from_cloud(first['cloud_path']))
+        self.assertTrue(os.path.exists(self._stored_path(first['key'])))
+        self.assertEqual(get_receipt_reference_count(first['key']), 1)
+
+        self.assertTrue(delete_file_from_cloud(first['cloud_path']))
+        self.assertFalse(os.path.exists(self._stored_path(first['key'])))
+        self.assertEqual(get_receipt_reference_count(first['key']), 0)
+
+    def test_ingest_during_last_release_stores_the_object_again(self):
+        first = ingest_receipt(BytesIO(b"racing"), 'r.pdf', 'emp1')
+        blobs = get_db().receipt_blobs
+        # A release of the last reference is in progress: document marked, file already removed
+        blobs.update_one({'_id': first['key']}, {'$set': {'refcount': 0, 'deleting': True, 'deleting_at': datetime.utcnow()}})
+        os.remove(self._stored_path(first['key']))
+
+        def release_finishes(seconds):
+            blobs.delete_one({'_id': first['key'], 'deleting': True})
+
+        with patch('app.storage_services.time.sleep', side_effect=release_finishes) as sleep:
+            second = ingest_receipt(BytesIO(b"racing"), 'r.pdf', 'emp2')
+        self.assertEqual(sleep.call_count, 1)
+        self.assertFalse(second['deduplicated'])
+        self.assertTrue(os.path.exists(self._stored_path(first['key'])))
+        self.assertEqual(get_receipt_reference_count(first['key']), 1)
+
+    def test_stale_release_does_not_block_ingest(self):
+        key = hashlib.sha256(b"orphan").hexdigest() + '.pdf'
+        get_db().receipt_blobs.insert_one({'_id': key, 'refcount': 0, 'deleting': True,
+                                           'deleting_at': datetime.utcnow() - timedelta(hours=1)})
+        with patch('app.storage_services.time.sleep'):
+            stored = ingest_receipt(BytesIO(b"orphan"), 'r.pdf', 'emp1')
+        self.assertEqual(stored['key'], key)
+        self.assertEqual(get_receipt_reference_count(key), 1)
+        self.assertTrue(os.path.exists(self._stored_path(key)))
+
+    def test_last_release_removes_blob_document(self):
+        stored = ingest_receipt(BytesIO(b"gone"), 'r.pdf', 'emp1')
+        self.assertTrue(delete_file_from_cloud(stored['cloud_path']))
+        self.assertIsNone(get_db().receipt_blobs.find_one({'_id': stored['key']}))
+
+    def _expense_with_receipt(self, stored, user_id='emp1'):
+        expense = Expense(user_id=user_id, amount=1, currency='USD', date_str='2024-02-02', vendor='Receipt',
+                          description='', receipt_cloud_path=stored['cloud_path'], receipt_key=stored['key'])
+        expense.save()
+        return expense
+
+    def test_receipt_served_privately_to_its_owner(self):
+        stored = ingest_receipt(BytesIO(b"%PDF receipt"), 'r.pdf', 'emp1')
+        self._expense_with_receipt(stored)
+        token = self.login_as('emp1', 'emp1pass')
+        response = self.client.get(f"/receipts/{stored['key']}", headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b"%PDF receipt")
+        cache_control = response.headers['Cache-Control']
+        self.assertIn('private', cache_control)
+        self.assertNotIn('public', cache_control)
+        self.assertIn('immutable', cache_control)
+        self.assertIn('max-age=31536000', cache_control)
+        response.close()
+
+    def test_receipt_requires_owner_or_admin(self):
+        stored = ingest_receipt(BytesIO(b"someone else's receipt"), 'r.pdf', 'emp2')
+        self._expense_with_receipt(stored, user_id='emp2')
+        self.assertEqual(self.client.get(f"/receipts/{stored['key']}").status_code, 401)
+        emp_token = self.login_as('emp1', 'emp1pass')
+        response = self.client.get(f"/receipts/{stored['key']}", headers={'Authorization': f'Bearer {emp_token}'})
+        self.assertEqual(response.status_code, 404)
+        admin_token = self.login_as('admin1', 'admin1pass')
+        response = self.client.get(f"/receipts/{stored['key']}", headers={'Authorization': f'Bearer {admin_token}'})
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_unreferenced_legacy_file_not_served(self):
+        # Old flat uploads are only reachable through an expense that references them
+        root = os.path.join(self.app.config['UPLOAD_FOLDER'], SIMULATED_CLOUD_FOLDER)
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(root, 'receipt.pdf'), 'wb') as f:
+            f.write(b"guessable")
+        admin_token = self.login_as('admin1', 'admin1pass')
+        response = self.client.get("/receipts/receipt.pdf", headers={'Authorization': f'Bearer {admin_token}'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_expense_stores_content_key(self):
+        token = self.login_as('emp1', 'emp1pass')
+        data = {'amount': '9.99', 'date': '2024-02-02', 'vendor': 'Keyed',
+                'receipt': (BytesIO(b"keyed receipt"), 'keyed.png')}
+        response = self.client.post('/expenses', headers={'Authorization': f'Bearer {token}'},
+                                    data=data, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 201)
+        expense = Expense.get_by_id(response.get_json()['expense']['id'])
+        self.assertEqual(expense.receipt_key, hashlib.sha256(b"keyed receipt").hexdigest() + '.png')
+
+
+class TestStorageBackends(BaseTestCase):
+    def test_migrate_storage_moves_flat_files_into_shards(self):
+        root = os.path.join(self.app.config['UPLOAD_FOLDER'], SIMULATED_CLOUD_FOLDER)
+        os.makedirs(root)
+        key = hashlib.sha256(b"old").hexdigest() + '.pdf'
+        for name in (key, 'receipt.pdf'):
+            with open(os.path.join(root, name), 'wb') as f:
+                f.write(b"old")
+
+        # Before migration, flat files are still found
+        self.assertEqual(get_local_path_for_cloud(f'{SIMULATED_CLOUD_FOLDER}/{key}'), os.path.join(root, key))
+
+        result = self.app.test_cli_runner().invoke(args=['migrate-storage'])
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assertIn('Moved 2 file(s)', result.output)
+        self.assertTrue(os.path.exists(os.path.join(root, key[:2], key[2:4], key)))
+        self.assertFalse(os.path.exists(os.path.join(root, key)))
+        backend = LocalShardedBackend(root)
+        self.assertTrue(backend.exists('receipt.pdf'))
+        self.assertNotEqual(backend.local_path('receipt.pdf'), os.path.join(root, 'receipt.pdf'))
+
+        # Re-running is a no-op
+        result = self.app.test_cli_runner().invoke(args=['migrate-storage'])
+        self.assertIn('Moved 0 file(s)', result.output)
+
+    def test_s3_backend_against_stand_in(self):
+        fake = FakeS3Client()
+        self.app.extensions['storage_backend'] = S3Backend(fake, 'receipts-bucket', prefix='receipts/')
+
+        first = ingest_receipt(BytesIO(b"s3 receipt"), 'r.png', 'emp1')
+        second = ingest_receipt(BytesIO(b"s3 receipt"), 'r.png', 'emp2')
+        self.assertTrue(second['deduplicated'])
+        self.assertEqual(list(fake.objects), [('receipts-bucket', f"receipts/{first['key']}")])
+        self.assertIsNone(get_local_path_for_cloud(first['cloud_path']))
+
+        Expense(user_id='emp1', amount=1, currency='USD', date_str='2024-02-02', vendor='S3', description='',
+                receipt_cloud_path=first['cloud_path'], receipt_key=first['key']).save()
+        headers = {'Authorization': f"Bearer {self.login_as('emp1', 'emp1pass')}"}
+        response = self.client.get(f"/receipts/{first['key']}", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b"s3 receipt")
+        response.close()
+
+        delete_file_from_cloud(first['cloud_path'])
+        self.assertTrue(fake.objects)
+        delete_file_from_cloud(first['cloud_path'])
+        self.assertFalse(fake.objects)
+        self.assertEqual(self.client.get(f"/receipts/{first['key']}", headers=headers).status_code, 404)
+
+    def test_unknown_backend_rejected(self):
+        with self.assertRaises(ValueError):
+            create_storage_backend({'STORAGE_BACKEND': 'ftp'}, '/tmp')
+
+
+if __name__ == '__main__':
+    unittest.main()
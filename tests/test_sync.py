@@ -0,0 +1,146 @@
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import mongomock
+from bson.objectid import ObjectId
+
+from tests.base import BaseTestCase
+from app.database import get_db
+from app.indexes import ensure_indexes
+from app.models import Employee, Expense
+from app.sync_services import encode_sync_token
+
+
+class TestDeltaSync(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # No overlap window, so each sync returns exactly what changed since the last one
+        self.app.config['SYNC_OVERLAP_SECONDS'] = 0
+        self.emp_token = self.login_as('emp1', 'emp1pass')
+        self.admin_token = self.login_as('admin1', 'admin1pass')
+
+    def _expense(self, user_id='emp1', vendor='Acme', amount=10):
+        time.sleep(0.002) # Keep updated_at stamps in distinct milliseconds
+        expense = Expense(user_id=user_id, amount=amount, currency='USD', date_str='2024-03-01',
+                          vendor=vendor, description='', receipt_cloud_path=None)
+        expense.save()
+        return expense
+
+    def _sync(self, since=None, limit=None, token=None, status=200):
+        params = {}
+        if since:
+            params['since'] = since
+        if limit:
+            params['limit'] = limit
+        response = self.client.get('/expenses/changes', query_string=params,
+                                   headers={'Authorization': f'Bearer {token or self.emp_token}'})
+        self.assertEqual(response.status_code, status, msg=response.get_data(as_text=True))
+        return response.get_json()
+
+    def test_full_then_incremental_sync(self):
+        first = self._expense(vendor='First')
+        self._expense(user_id='emp2', vendor='Other user')
+        full = self._sync()
+        self.assertEqual([c['vendor'] for c in full['changes']], ['First'])
+        self.assertEqual(full['deleted'], [])
+        self.assertFalse(full['has_more'])
+        self.assertIsNotNone(full['changes'][0]['updated_at'])
+
+        self.assertEqual(self._sync(full['next_since'])['changes'], [])
+
+        time.sleep(0.002)
+        first.vendor = 'First renamed'
+        first.save()
+        self._expense(vendor='Second')
+        delta = self._sync(full['next_since'])
+        self.assertEqual([c['vendor'] for c in delta['changes']], ['First renamed', 'Second'])
+
+    def test_pagination(self):
+        for i in range(5):
+            self._expense(vendor=f"Vendor {i}")
+        seen = []
+        since = None
+        while True:
+            page = self._sync(since, limit=2)
+            seen.extend(c['vendor'] for c in page['changes'])
+            since = page['next_since']
+            if not page['has_more']:
+                break
+        self.assertEqual(seen, [f"Vendor {i}" for i in range(5)])
+
+    def test_deletes_are_reported(self):
+        expense = self._expense()
+        token = self._sync()['next_since']
+        time.sleep(0.002)
+        response = self.client.delete(f'/expenses/{expense._id}', headers={'Authorization': f'Bearer {self.emp_token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(Expense.get_by_id(str(expense._id)))
+
+        delta = self._sync(token)
+        self.assertEqual(delta['changes'], [])
+        self.assertEqual(delta['deleted'], [str(expense._id)])
+        # A full sync does not list deletions: the client starts from nothing
+        self.assertEqual(self._sync()['deleted'], [])
+
+    def test_delete_permissions(self):
+        expense = self._expense()
+        Employee(username='emp2', password='emp2pass').save()
+        other = self.login_as('emp2', 'emp2pass')
+        response = self.client.delete(f'/expenses/{expense._id}', headers={'Authorization': f'Bearer {other}'})
+        self.assertEqual(response.status_code, 404)
+        Expense.update_status(str(expense._id), 'approved')
+        response = self.client.delete(f'/expenses/{expense._id}', headers={'Authorization': f'Bearer {self.emp_token}'})
+        self.assertEqual(response.status_code, 409)
+        response = self.client.delete(f'/expenses/{expense._id}', headers={'Authorization': f'Bearer {self.admin_token}'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_status_and_ocr_changes_are_synced(self):
+        a = self._expense(vendor='A')
+        b = self._expense(vendor='B')
+        token = self._sync()['next_since']
+
+        time.sleep(0.002)
+        Expense.update_status(str(a._id), 'approved')
+        delta = self._sync(token)
+        self.assertEqual([(c['vendor'], c['status']) for c in delta['changes']], [('A', 'approved')])
+
+        time.sleep(0.002)
+        Expense.update_status_many([str(a._id), str(b._id)], 'rejected')
+        self.assertEqual(len(self._sync(delta['next_since'])['changes']), 2)
+
+        token = self._sync()['next_since']
+        time.sleep(0.002)
+        Expense.set_ocr_result(str(b._id), 'completed', {'total': 10})
+        self.assertEqual([c['vendor'] for c in self._sync(token)['changes']], ['B'])
+
+    def test_invalid_and_expired_tokens(self):
+        self._sync('not-a-token', status=400)
+        old = encode_sync_token(datetime.utcnow() - timedelta(days=365), ObjectId())
+        self.assertIn('full sync', self._sync(old, status=410)['error'])
+
+    def test_overlap_window_repeats_recent_changes(self):
+        self.app.config['SYNC_OVERLAP_SECONDS'] = 60
+        self._expense(vendor='Recent')
+        token = self._sync()['next_since']
+        # Still inside the overlap window, so it is returned again (clients upsert by id)
+        self.assertEqual([c['vendor'] for c in self._sync(token)['changes']], ['Recent'])
+
+    def test_backfill_updated_at(self):
+        expense = self._expense()
+        get_db().expenses.update_one({'_id': expense._id}, {'$unset': {'updated_at': ''}})
+        self.assertEqual(self._sync()['changes'], [])
+        result = self.app.test_cli_runner().invoke(args=['backfill-updated-at'])
+        self.assertIn('Stamped 1 expense(s)', result.output)
+        self.assertEqual(len(self._sync()['changes']), 1)
+
+    def test_sync_hints_its_index_only_once_it_exists(self):
+        self._expense()
+        with patch.object(mongomock.collection.Cursor, 'hint', autospec=True,
+                          side_effect=lambda cursor, index: cursor) as hint:
+            self.assertEqual(len(self._sync()['changes']), 1)
+            hint.assert_not_called()
+            ensure_indexes(get_db())
+            self.app.extensions.pop('index_hints', None) # Forget the remembered miss
+            self.assertEqual(len(self._sync()['changes']), 1)
+        self.assertEqual({call.args[1] for call in hint.call_args_list}, {'user_id_1_updated_at_1__id_1'})